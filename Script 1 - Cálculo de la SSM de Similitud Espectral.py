@@ -4,34 +4,87 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 
+from herramientas.instrumentacion import activar, contar_bytes, etapa, exportar
+from herramientas.matriz_similitud import agrupar_frames, normalizar_columnas, piramide_imagen, ssm_por_bloques
+
+# Parámetros
+agrupar_cada = 1                 # Media de cada N frames antes de calcular la SSM (1 = resolución completa)
+sincronizar_con_beats = False    # Si es True, un vector por beat (media de sus frames) en lugar de agrupar_cada
+guardar_matriz = False           # True: escribe además la SSM completa en disco (.npy mapeado en memoria, n² valores)
+guardar_en_float16 = True        # float16 ocupa la mitad en disco (precisión de ~1e-3, suficiente para [0, 1])
+tamano_bloque = 2048             # Frames por lado de cada tile calculado con BLAS
+lado_max_imagen = 2048           # Resolución máxima de la imagen (la SSM se diezma por medias)
+niveles_piramide = 4             # Niveles de la pirámide de imágenes guardada (cada uno a la mitad)
+instrumentar = False             # Tiempo por etapa y picos de memoria en instrumentacion.json (y traza para chrome://tracing)
+instrumentar_memoria_python = False  # Además, pico de memoria reservada desde Python (tracemalloc; ralentiza la ejecución)
+
 # 1. Ruta al escritorio y al archivo de audio
 escritorio = os.path.join(os.path.expanduser('~'), 'Desktop')
 ruta_audio = os.path.join(escritorio, 'sonido1sonido2.wav')
+ruta_matriz = os.path.join(escritorio, 'matriz_similitud.npy')
+ruta_piramide = os.path.join(escritorio, 'matriz_similitud_piramide.npz')
+
+if instrumentar:
+    activar(instrumentar_memoria_python)
 
 # 2. Cargar el audio
-audio, sr = librosa.load(ruta_audio)
+with etapa("carga"):
+    audio, sr = librosa.load(ruta_audio)
 
 # 3. Espectrograma de magnitud (STFT)
-S = np.abs(librosa.stft(audio, n_fft=2048, hop_length=512))
+with etapa("stft"):
+    S = np.abs(librosa.stft(audio, n_fft=2048, hop_length=512))
+
+# 3b. Reducción opcional de la resolución temporal
+if sincronizar_con_beats:
+    _, beats = librosa.beat.beat_track(y=audio, sr=sr, hop_length=512)
+    S = librosa.util.sync(S, beats, aggregate=np.mean)
+    eje = 'Beat'
+else:
+    S = agrupar_frames(S, agrupar_cada)
+    eje = 'Frame' if agrupar_cada <= 1 else f'Grupo de {agrupar_cada} frames'
 
 # 4. Normalización de los espectros
-S_normalized = S / np.linalg.norm(S, axis=0, keepdims=True)
+S_normalized = normalizar_columnas(S)
 
-# 5. Cálculo de la matriz de autosimilitud (similitud espectral)
-matriz_similitud = np.dot(S_normalized.T, S_normalized)
+# 5. Cálculo de la matriz de autosimilitud por tiles (la matriz completa solo
+# existe en disco; en memoria se acumula la imagen diezmada)
+with etapa("ssm por bloques"):
+    imagen, factor, matriz_similitud = ssm_por_bloques(
+        S_normalized,
+        ruta_memmap=ruta_matriz if guardar_matriz else None,
+        tamano_bloque=tamano_bloque,
+        dtype=np.float16 if guardar_en_float16 else np.float32,
+        lado_imagen=lado_max_imagen,
+    )
+n = S_normalized.shape[1]
+with etapa("pirámide"):
+    piramide = piramide_imagen(imagen, niveles_piramide)
+    np.savez(ruta_piramide, *piramide)
+contar_bytes(ruta_piramide)
+if matriz_similitud is not None:
+    contar_bytes(ruta_matriz)
 
 # 6. Visualización y guardado con colormap tipo 'inferno' (cálido, similar a iAnalyse5)
 plt.figure(figsize=(10, 8))
-plt.imshow(matriz_similitud, origin='lower', aspect='auto', cmap='inferno')
+plt.imshow(imagen, origin='lower', aspect='auto', cmap='inferno', extent=(0, n, 0, n), interpolation='nearest')
 plt.colorbar(label='Similitud espectral (producto escalar)')
-plt.title('Matriz de autosimilitud espectral')
-plt.xlabel('Frame')
-plt.ylabel('Frame')
+titulo = 'Matriz de autosimilitud espectral'
+if factor > 1:
+    titulo += f' (media de bloques de {factor}x{factor})'
+plt.title(titulo)
+plt.xlabel(eje)
+plt.ylabel(eje)
 plt.tight_layout()
 
 # 7. Guardar la imagen en el escritorio
 ruta_imagen = os.path.join(escritorio, 'matriz_similitud_iAnalyse5.png')
-plt.savefig(ruta_imagen, dpi=300)
+with etapa("imagen"):
+    plt.savefig(ruta_imagen, dpi=300)
 plt.close()
+contar_bytes(ruta_imagen)
 
-print(f'Imagen guardada en: {ruta_imagen}’)
+print(f'Imagen guardada en: {ruta_imagen}')
+if matriz_similitud is not None:
+    print(f'Matriz de {n}x{n} guardada en: {ruta_matriz}')
+exportar(escritorio)
@@ -1,64 +1,50 @@
 import os
-import librosa
-import soundfile as sf
-import numpy as np
-from scipy.signal import convolve
+
+from herramientas.biblioteca_ir import BibliotecaIR
+from herramientas.convolucion import aplicar_reverb_archivo
+from herramientas.instrumentacion import Progreso, activar, contar_bytes, etapa, exportar
 
 # -------------------- CONFIGURACIÓN --------------------
 sample_rate = 44100  # Frecuencia de muestreo
 tipo_reverb = 'plate'  # 'spring' o 'plate'
 decay = 0.5  # Duración del decay (segundos)
 reverb_mix = 0.1  # Mezcla entre seco y reverberado (0.0 a 1.0)
+tamano_bloque = 16384  # Muestras por bloque de la convolución (latencia y memoria por bloque)
+semilla = 0  # Semilla de la IR sintética (misma semilla = misma IR en todas las ejecuciones)
+carpeta_biblioteca_ir = os.path.expanduser("~/Desktop/IRs/biblioteca")  # IRs ya particionadas (.npy)
+instrumentar = False  # Tiempo, bytes escritos y picos de memoria en instrumentacion.json (y traza para chrome://tracing)
+instrumentar_memoria_python = False  # Además, pico de memoria reservada desde Python (tracemalloc; ralentiza la ejecución)
 
 
 # --------------------------------------------------------
 
-def generar_impulso_spring(sr, decay):
-    t = np.linspace(0, decay, int(sr * decay))
-    impulso = np.sin(2 * np.pi * 50 * t) * np.exp(-3 * t)  # 50 Hz base
-    impulso += np.sin(2 * np.pi * 120 * t) * np.exp(-4 * t)  # Harmònica
-    impulso += np.random.normal(0, 0.05, len(t))  # soroll suau
-    return impulso / np.max(np.abs(impulso))
-
-
-def generar_impulso_plate(sr, decay):
-    longitud = int(decay * sr)
-    impulso = np.random.randn(longitud)
-    impulso *= np.exp(-np.linspace(0, decay, longitud))  # Decaïment exponencial
-    impulso = np.convolve(impulso, np.ones(50) / 50, mode='same')  # Suavitza (filtre)
-    return impulso / np.max(np.abs(impulso))
-
-
-def aplicar_reverb(audio, sr, tipo, decay, mix):
-    if tipo == 'spring':
-        impulso = generar_impulso_spring(sr, decay)
-    elif tipo == 'plate':
-        impulso = generar_impulso_plate(sr, decay)
-    else:
-        raise ValueError("Tipo de reverb no válido. Usa 'spring' o 'plate'.")
-
-    reverberado = convolve(audio, impulso, mode='full')[:len(audio)]
-    salida = (1 - mix) * audio + mix * reverberado
-    return salida / np.max(np.abs(salida))
-
-
 # Rutas
 carpeta_entrada = os.path.expanduser("~/Desktop/Entrada_Reverb")
 nombre_salida = f"Salida_Reverb_{tipo_reverb}_{int(decay * 1000)}ms_mix{int(reverb_mix * 100)}"
 carpeta_salida = os.path.expanduser(f"~/Desktop/{nombre_salida}")
 os.makedirs(carpeta_salida, exist_ok=True)
 
-# Procesamiento
-for archivo in os.listdir(carpeta_entrada):
-    if archivo.lower().endswith('.wav'):
-        ruta_entrada = os.path.join(carpeta_entrada, archivo)
-        audio, sr = librosa.load(ruta_entrada, sr=sample_rate)
-        audio_reverberado = aplicar_reverb(audio, sr, tipo_reverb, decay, reverb_mix)
+if instrumentar:
+    activar(instrumentar_memoria_python)
 
-        nombre_archivo_salida = f"{os.path.splitext(archivo)[0]}_{tipo_reverb}_Reverb.wav"
-        ruta_salida = os.path.join(carpeta_salida, nombre_archivo_salida)
+# IR sintética particionada en frecuencia: se calcula una vez y se reutiliza desde disco
+with etapa("IR"):
+    particiones = BibliotecaIR(carpeta_biblioteca_ir).sintetica(tipo_reverb, sample_rate, decay, tamano_bloque, semilla=semilla)
 
-        sf.write(ruta_salida, audio_reverberado, sr)
-        print(f"Guardado: {ruta_salida}")
+# Procesamiento
+archivos = [archivo for archivo in os.listdir(carpeta_entrada) if archivo.lower().endswith('.wav')]
+progreso = Progreso("archivos", len(archivos))
+for archivo in archivos:
+    ruta_entrada = os.path.join(carpeta_entrada, archivo)
+    nombre_archivo_salida = f"{os.path.splitext(archivo)[0]}_{tipo_reverb}_Reverb.wav"
+    ruta_salida = os.path.join(carpeta_salida, nombre_archivo_salida)
+
+    # Convolución particionada por bloques: mezcla seco/húmedo y normalización sin cargar el archivo entero
+    with etapa("reverb", archivo=archivo):
+        aplicar_reverb_archivo(ruta_entrada, ruta_salida, particiones, tamano_bloque, reverb_mix, sample_rate)
+    print(f"Guardado: {ruta_salida}")
+    contar_bytes(ruta_salida)
+    progreso.avanzar()
 
 print("\n✅ Proceso de reverb completado.")
+exportar(carpeta_salida)
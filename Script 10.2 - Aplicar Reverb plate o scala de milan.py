@@ -1,54 +1,47 @@
 import os
-import librosa
-import soundfile as sf
-import numpy as np
-from scipy.signal import butter, lfilter, fftconvolve
+
+from herramientas.biblioteca_ir import BibliotecaIR
+from herramientas.convolucion import aplicar_reverb_archivo
+from herramientas.instrumentacion import Progreso, activar, contar_bytes, etapa, exportar
 
 # -------------------- CONFIGURACIÓN --------------------
 sample_rate = 44100                               # Frecuencia de muestreo
 ruta_ir = os.path.expanduser("~/Desktop/IRs/plate_reverb.wav")  # Ruta al archivo IR
 reverb_mix = 0.3                                  # Mezcla entre seco y reverberado (0.0 a 1.0)
 corte_hpf_hz = 200                                # Filtro pasa-altos aplicado a la IR y al resultado
+tamano_bloque = 16384                             # Muestras por bloque de la convolución (latencia y memoria por bloque)
+carpeta_biblioteca_ir = os.path.expanduser("~/Desktop/IRs/biblioteca")  # IRs ya particionadas (.npy)
+instrumentar = False                              # Tiempo, bytes escritos y picos de memoria en instrumentacion.json (y traza para chrome://tracing)
+instrumentar_memoria_python = False               # Además, pico de memoria reservada desde Python (tracemalloc; ralentiza la ejecución)
 # --------------------------------------------------------
 
-def filtro_pasaaltos(audio, sr, freq_corte):
-    nyquist = 0.5 * sr
-    normal_corte = freq_corte / nyquist
-    b, a = butter(2, normal_corte, btype='high')
-    return lfilter(b, a, audio)
-
-def cargar_ir(ruta_ir, sr_objetivo, freq_corte):
-    ir, sr_ir = librosa.load(ruta_ir, sr=None)
-    if sr_ir != sr_objetivo:
-        ir = librosa.resample(ir, orig_sr=sr_ir, target_sr=sr_objetivo)
-    ir = filtro_pasaaltos(ir, sr_objetivo, freq_corte)  # Elimina graves de la IR
-    return ir / np.max(np.abs(ir))  # Normaliza
-
-def aplicar_convolucion_reverb(audio, ir, mix, sr, freq_corte):
-    reverberado = fftconvolve(audio, ir, mode='full')[:len(audio)]
-    reverberado = filtro_pasaaltos(reverberado, sr, freq_corte)  # Elimina graves de la reverb
-    salida = (1 - mix) * audio + mix * reverberado
-    return salida / np.max(np.abs(salida))  # Normaliza la mezcla final
 # Rutas
 carpeta_entrada = os.path.expanduser("~/Desktop/Entrada_Reverb")
 nombre_salida = f"Salida_ReverbLimpia_mix{int(reverb_mix*100)}"
 carpeta_salida = os.path.expanduser(f"~/Desktop/{nombre_salida}")
 os.makedirs(carpeta_salida, exist_ok=True)
 
-# Cargar IR
-ir = cargar_ir(ruta_ir, sample_rate, corte_hpf_hz)
-
-# Procesamiento
-for archivo in os.listdir(carpeta_entrada):
-    if archivo.lower().endswith('.wav'):
-        ruta_entrada = os.path.join(carpeta_entrada, archivo)
-        audio, sr = librosa.load(ruta_entrada, sr=sample_rate)
-        audio_reverberado = aplicar_convolucion_reverb(audio, ir, reverb_mix, sr, corte_hpf_hz)
+if instrumentar:
+    activar(instrumentar_memoria_python)
 
-        nombre_archivo_salida = f"{os.path.splitext(archivo)[0]}_ReverbLimpia.wav"
-        ruta_salida = os.path.join(carpeta_salida, nombre_archivo_salida)
+# Cargar IR (remuestreada, filtrada y particionada solo la primera vez; después desde la biblioteca)
+with etapa("IR"):
+    particiones = BibliotecaIR(carpeta_biblioteca_ir).desde_archivo(ruta_ir, sample_rate, tamano_bloque, corte_hpf=corte_hpf_hz)
 
-        sf.write(ruta_salida, audio_reverberado, sr)
-        print(f"Guardado: {ruta_salida}")
+# Procesamiento
+archivos = [archivo for archivo in os.listdir(carpeta_entrada) if archivo.lower().endswith('.wav')]
+progreso = Progreso("archivos", len(archivos))
+for archivo in archivos:
+    ruta_entrada = os.path.join(carpeta_entrada, archivo)
+    nombre_archivo_salida = f"{os.path.splitext(archivo)[0]}_ReverbLimpia.wav"
+    ruta_salida = os.path.join(carpeta_salida, nombre_archivo_salida)
+
+    # Convolución particionada, pasa-altos de la reverb y mezcla en el mismo recorrido por bloques
+    with etapa("reverb", archivo=archivo):
+        aplicar_reverb_archivo(ruta_entrada, ruta_salida, particiones, tamano_bloque, reverb_mix, sample_rate, corte_hpf=corte_hpf_hz)
+    print(f"Guardado: {ruta_salida}")
+    contar_bytes(ruta_salida)
+    progreso.avanzar()
 
 print("\n✅ Proceso completado con reverb limpia.")
+exportar(carpeta_salida)
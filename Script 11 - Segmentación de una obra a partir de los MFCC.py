@@ -1,121 +1,73 @@
 import librosa
 import soundfile as sf
-import numpy as np
 import os
 import csv
 
+from herramientas.descriptores import calcular_descriptores
+from herramientas.instrumentacion import activar, contar, contar_bytes, etapa, exportar
+from herramientas.segmentacion import agrupar_por_timbre, fusionar_secciones_cortas, sumas_acumuladas
+
 # === CONFIGURACIÓN ===
 input_path = os.path.expanduser("~/Desktop/reveries.wav")
 output_dir = os.path.expanduser("~/Desktop/secciones_agrupadas")
 DURACION_MINIMA_SEGUNDOS = 15.0  # ⬅️ Fácil de modificar
 mfcc_distance_threshold = 30.0
+hop_length = 512
+instrumentar = False  # Tiempo por etapa, contadores y picos de memoria en instrumentacion.json (y traza para chrome://tracing)
+instrumentar_memoria_python = False  # Además, pico de memoria reservada desde Python (tracemalloc; ralentiza la ejecución)
 
 os.makedirs(output_dir, exist_ok=True)
-y, sr = librosa.load(input_path, sr=None)
-
-onset_frames = librosa.onset.onset_detect(y=y, sr=sr, backtrack=True)
-onset_times = librosa.frames_to_time(onset_frames, sr=sr)
-
-def get_mfcc_mean(audio):
-    mfcc = librosa.feature.mfcc(y=audio, sr=sr, n_mfcc=13)
-    return np.mean(mfcc, axis=1)
-
-# Agrupación inicial por timbre
-sections = []
-start_idx = 0
-prev_mfcc = None
+if instrumentar:
+    activar(instrumentar_memoria_python)
+with etapa("carga"):
+    y, sr = librosa.load(input_path, sr=None)
 
-for i in range(1, len(onset_times)):
-    start_sample = int(onset_times[start_idx] * sr)
-    end_sample = int(onset_times[i] * sr)
-    segment = y[start_sample:end_sample]
-    if len(segment) < 2048:
-        continue
-    mfcc_mean = get_mfcc_mean(segment)
-    if prev_mfcc is None:
-        prev_mfcc = mfcc_mean
-        continue
-    distance = np.linalg.norm(mfcc_mean - prev_mfcc)
-    if distance > mfcc_distance_threshold:
-        section_audio = y[int(onset_times[start_idx] * sr):int(onset_times[i - 1] * sr)]
-        sections.append((onset_times[start_idx], onset_times[i - 1], section_audio))
-        start_idx = i - 1
-        prev_mfcc = mfcc_mean
+# MFCC de toda la obra una sola vez; la media de cualquier tramo sale de sus sumas acumuladas
+with etapa("mfcc"):
+    mfcc_obra = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13, hop_length=hop_length)
+    acumuladas = sumas_acumuladas(mfcc_obra)
 
-if start_idx < len(onset_times) - 1:
-    section_audio = y[int(onset_times[start_idx] * sr):int(onset_times[-1] * sr)]
-    sections.append((onset_times[start_idx], onset_times[-1], section_audio))
+with etapa("onsets"):
+    onset_frames = librosa.onset.onset_detect(y=y, sr=sr, hop_length=hop_length, backtrack=True)
+    onsets = librosa.frames_to_samples(onset_frames, hop_length=hop_length)
+contar("onsets detectados", len(onsets))
 
-# Fusión de secciones cortas
-def fusionar_secciones(sections):
-    i = 0
-    resultado = []
-    while i < len(sections):
-        start, end, audio = sections[i]
-        duracion = end - start
-        if duracion >= DURACION_MINIMA_SEGUNDOS:
-            resultado.append((start, end, audio))
-            i += 1
-        else:
-            mfcc = get_mfcc_mean(audio)
-            if i == 0:
-                next_start, next_end, next_audio = sections[i + 1]
-                fused_audio = np.concatenate((audio, next_audio))
-                resultado.append((start, next_end, fused_audio))
-                i += 2
-            elif i == len(sections) - 1:
-                prev_start, prev_end, prev_audio = resultado[-1]
-                fused_audio = np.concatenate((prev_audio, audio))
-                resultado[-1] = (prev_start, end, fused_audio)
-                i += 1
-            else:
-                prev_start, prev_end, prev_audio = resultado[-1]
-                next_start, next_end, next_audio = sections[i + 1]
-                dist_prev = np.linalg.norm(mfcc - get_mfcc_mean(prev_audio))
-                dist_next = np.linalg.norm(mfcc - get_mfcc_mean(next_audio))
-                if dist_prev <= dist_next:
-                    fused_audio = np.concatenate((prev_audio, audio))
-                    resultado[-1] = (prev_start, end, fused_audio)
-                    i += 1
-                else:
-                    fused_audio = np.concatenate((audio, next_audio))
-                    resultado.append((start, next_end, fused_audio))
-                    i += 2
-    return resultado
+with etapa("segmentación"):
+    # Agrupación inicial por timbre (secciones como (inicio, fin) en muestras)
+    sections = agrupar_por_timbre(onsets, acumuladas, hop_length, mfcc_distance_threshold)
 
-# Aplicar fusión hasta que todas las secciones cumplan la duración mínima
-merged = sections
-while True:
-    merged = fusionar_secciones(merged)
-    cortas = [end - start for start, end, _ in merged if end - start < DURACION_MINIMA_SEGUNDOS]
-    if not cortas:
-        break
+    # Fusión de secciones cortas hasta que todas cumplan la duración mínima
+    merged = fusionar_secciones_cortas(sections, acumuladas, hop_length, int(DURACION_MINIMA_SEGUNDOS * sr))
+contar("secciones", len(merged))
 
 # Guardar audios y CSV
 descriptores = []
-for idx, (start_time, end_time, audio_seg) in enumerate(merged):
+for idx, (start_sample, end_sample) in enumerate(merged):
+    start_time = start_sample / sr
+    end_time = end_sample / sr
+    audio_seg = y[start_sample:end_sample]
     filename = f"seccion_{idx+1:03d}.wav"
     file_path = os.path.join(output_dir, filename)
-    sf.write(file_path, audio_seg, sr)
+    with etapa("escritura"):
+        sf.write(file_path, audio_seg, sr)
+    contar_bytes(file_path)
 
-    mfcc = librosa.feature.mfcc(y=audio_seg, sr=sr, n_mfcc=13)
-    centroid = librosa.feature.spectral_centroid(y=audio_seg, sr=sr)
-    flatness = librosa.feature.spectral_flatness(y=audio_seg)
-    rms = librosa.feature.rms(y=audio_seg)
-    zero_crossings = librosa.feature.zero_crossing_rate(y=audio_seg)
+    # MFCC y descriptores de la sección a partir de una sola STFT
+    with etapa("descriptores", seccion=filename):
+        medias = calcular_descriptores(audio_seg, sr, n_mfcc=13)
 
     descriptores.append({
         "archivo": filename,
         "inicio (min:seg)": f"{int(start_time // 60)}:{int(start_time % 60):02d}",
         "final (min:seg)": f"{int(end_time // 60)}:{int(end_time % 60):02d}",
         "duración (s)": round(end_time - start_time, 2),
-        "mfcc_mean_0": np.mean(mfcc[0]),
-        "mfcc_mean_1": np.mean(mfcc[1]),
-        "mfcc_mean_2": np.mean(mfcc[2]),
-        "centroid_mean": np.mean(centroid),
-        "flatness_mean": np.mean(flatness),
-        "rms_mean": np.mean(rms),
-        "zero_cross_rate": np.mean(zero_crossings)
+        "mfcc_mean_0": medias["mfcc"][0],
+        "mfcc_mean_1": medias["mfcc"][1],
+        "mfcc_mean_2": medias["mfcc"][2],
+        "centroid_mean": medias["centroid"],
+        "flatness_mean": medias["flatness"],
+        "rms_mean": medias["rms"],
+        "zero_cross_rate": medias["zcr"]
     })
 
 csv_path = os.path.join(output_dir, "descriptores_agrupados.csv")
@@ -127,3 +79,4 @@ with open(csv_path, mode='w', newline='') as f:
 
 print(f"✅ Secciones guardadas en: {output_dir}")
 print(f"✅ CSV generado en: {csv_path}")
+exportar(output_dir)
@@ -4,18 +4,61 @@ import soundfile as sf
 import numpy as np
 import matplotlib.pyplot as plt
 import csv
+import heapq
 import time
 import re
 import shutil
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from scipy.spatial.distance import cosine, euclidean
-from fastdtw import fastdtw
+from scipy.spatial.distance import cosine
 import pandas as pd
+from herramientas.busqueda_coseno import mejores_coincidencias, perfil_coseno_aplanado, perfiles_coseno_aplanado, preparar_obra_coseno
+from herramientas.busqueda_dtw import PodaDTW, buscar_dtw_ventanas, dtw_distancia, dtw_subsecuencia
+from herramientas.busqueda_piramide import buscar_piramide, piramide_frames
+from herramientas.descriptores import (acumular_descriptores, calcular_descriptores, descriptores_por_bloques,
+                                       descriptores_por_frames, descriptores_tramo, medias_descriptores)
+from herramientas.extraccion_mfcc import AudioEnDisco, mfcc_por_bloques
+from herramientas.huellas import IndiceHuellas
+from herramientas.indice_ann import IndiceIVF
+from herramientas.instrumentacion import Progreso, activar, contar, contar_bytes, etapa, exportar, medida
+from herramientas.memoria_compartida import adjuntar, liberar, limitar_hilos_blas, publicar
 
 # === CONFIGURACIÓN ===
-paso_frames_cos = 20   # Paso para la búsqueda por coseno (aprox 50ms)
+busqueda_cos_exacta = True   # True: perfil de distancias por FFT con paso de 1 frame
+paso_frames_cos = 20   # Paso para la búsqueda por coseno (aprox 50ms) si busqueda_cos_exacta = False
+modo_dtw = 'subsecuencia'   # 'subsecuencia' (una pasada sobre toda la obra) o 'ventanas'
 paso_frames_dtw_gros = 40   # Paso para la búsqueda inicial DTW (aprox 100ms)
 paso_frames_dtw_fi = 4      # Paso de refinamiento DTW (aprox 10ms)
+radio_banda_dtw = None      # Radio de la banda de Sakoe-Chiba en frames (None = DTW sin banda)
+n_coincidencias = 1         # Coincidencias por muestra y obra que no se solapan, una fila del CSV por cada una
+                            # (None: todas las que bajan del umbral). En modo_dtw = 'ventanas' el DTW da solo la mejor
+umbral_coseno = None        # Distancia coseno máxima de las coincidencias (None: sin umbral)
+umbral_dtw = None           # Coste DTW máximo de las coincidencias (None: sin umbral)
+busqueda_piramide = False   # True: el coseno sin perfil exacto y el DTW por 'ventanas' buscan de grueso a fino en una
+                            # pirámide de medias de 2, 4, 8... frames en lugar de usar pasos fijos
+niveles_piramide = 4        # Niveles de la pirámide (el nivel l agrupa 2^l frames)
+ancho_haz = 8               # Candidatas que se refinan en cada nivel (al menos n_coincidencias)
+usar_indice_ann = False     # Preselección de pares (obra, posición) con el índice aproximado
+carpeta_indice_ann = os.path.expanduser('~/Desktop/indice_obras')   # Se construye si no existe
+ventana_indice_frames = 130 # Ventana de los embeddings del índice (aprox 3 s)
+paso_indice_frames = 20     # Paso entre ventanas indexadas (aprox 0.5 s)
+candidatos_ann = 10         # Pares (obra, posición) por muestra que se re-puntúan con coseno y DTW
+sondas_ann = 8              # Listas del índice que se recorren en cada consulta
+margen_ann_frames = 40      # Margen alrededor de cada candidato en la re-puntuación exacta
+usar_huellas = False        # Primera etapa: las muestras que son fragmentos literales de una obra se reconocen por
+                            # huellas espectrales (método 'huella', distancia = 1 - votos / huellas de la muestra)
+                            # y no pasan por coseno ni DTW
+carpeta_indice_huellas = os.path.expanduser('~/Desktop/indice_huellas')   # Se construye si no existe
+votos_min_huellas = 20      # Pares de picos alineados necesarios para dar una muestra por reconocida
+num_procesos = 1            # Procesos trabajadores para el análisis obra x muestra (1 = en serie)
+obra_por_bloques = False    # True: MFCC de cada obra por bloques, sin cargar todo el audio (obras largas)
+memoria_max_mb = 64         # Memoria máxima de cada bloque en la extracción por bloques
+descriptores_fragmento = 'pistas'   # Δ de descriptores: 'pistas' (medias de las pistas por frame de la obra,
+                                    # calculadas una vez; los ~2 frames de cada borde ven el audio vecino en
+                                    # lugar del relleno) o 'audio' (se recalculan sobre el fragmento recortado)
+instrumentar = False        # Tiempo por etapa, contadores, ritmo por obra y picos de memoria en instrumentacion.json
+                            # (y traza para chrome://tracing). En paralelo solo se mide el proceso principal
+instrumentar_memoria_python = False  # Además, pico de memoria reservada desde Python (tracemalloc; ralentiza la ejecución)
 
 # === FUNCIONES AUXILIARES ===
 def distancia_mfcc(mfcc1, mfcc2):
@@ -27,17 +70,276 @@ def distancia_mfcc(mfcc1, mfcc2):
     return cosine(mfcc1_13.flatten(), mfcc2_13.flatten())
 
 def distancia_dtw(mfcc1, mfcc2):
-    distancia, _ = fastdtw(mfcc1.T, mfcc2.T, dist=euclidean)
-    return distancia
-
-def calcular_descriptores(y, sr):
-    return {
-        "centroid": np.mean(librosa.feature.spectral_centroid(y=y, sr=sr)),
-        "spread": np.mean(librosa.feature.spectral_bandwidth(y=y, sr=sr)),
-        "flatness": np.mean(librosa.feature.spectral_flatness(y=y)),
-        "rms": np.mean(librosa.feature.rms(y=y)),
-        "zcr": np.mean(librosa.feature.zero_crossing_rate(y))
-    }
+    return dtw_distancia(mfcc1, mfcc2, radio=radio_banda_dtw)
+
+def distancia_dtw_nivel(mfcc1, mfcc2, nivel):
+    # DTW entre matrices de un nivel de la pirámide; la banda se reduce con el nivel
+    radio = None if radio_banda_dtw is None else max(1, radio_banda_dtw >> nivel)
+    return dtw_distancia(mfcc1, mfcc2, radio=radio)
+
+def buscar_coseno(mfcc_muestra, mfcc_obra, perfil=None, piramide_obra=None):
+    # Mejores posiciones (frames) y distancias coseno de la muestra en la obra
+    # que no se solapan: lista de (posición, distancia) de menor a mayor distancia
+    ventana_frames = mfcc_muestra.shape[1]
+    if busqueda_cos_exacta:
+        if perfil is None:
+            perfil = perfiles_coseno_aplanado(mfcc_obra, [mfcc_muestra])[0]
+        contar("ventanas coseno", len(perfil))
+        return mejores_coincidencias(perfil, n_coincidencias, umbral_coseno, separacion=ventana_frames)
+    if busqueda_piramide:
+        if piramide_obra is None:
+            piramide_obra = piramide_frames(mfcc_obra, niveles_piramide)
+        coincidencias, evaluaciones = buscar_piramide(lambda m, f, nivel: distancia_mfcc(m, f), piramide_frames(mfcc_muestra, niveles_piramide),
+                                                      piramide_obra, ancho_haz, n_coincidencias, umbral_coseno)
+        contar("ventanas coseno", evaluaciones)
+        return coincidencias
+    max_pos = mfcc_obra.shape[1] - ventana_frames
+    posiciones = range(0, max_pos, paso_frames_cos)
+    curva = [distancia_mfcc(mfcc_muestra, mfcc_obra[:, pos:pos+ventana_frames]) for pos in posiciones]
+    contar("ventanas coseno", len(curva))
+    separacion = -(-ventana_frames // paso_frames_cos)
+    return [(posiciones[i], d) for i, d in mejores_coincidencias(curva, n_coincidencias, umbral_coseno, separacion)]
+
+def buscar_dtw(mfcc_muestra, mfcc_obra, piramide_obra=None):
+    # Mejores posiciones (frames) y distancias DTW de la muestra en la obra,
+    # como lista de (posición, distancia) de menor a mayor distancia
+    ventana_frames = mfcc_muestra.shape[1]
+    max_pos = mfcc_obra.shape[1] - ventana_frames
+    if max_pos < 0:
+        return []
+    if modo_dtw == 'subsecuencia':
+        _, inicios_dtw, costes_dtw = dtw_subsecuencia(mfcc_muestra, mfcc_obra, n_mejores=n_coincidencias, normalizar=False, umbral=umbral_dtw)
+        contar("llamadas DTW")
+        return list(zip(inicios_dtw.tolist(), costes_dtw.tolist()))
+    if busqueda_piramide:
+        if piramide_obra is None:
+            piramide_obra = piramide_frames(mfcc_obra, niveles_piramide)
+        coincidencias, evaluaciones = buscar_piramide(distancia_dtw_nivel, piramide_frames(mfcc_muestra, niveles_piramide),
+                                                      piramide_obra, ancho_haz, n_coincidencias, umbral_dtw)
+        print(f"  Pirámide DTW: {evaluaciones} distancias calculadas")
+        contar("llamadas DTW", evaluaciones)
+        return coincidencias
+
+    # Cascada LB_Kim / LB_Keogh / abandono anticipado delante del DTW
+    poda = PodaDTW(mfcc_muestra, radio=radio_banda_dtw)
+    mejor_pos_gros, mejor_dtw_gros = buscar_dtw_ventanas(poda, mfcc_obra, range(0, max(max_pos, 1), paso_frames_dtw_gros))
+
+    refined_positions = range(max(0, mejor_pos_gros - 5), min(max_pos, mejor_pos_gros + 6))
+    refinadas = [p for p in refined_positions if p % paso_frames_dtw_fi == 0 and p != mejor_pos_gros]
+    mejor_pos_fino, mejor_dtw = buscar_dtw_ventanas(poda, mfcc_obra, refinadas, mejor_dtw_gros)
+    if mejor_pos_fino is None:
+        mejor_pos_fino, mejor_dtw = mejor_pos_gros, mejor_dtw_gros
+    print(f"  Poda DTW: {poda.resumen()}")
+    contar("ventanas DTW", poda.estadisticas['candidatos'])
+    contar("llamadas DTW", poda.estadisticas['dtw_completos'] + poda.estadisticas['abandonados'])
+    if mejor_pos_fino is None or (umbral_dtw is not None and mejor_dtw >= umbral_dtw):
+        return []
+    return [(mejor_pos_fino, mejor_dtw)]
+
+def regiones_candidatas(posiciones, ventana_frames, ventana_indice, n_frames):
+    # Tramos [inicio, fin) de la obra que cubren las ventanas candidatas del índice
+    # (de ventana_indice frames, la del índice cargado) más un margen, fusionando
+    # los que se solapan
+    regiones = []
+    for pos in sorted(posiciones):
+        inicio = max(0, pos - margen_ann_frames)
+        fin = min(n_frames, pos + max(ventana_frames, ventana_indice) + margen_ann_frames)
+        if regiones and inicio <= regiones[-1][1]:
+            regiones[-1][1] = max(regiones[-1][1], fin)
+        else:
+            regiones.append([inicio, fin])
+    return regiones
+
+def buscar_en_regiones(funcion_busqueda, mfcc_muestra, mfcc_obra, regiones):
+    # Aplica la búsqueda exacta a cada tramo candidato y devuelve las mejores
+    # coincidencias globales (los tramos no se solapan)
+    coincidencias = [(inicio + pos, dist) for inicio, fin in regiones
+                     for pos, dist in funcion_busqueda(mfcc_muestra, mfcc_obra[:, inicio:fin])]
+    if n_coincidencias is None:
+        return sorted(coincidencias, key=lambda x: x[1])
+    return heapq.nsmallest(n_coincidencias, coincidencias, key=lambda x: x[1])
+
+@medida("carga y mfcc obra")
+def cargar_obra(ruta_obra):
+    # Audio (o su sustituto en disco), frecuencia de muestreo y MFCC de una obra
+    if obra_por_bloques:
+        mfcc_obra, sr_obra, n_muestras = mfcc_por_bloques(ruta_obra, sr=None, memoria_max_mb=memoria_max_mb)
+        return AudioEnDisco(ruta_obra, sr_obra, n_muestras), sr_obra, mfcc_obra
+    y_obra, sr_obra = librosa.load(ruta_obra, sr=None)
+    return y_obra, sr_obra, librosa.feature.mfcc(y=y_obra, sr=sr_obra, n_mfcc=20)
+
+def firmas_obras(carpeta_obras, obras_files):
+    # Tamaño y fecha de modificación de cada obra. Un índice guardado con otras
+    # firmas (obras añadidas, renombradas, regrabadas o borradas) está desfasado
+    firmas = {}
+    for obra_file in obras_files:
+        estado = os.stat(os.path.join(carpeta_obras, obra_file))
+        firmas[obra_file] = [estado.st_size, estado.st_mtime]
+    return firmas
+
+def construir_indice_ann(carpeta_obras, obras_files, firmas):
+    print(f"\nConstruyendo índice de obras en {carpeta_indice_ann}...")
+    obras_mfcc = []
+    for obra_file in obras_files:
+        _, _, mfcc_obra = cargar_obra(os.path.join(carpeta_obras, obra_file))
+        obras_mfcc.append((obra_file, mfcc_obra))
+    indice = IndiceIVF(ventana_indice_frames, paso_indice_frames).construir(obras_mfcc)
+    indice.firmas = firmas
+    indice.guardar(carpeta_indice_ann)
+    return indice
+
+def cargar_indice_ann(carpeta_obras, obras_files):
+    # Índice guardado si está al día con las obras actuales; si no, se reconstruye
+    firmas = firmas_obras(carpeta_obras, obras_files)
+    if os.path.exists(os.path.join(carpeta_indice_ann, "indice.json")):
+        indice = IndiceIVF.cargar(carpeta_indice_ann)
+        if indice.firmas == firmas:
+            return indice
+        print(f"\nEl índice de {carpeta_indice_ann} no corresponde a las obras actuales.")
+    return construir_indice_ann(carpeta_obras, obras_files, firmas)
+
+def construir_indice_huellas(carpeta_obras, obras_files, firmas):
+    print(f"\nConstruyendo índice de huellas en {carpeta_indice_huellas}...")
+    indice = IndiceHuellas()
+    indice.construir((obra_file, librosa.load(os.path.join(carpeta_obras, obra_file), sr=indice.sr)[0]) for obra_file in obras_files)
+    indice.firmas = firmas
+    indice.guardar(carpeta_indice_huellas)
+    return indice
+
+def cargar_indice_huellas(carpeta_obras, obras_files):
+    # Como cargar_indice_ann: el índice guardado solo se usa si está al día
+    firmas = firmas_obras(carpeta_obras, obras_files)
+    if os.path.exists(os.path.join(carpeta_indice_huellas, "indice.json")):
+        indice = IndiceHuellas.cargar(carpeta_indice_huellas)
+        if indice.firmas == firmas:
+            return indice
+        print(f"\nEl índice de {carpeta_indice_huellas} no corresponde a las obras actuales.")
+    return construir_indice_huellas(carpeta_obras, obras_files, firmas)
+
+def reconocer_por_huellas(muestras, carpeta_obras, obras_files):
+    # {muestra: (obra, inicio en segundos, votos, huellas de la muestra)} de las
+    # muestras reconocidas como fragmentos literales de alguna obra
+    indice = cargar_indice_huellas(carpeta_obras, obras_files)
+    reconocidas = {}
+    for muestra_file, y, sr, _, _ in muestras:
+        resultado = indice.buscar(librosa.resample(y, orig_sr=sr, target_sr=indice.sr))
+        if resultado and resultado[0][2] >= votos_min_huellas:
+            reconocidas[muestra_file] = resultado[0]
+            print(f"  {muestra_file}: reconocida en {resultado[0][0]} ({resultado[0][2]} votos)")
+    return reconocidas
+
+def registrar_coincidencia(metodo, rango, mejor_pos, distancia, muestra_file, y_muestra, desc_muestra, obra_file, y_obra, sr_obra, acumuladas_obra, carpeta_muestra):
+    start_sample = int(mejor_pos * 512)
+    end_sample = start_sample + len(y_muestra)
+    if end_sample > len(y_obra):
+        end_sample = len(y_obra)
+        start_sample = max(0, end_sample - len(y_muestra))
+
+    fragmento_audio = y_obra[start_sample:end_sample]
+    sufijo = {"coseno": "cos"}.get(metodo, metodo)
+    if rango > 1:
+        sufijo = f"{sufijo}_{rango}"
+    ruta_fragmento = os.path.join(carpeta_muestra, f"{os.path.splitext(obra_file)[0]}_{sufijo}.wav")
+    with etapa("escritura"):
+        sf.write(ruta_fragmento, fragmento_audio, sr_obra)
+    contar_bytes(ruta_fragmento)
+
+    with etapa("descriptores fragmento"):
+        if acumuladas_obra is not None:
+            desc_frag = descriptores_tramo(acumuladas_obra, start_sample, end_sample)
+        else:
+            desc_frag = calcular_descriptores(fragmento_audio, sr_obra)
+    delta = {k: desc_muestra[k] - desc_frag[k] for k in desc_muestra}
+    tiempo_min_seg = f"{int(start_sample / sr_obra // 60)}:{int(start_sample / sr_obra % 60):02d}"
+
+    return [muestra_file, obra_file, metodo, tiempo_min_seg, distancia, delta["centroid"], delta["spread"], delta["flatness"], delta["rms"], delta["zcr"]]
+
+# === ANÁLISIS DE UN PAR OBRA x MUESTRA (EN SERIE O EN UN PROCESO TRABAJADOR) ===
+# Estado del proceso: muestras, longitud de la muestra más larga y obra en curso.
+# En paralelo, la obra se adjunta desde memoria compartida y los datos de coseno
+# se preparan con el mismo tamaño de FFT que en serie, así que las filas del CSV
+# son idénticas en los dos modos
+_estado = {}
+
+def _iniciar_estado(muestras, longitud_max, ventana_indice=None):
+    _estado['muestras'] = muestras
+    _estado['longitud_max'] = longitud_max
+    _estado['ventana_indice'] = ventana_indice
+
+def _iniciar_trabajador(muestras, longitud_max, ventana_indice=None):
+    _estado['limite_hilos'] = limitar_hilos_blas(1)
+    _iniciar_estado(muestras, longitud_max, ventana_indice)
+
+def _fijar_obra(clave, obra_file, sr_obra, y_obra, mfcc_obra, acumuladas_obra):
+    _estado['clave_obra'] = clave
+    _estado['obra'] = (obra_file, sr_obra, y_obra, mfcc_obra, acumuladas_obra)
+    _estado['obra_cos'] = preparar_obra_coseno(mfcc_obra, _estado['longitud_max']) if busqueda_cos_exacta else None
+    _estado['obra_piramide'] = piramide_frames(mfcc_obra, niveles_piramide) if busqueda_piramide else None
+
+def _adjuntar_obra(obra_file, sr_obra, desc_audio, desc_mfcc, desc_acumuladas):
+    # desc_audio es un AudioEnDisco (se pasa tal cual) cuando la obra se analiza por bloques
+    if _estado.get('clave_obra') == desc_mfcc[0]:
+        return
+    # Suelta las vistas de la obra anterior antes de cerrar sus bloques
+    _estado.pop('obra', None)
+    _estado.pop('obra_cos', None)
+    _estado.pop('obra_piramide', None)
+    for bloque in _estado.pop('bloques_obra', ()):
+        bloque.close()
+    bloque_mfcc, mfcc_obra = adjuntar(desc_mfcc)
+    bloques = [bloque_mfcc]
+    if isinstance(desc_audio, AudioEnDisco):
+        y_obra = desc_audio
+    else:
+        bloque_audio, y_obra = adjuntar(desc_audio)
+        bloques.append(bloque_audio)
+    acumuladas_obra = None
+    if desc_acumuladas is not None:
+        bloque_acumuladas, acumuladas_obra = adjuntar(desc_acumuladas)
+        bloques.append(bloque_acumuladas)
+    _estado['bloques_obra'] = tuple(bloques)
+    _fijar_obra(desc_mfcc[0], obra_file, sr_obra, y_obra, mfcc_obra, acumuladas_obra)
+
+def _analizar_muestra_compartida(tarea):
+    obra_file, sr_obra, desc_audio, desc_mfcc, desc_acumuladas, idx_muestra, posiciones_ann, carpeta_muestra = tarea
+    _adjuntar_obra(obra_file, sr_obra, desc_audio, desc_mfcc, desc_acumuladas)
+    return analizar_muestra(idx_muestra, posiciones_ann, carpeta_muestra)
+
+def analizar_muestra(idx_muestra, posiciones_ann, carpeta_muestra):
+    # Búsquedas coseno y DTW de una muestra en la obra en curso; devuelve las filas del CSV
+    muestra_file, y_muestra, sr_muestra, mfcc_muestra, desc_muestra = _estado['muestras'][idx_muestra]
+    obra_file, sr_obra, y_obra, mfcc_obra, acumuladas_obra = _estado['obra']
+    datos_registro = (muestra_file, y_muestra, desc_muestra, obra_file, y_obra, sr_obra, acumuladas_obra, carpeta_muestra)
+    filas = []
+
+    if posiciones_ann is not None:
+        regiones = regiones_candidatas(posiciones_ann, mfcc_muestra.shape[1], _estado['ventana_indice'], mfcc_obra.shape[1])
+
+    # ==== COSENO ====
+    print(f" Procesando muestra (coseno): {muestra_file}")
+    if mfcc_muestra.shape[1] > mfcc_obra.shape[1]:
+        print(f"  La muestra {muestra_file} es más larga que la obra, se omite.")
+        return filas
+    with etapa("búsqueda coseno", muestra=muestra_file, obra=obra_file):
+        if posiciones_ann is not None:
+            coincidencias = buscar_en_regiones(buscar_coseno, mfcc_muestra, mfcc_obra, regiones)
+        else:
+            perfil = perfil_coseno_aplanado(_estado['obra_cos'], mfcc_muestra) if busqueda_cos_exacta else None
+            coincidencias = buscar_coseno(mfcc_muestra, mfcc_obra, perfil, _estado['obra_piramide'])
+    # Una fila por coincidencia, de menor a mayor distancia
+    for rango, (pos, dist) in enumerate(coincidencias, start=1):
+        filas.append(registrar_coincidencia("coseno", rango, pos, dist, *datos_registro))
+
+    # ==== DTW ====
+    print(f" Procesando muestra (DTW): {muestra_file}")
+    with etapa("búsqueda DTW", muestra=muestra_file, obra=obra_file):
+        if posiciones_ann is not None:
+            coincidencias = buscar_en_regiones(buscar_dtw, mfcc_muestra, mfcc_obra, regiones)
+        else:
+            coincidencias = buscar_dtw(mfcc_muestra, mfcc_obra, _estado['obra_piramide'])
+    for rango, (pos, dist) in enumerate(coincidencias, start=1):
+        filas.append(registrar_coincidencia("dtw", rango, pos, dist, *datos_registro))
+    return filas
 
 def orden_natural(s):
     _nsre = re.compile('([0-9]+)')
@@ -45,6 +347,8 @@ def orden_natural(s):
 
 # === PROGRAMA PRINCIPAL ===
 def main():
+    if instrumentar:
+        activar(instrumentar_memoria_python)
     print(f"Iniciando script a las {datetime.now().strftime('%H:%M:%S')}")
     carpeta_muestras = os.path.expanduser('~/Desktop/muestras')
     carpeta_obras = os.path.expanduser('~/Desktop/obras')
@@ -59,81 +363,121 @@ def main():
     for mf in muestras_files:
         ruta = os.path.join(carpeta_muestras, mf)
         print(f"  Cargando muestra: {mf}")
-        y, sr = librosa.load(ruta, sr=None)
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=20)
-        descriptores = calcular_descriptores(y, sr)
+        with etapa("carga muestra", muestra=mf):
+            y, sr = librosa.load(ruta, sr=None)
+        # MFCC y descriptores de la muestra a partir de la misma STFT
+        with etapa("mfcc y descriptores muestra", muestra=mf):
+            pistas = descriptores_por_frames(y, sr, n_mfcc=20)
+        mfcc = pistas.pop("mfcc")
+        descriptores = medias_descriptores(pistas)
         muestras.append((mf, y, sr, mfcc, descriptores))
 
     print("\nCargando obras...")
     obras_files = sorted([f for f in os.listdir(carpeta_obras) if f.lower().endswith('.wav')], key=orden_natural)
+
+    # Primera etapa: fragmentos literales reconocidos por huellas espectrales
+    reconocidas = {}
+    if usar_huellas:
+        print("\nBuscando fragmentos literales por huellas...")
+        with etapa("huellas"):
+            reconocidas = reconocer_por_huellas(muestras, carpeta_obras, obras_files)
+
+    # Preselección con el índice aproximado: solo se analizan los pares (obra, posición) candidatos
+    candidatos = None
+    ventana_indice = None
+    if usar_indice_ann:
+        with etapa("índice aproximado"):
+            indice = cargar_indice_ann(carpeta_obras, obras_files)
+            ventana_indice = indice.ventana_frames
+            candidatos = {}
+            for muestra_file, _, _, mfcc_muestra, _ in muestras:
+                if muestra_file in reconocidas:
+                    continue
+                for obra_file, pos, _ in indice.buscar(mfcc_muestra, k=candidatos_ann, n_sondas=sondas_ann):
+                    candidatos.setdefault(obra_file, {}).setdefault(muestra_file, []).append(pos)
+        obras_reconocidas = {obra_file for obra_file, _, _, _ in reconocidas.values()}
+        obras_files = [f for f in obras_files if f in candidatos or f in obras_reconocidas]
+
     resultados_csv = os.path.join(carpeta_resultados, 'resultados_coincidencias.csv')
     with open(resultados_csv, mode='w', newline='', encoding='utf-8') as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(["Muestra", "Obra", "Método", "Tiempo (min:seg)", "Distancia", "Δ Centroid", "Δ Spread", "Δ Flatness", "Δ RMS", "Δ Zero Crossing Rate"])
 
-        for obra_file in obras_files:
-            print(f"\nAnalizando obra: {obra_file}")
-            ruta_obra = os.path.join(carpeta_obras, obra_file)
-            y_obra, sr_obra = librosa.load(ruta_obra, sr=None)
-            mfcc_obra = librosa.feature.mfcc(y=y_obra, sr=sr_obra, n_mfcc=20)
-
-            for muestra_file, y_muestra, sr_muestra, mfcc_muestra, desc_muestra in muestras:
-                carpeta_muestra = os.path.join(carpeta_resultados, os.path.splitext(muestra_file)[0])
-                os.makedirs(carpeta_muestra, exist_ok=True)
-                ruta_muestra_original = os.path.join(carpeta_muestras, muestra_file)
-                destino_muestra = os.path.join(carpeta_muestra, muestra_file)
-                if not os.path.exists(destino_muestra):
-                    shutil.copy(ruta_muestra_original, destino_muestra)
-
-                # ==== COSENO ====
-                print(f" Procesando muestra (coseno): {muestra_file}")
-                ventana_frames = mfcc_muestra.shape[1]
-                max_pos = mfcc_obra.shape[1] - ventana_frames
-                coincidencias = [(pos, distancia_mfcc(mfcc_muestra, mfcc_obra[:, pos:pos+ventana_frames])) for pos in range(0, max_pos, paso_frames_cos)]
-                mejor_pos, mejor_dist = sorted(coincidencias, key=lambda x: x[1])[0]
-
-                start_sample = int(mejor_pos * 512)
-                end_sample = start_sample + len(y_muestra)
-                if end_sample > len(y_obra):
-                    end_sample = len(y_obra)
-                    start_sample = max(0, end_sample - len(y_muestra))
-
-                fragmento_audio = y_obra[start_sample:end_sample]
-                ruta_fragmento = os.path.join(carpeta_muestra, f"{os.path.splitext(obra_file)[0]}_cos.wav")
-                sf.write(ruta_fragmento, fragmento_audio, sr_obra)
-
-                desc_frag = calcular_descriptores(fragmento_audio, sr_obra)
-                delta = {k: desc_muestra[k] - desc_frag[k] for k in desc_muestra}
-                tiempo_min_seg = f"{int(start_sample / sr_obra // 60)}:{int(start_sample / sr_obra % 60):02d}"
-
-                writer.writerow([muestra_file, obra_file, "coseno", tiempo_min_seg, mejor_dist, delta["centroid"], delta["spread"], delta["flatness"], delta["rms"], delta["zcr"]])
-
-                # ==== DTW ====
-                print(f" Procesando muestra (DTW): {muestra_file}")
-                ventana_frames = mfcc_muestra.shape[1]
-                max_pos = mfcc_obra.shape[1] - ventana_frames
-                coarse = [(pos, distancia_dtw(mfcc_muestra, mfcc_obra[:, pos:pos+ventana_frames])) for pos in range(0, max_pos, paso_frames_dtw_gros)]
-                mejor_pos_gros, _ = sorted(coarse, key=lambda x: x[1])[0]
-
-                refined_positions = range(max(0, mejor_pos_gros - 5), min(max_pos, mejor_pos_gros + 6))
-                refinadas = [(p, distancia_dtw(mfcc_muestra, mfcc_obra[:, p:p+ventana_frames])) for p in refined_positions if p % paso_frames_dtw_fi == 0]
-                mejor_pos_fino, mejor_dtw = sorted(refinadas, key=lambda x: x[1])[0]
-
-                start_sample = int(mejor_pos_fino * 512)
-                end_sample = start_sample + len(y_muestra)
-                if end_sample > len(y_obra):
-                    end_sample = len(y_obra)
-                    start_sample = max(0, end_sample - len(y_muestra))
-
-                fragmento_audio = y_obra[start_sample:end_sample]
-                ruta_fragmento = os.path.join(carpeta_muestra, f"{os.path.splitext(obra_file)[0]}_dtw.wav")
-                sf.write(ruta_fragmento, fragmento_audio, sr_obra)
-
-                desc_frag = calcular_descriptores(fragmento_audio, sr_obra)
-                delta = {k: desc_muestra[k] - desc_frag[k] for k in desc_muestra}
-                tiempo_min_seg = f"{int(start_sample / sr_obra // 60)}:{int(start_sample / sr_obra % 60):02d}"
-
-                writer.writerow([muestra_file, obra_file, "dtw", tiempo_min_seg, mejor_dtw, delta["centroid"], delta["spread"], delta["flatness"], delta["rms"], delta["zcr"]])
+        longitud_max = max([m[3].shape[1] for m in muestras], default=1)
+        _iniciar_estado(muestras, longitud_max, ventana_indice)
+        ejecutor = None
+        if num_procesos > 1:
+            ejecutor = ProcessPoolExecutor(max_workers=num_procesos, initializer=_iniciar_trabajador, initargs=(muestras, longitud_max, ventana_indice))
+
+        progreso = Progreso("obras", len(obras_files))
+        try:
+            for obra_file in obras_files:
+                print(f"\nAnalizando obra: {obra_file}")
+                ruta_obra = os.path.join(carpeta_obras, obra_file)
+                y_obra, sr_obra, mfcc_obra = cargar_obra(ruta_obra)
+                # Pistas por frame de los descriptores de la obra, una sola vez (por bloques)
+                acumuladas_obra = None
+                if descriptores_fragmento == 'pistas':
+                    with etapa("descriptores obra", obra=obra_file):
+                        acumuladas_obra = acumular_descriptores(descriptores_por_bloques(y_obra, sr_obra))
+
+                tareas = []
+                filas_huellas = []
+                for idx_muestra, (muestra_file, y_muestra, _, _, desc_muestra) in enumerate(muestras):
+                    reconocida = reconocidas.get(muestra_file)
+                    if reconocida is not None and reconocida[0] != obra_file:
+                        continue
+                    if reconocida is None and candidatos is not None and muestra_file not in candidatos.get(obra_file, {}):
+                        continue
+                    carpeta_muestra = os.path.join(carpeta_resultados, os.path.splitext(muestra_file)[0])
+                    os.makedirs(carpeta_muestra, exist_ok=True)
+                    ruta_muestra_original = os.path.join(carpeta_muestras, muestra_file)
+                    destino_muestra = os.path.join(carpeta_muestra, muestra_file)
+                    if not os.path.exists(destino_muestra):
+                        shutil.copy(ruta_muestra_original, destino_muestra)
+                    if reconocida is not None:
+                        # Fragmento literal: la posición sale del desplazamiento más votado
+                        _, inicio_seg, votos, n_huellas = reconocida
+                        pos = max(0, int(round(inicio_seg * sr_obra / 512)))
+                        filas_huellas.append(registrar_coincidencia("huella", 1, pos, 1 - votos / n_huellas, muestra_file, y_muestra, desc_muestra,
+                                                                    obra_file, y_obra, sr_obra, acumuladas_obra, carpeta_muestra))
+                        continue
+                    posiciones_ann = candidatos[obra_file][muestra_file] if candidatos is not None else None
+                    tareas.append((idx_muestra, posiciones_ann, carpeta_muestra))
+                writer.writerows(filas_huellas)
+
+                if ejecutor is None:
+                    _fijar_obra(obra_file, obra_file, sr_obra, y_obra, mfcc_obra, acumuladas_obra)
+                    resultados = [analizar_muestra(*tarea) for tarea in tareas]
+                else:
+                    # La obra se publica una vez en memoria compartida; los trabajadores solo reciben descriptores
+                    bloques = []
+                    if isinstance(y_obra, AudioEnDisco):
+                        desc_audio = y_obra
+                    else:
+                        bloque_audio, desc_audio = publicar(y_obra)
+                        bloques.append(bloque_audio)
+                    bloque_mfcc, desc_mfcc = publicar(mfcc_obra)
+                    bloques.append(bloque_mfcc)
+                    desc_acumuladas = None
+                    if acumuladas_obra is not None:
+                        bloque_acumuladas, desc_acumuladas = publicar(acumuladas_obra)
+                        bloques.append(bloque_acumuladas)
+                    try:
+                        with etapa("análisis en paralelo", obra=obra_file, muestras=len(tareas)):
+                            resultados = list(ejecutor.map(_analizar_muestra_compartida, [(obra_file, sr_obra, desc_audio, desc_mfcc, desc_acumuladas) + tarea for tarea in tareas]))
+                    finally:
+                        for bloque in bloques:
+                            liberar(bloque)
+
+                # Las filas se escriben en el orden de las muestras, igual que en serie
+                for filas in resultados:
+                    writer.writerows(filas)
+                contar("pares obra x muestra", len(tareas))
+                progreso.avanzar()
+        finally:
+            if ejecutor is not None:
+                ejecutor.shutdown()
 
     print("\nGenerando gráficas resumen...")
     df = pd.read_csv(resultados_csv)
@@ -176,6 +520,7 @@ def main():
     plt.tight_layout()
     plt.savefig(os.path.join(figuras_carpeta, 'muestras_mas_coincidencias.png'))
     plt.close()
+    exportar(carpeta_resultados)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,123 @@
+import librosa
+import numpy as np
+import os
+import sys
+
+from herramientas.benchmark import cargar_resultados, clave_caso, guardar_resultados, medir, regresiones
+from herramientas.busqueda_coseno import curva_distancia_coseno, perfiles_coseno_aplanado, posicion_minima
+from herramientas.busqueda_dtw import dtw_subsecuencia
+from herramientas.corpus_sintetico import generar_muestras, generar_obra, nombre_transformacion
+from herramientas.extraccion_mfcc import ExtractorMFCC
+from herramientas.segmentacion import agrupar_por_timbre, fusionar_secciones_cortas, sumas_acumuladas
+
+# === CONFIGURACIÓN ===
+carpeta_resultados = os.path.expanduser("~/Desktop/benchmark")
+ruta_linea_base = os.path.join(carpeta_resultados, "linea_base.json")
+actualizar_linea_base = False   # True: esta ejecución pasa a ser la línea base (también se guarda si aún no existe)
+sample_rate = 22050
+hop_length = 512
+duraciones_obra = [30, 120, 300]   # Segundos de cada obra sintética
+duraciones_muestra = [1, 3, 7]     # Segundos de cada muestra
+muestras_por_caso = 3
+# Modificaciones de las muestras, como en los scripts 9.x (filtros), 10.x (reverb), 6 (stretch) y 7 (pitch shift)
+transformaciones = [None, ('lpf', 1200), ('hpf', 420), ('plate', 0.5), ('stretch', 2.0), ('shift', 3)]
+repeticiones = 3                   # Se guarda el mejor tiempo de las repeticiones
+error_max_segundos = 0.5           # Error de localización máximo para contar un acierto
+tolerancia_tiempo = 0.25           # Regresión si el tiempo sube más de un 25 %...
+tolerancia_memoria = 0.25          # ...o el pico de memoria más de un 25 %...
+tolerancia_aciertos = 0.0          # ...o la tasa de aciertos baja más de esto
+semilla = 0
+
+# Segmentación con los parámetros del Script 11
+mfcc_distance_threshold = 30.0
+DURACION_MINIMA_SEGUNDOS = 15.0
+
+
+def extraer_mfcc(y):
+    # Extracción por bloques, como mfcc_por_bloques en los scripts de búsqueda
+    extractor = ExtractorMFCC(sample_rate, hop_length=hop_length)
+    for inicio in range(0, len(y), 1 << 16):
+        extractor.agregar(y[inicio:inicio + (1 << 16)])
+    return extractor.finalizar()
+
+
+def buscar_coseno_medias(mfcc_obra, mfcc_muestra):
+    # Scripts 4, 6 y 7
+    return posicion_minima(curva_distancia_coseno(mfcc_obra, mfcc_muestra))[0]
+
+
+def buscar_coseno_aplanado(mfcc_obra, mfcc_muestra):
+    # Script 12 (y la comparación aplanada de 8.1)
+    return posicion_minima(perfiles_coseno_aplanado(mfcc_obra, [mfcc_muestra])[0])[0]
+
+
+def buscar_dtw(mfcc_obra, mfcc_muestra):
+    # Scripts 8.1, 8.2 y 12
+    _, inicios, _ = dtw_subsecuencia(mfcc_muestra, mfcc_obra)
+    return int(inicios[0]) if len(inicios) else None
+
+
+def segmentar(y):
+    # Script 11
+    mfcc = librosa.feature.mfcc(y=y, sr=sample_rate, n_mfcc=13, hop_length=hop_length)
+    onset_frames = librosa.onset.onset_detect(y=y, sr=sample_rate, hop_length=hop_length, backtrack=True)
+    onsets = librosa.frames_to_samples(onset_frames, hop_length=hop_length)
+    acumuladas = sumas_acumuladas(mfcc)
+    secciones = agrupar_por_timbre(onsets, acumuladas, hop_length, mfcc_distance_threshold)
+    return fusionar_secciones_cortas(secciones, acumuladas, hop_length, int(DURACION_MINIMA_SEGUNDOS * sample_rate))
+
+
+algoritmos_busqueda = {
+    'coseno_medias': buscar_coseno_medias,
+    'coseno_aplanado': buscar_coseno_aplanado,
+    'dtw_subsecuencia': buscar_dtw,
+}
+
+resultados = {}
+for i, duracion_obra in enumerate(duraciones_obra):
+    print(f"\nObra sintética de {duracion_obra} s")
+    obra = generar_obra(duracion_obra, sample_rate, semilla=semilla + i)
+
+    mfcc_obra, tiempo, pico = medir(lambda: extraer_mfcc(obra), repeticiones)
+    resultados[clave_caso('extraccion_mfcc', duracion_obra)] = {
+        "tiempo_s": tiempo, "pico_mb": pico, "segundos_audio_por_s": duracion_obra / tiempo}
+
+    secciones, tiempo, pico = medir(lambda: segmentar(obra), repeticiones)
+    resultados[clave_caso('segmentacion', duracion_obra)] = {
+        "tiempo_s": tiempo, "pico_mb": pico, "segundos_audio_por_s": duracion_obra / tiempo, "secciones": len(secciones)}
+
+    for duracion_muestra in duraciones_muestra:
+        for transformacion in transformaciones:
+            muestras = generar_muestras(obra, sample_rate, duracion_muestra, muestras_por_caso, transformacion,
+                                        semilla=semilla + 1000 * i + duracion_muestra)
+            mfcc_muestras = [librosa.feature.mfcc(y=y, sr=sample_rate, n_mfcc=20, hop_length=hop_length) for _, y in muestras]
+            for nombre, buscar in algoritmos_busqueda.items():
+                posiciones, tiempo, pico = medir(lambda: [buscar(mfcc_obra, m) for m in mfcc_muestras], repeticiones)
+                errores = [abs(pos * hop_length / sample_rate - inicio) if pos is not None else float('inf')
+                           for pos, (inicio, _) in zip(posiciones, muestras)]
+                tiempo_muestra = tiempo / len(muestras)
+                clave = clave_caso(nombre, duracion_obra, duracion_muestra, nombre_transformacion(transformacion))
+                resultados[clave] = {
+                    "tiempo_s": tiempo_muestra,
+                    "pico_mb": pico,
+                    "segundos_obra_por_s": duracion_obra / tiempo_muestra,
+                    "aciertos": float(np.mean([e <= error_max_segundos for e in errores])),
+                    "error_mediano_s": float(np.median(errores)),
+                }
+                print(f"  {clave}: {1000 * tiempo_muestra:.1f} ms/muestra, {pico:.1f} MB, "
+                      f"aciertos {resultados[clave]['aciertos']:.2f}")
+
+guardar_resultados(resultados, os.path.join(carpeta_resultados, "resultados.json"))
+
+if actualizar_linea_base or not os.path.exists(ruta_linea_base):
+    guardar_resultados(resultados, ruta_linea_base)
+    print(f"\nLínea base guardada en {ruta_linea_base}")
+    sys.exit(0)
+
+mensajes = regresiones(resultados, cargar_resultados(ruta_linea_base), tolerancia_tiempo, tolerancia_memoria, tolerancia_aciertos)
+if mensajes:
+    print(f"\n{len(mensajes)} regresiones respecto a la línea base:")
+    for mensaje in mensajes:
+        print(f"  {mensaje}")
+    sys.exit(1)
+print("\nSin regresiones respecto a la línea base.")
@@ -3,22 +3,32 @@ import numpy as np
 from scipy.spatial.distance import euclidean
 import os
 
+from herramientas.descriptores import descriptores_por_frames, medias_descriptores
+from herramientas.instrumentacion import activar, etapa, exportar
+
 # --- Ruta al escritorio ---
 desktop = "/Users/rogercostavendrell/Desktop"
 audio1_path = os.path.join(desktop, "so1.wav")
 audio2_path = os.path.join(desktop, "so2.wav")
+instrumentar = False  # Tiempo por etapa y picos de memoria en instrumentacion.json (y traza para chrome://tracing)
+instrumentar_memoria_python = False  # Además, pico de memoria reservada desde Python (tracemalloc; ralentiza la ejecución)
 
 # --- Función para extraer descriptores ---
 def extraer_descriptores(ruta_audio):
-    y, sr = librosa.load(ruta_audio)
+    with etapa("carga", archivo=ruta_audio):
+        y, sr = librosa.load(ruta_audio)
 
-    centroid = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
-    spread = np.mean(librosa.feature.spectral_bandwidth(y=y, sr=sr))
-    flatness = np.mean(librosa.feature.spectral_flatness(y=y))
-    rms = np.mean(librosa.feature.rms(y=y))
-    zero_crossing = np.mean(librosa.feature.zero_crossing_rate(y))
+    # Todos los descriptores (y la fuerza de onset) salen de una sola STFT
+    with etapa("descriptores", archivo=ruta_audio):
+        pistas = descriptores_por_frames(y, sr, onset=True)
+    medias = medias_descriptores(pistas)
+    centroid = medias['centroid']
+    spread = medias['spread']
+    flatness = medias['flatness']
+    rms = medias['rms']
+    zero_crossing = medias['zcr']
 
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+    onset_env = pistas['onset']
     attack_time = librosa.frames_to_time(np.argmax(onset_env > 0.5), sr=sr)
 
     return {
@@ -52,6 +62,8 @@ def comparar_descriptores(desc1, desc2):
     return similitud, distancia
 
 # --- Ejecución principal ---
+if instrumentar:
+    activar(instrumentar_memoria_python)
 desc1 = extraer_descriptores(audio1_path)
 desc2 = extraer_descriptores(audio2_path)
 
@@ -68,3 +80,4 @@ for k, v in desc2.items():
 
 print(f"\n📏 Distancia normalizada: {distancia:.4f}")
 print(f"🔁 Similitud estimada (0 = distintos, 1 = idénticos): {similitud:.4f}")
+exportar(desktop)
@@ -5,12 +5,24 @@ import soundfile as sf
 import csv
 from sklearn.metrics.pairwise import cosine_similarity
 import random
+from herramientas.busqueda_coseno import curvas_distancia_coseno
+from herramientas.extraccion_mfcc import AudioEnDisco, mfcc_por_bloques
+from herramientas.instrumentacion import Progreso, activar, contar, contar_bytes, etapa, exportar, medida
 
 # Parámetros
 sample_rate = 22050
 duraciones = [1, 3, 7, 15, 30]
 num_por_duracion = 20
 hop_length = 512
+obra_por_bloques = False   # True: MFCC de la obra por bloques, sin cargar todo el audio (solo modo rápido)
+memoria_max_mb = 64        # Memoria máxima de cada bloque en la extracción por bloques
+modo_rapido = True            # MFCC de la obra una sola vez y búsqueda por lotes sobre cortes de frames
+semilla = 1234                # Semilla de las muestras aleatorias (None = no reproducible)
+tolerancia_acierto_s = 0.1    # Error máximo de localización para contar un acierto
+muestras_por_lote = 64        # Muestras puntuadas a la vez en modo rápido
+guardar_audios = True         # False para experimentos con miles de muestras
+instrumentar = False          # Tiempo por etapa, contadores, ritmo y picos de memoria en instrumentacion.json (y traza para chrome://tracing)
+instrumentar_memoria_python = False  # Además, pico de memoria reservada desde Python (tracemalloc; ralentiza la ejecución)
 
 # Rutas
 desktop = os.path.expanduser("~/Desktop")
@@ -18,8 +30,22 @@ ruta_obra = os.path.join(desktop, "obra.wav")
 carpeta_resultados = os.path.join(desktop, "Resultados")
 os.makedirs(carpeta_resultados, exist_ok=True)
 
+random.seed(semilla)
+if instrumentar:
+    activar(instrumentar_memoria_python)
+
 # Cargar audio principal
-obra, _ = librosa.load(ruta_obra, sr=sample_rate)
+if obra_por_bloques:
+    # El audio de la obra no se carga entero: las muestras y coincidencias se leen de disco
+    with etapa("mfcc obra por bloques"):
+        mfcc_obra, _, n_muestras_obra = mfcc_por_bloques(ruta_obra, sr=sample_rate, hop_length=hop_length, memoria_max_mb=memoria_max_mb)
+    obra = AudioEnDisco(ruta_obra, sample_rate, n_muestras_obra)
+else:
+    with etapa("carga obra"):
+        obra, _ = librosa.load(ruta_obra, sr=sample_rate)
+    if modo_rapido:
+        with etapa("mfcc obra"):
+            mfcc_obra = librosa.feature.mfcc(y=obra, sr=sample_rate, hop_length=hop_length)
 
 def cosine_distance(mfcc1, mfcc2):
     mfcc1_mean = np.mean(mfcc1, axis=1, keepdims=True)
@@ -35,52 +61,106 @@ def extraer_fragmento(audio, duracion_s, sr):
     fin = inicio + int(sr * duracion_s)
     return audio[inicio:fin], inicio / sr
 
+@medida("búsqueda por lotes")
+def buscar_lote(mfcc_muestras):
+    # Mejor posición (en muestras de audio) y distancia de cada muestra del lote.
+    # Todas tienen la misma duración, así que se puntúan juntas contra las medias
+    # de las ventanas de la obra con resolución de un frame
+    ventana_frames = mfcc_muestras[0].shape[1]
+    medias = np.stack([np.mean(m, axis=1) for m in mfcc_muestras])
+    curvas = curvas_distancia_coseno(mfcc_obra, medias, ventana_frames)
+    contar("ventanas evaluadas", curvas.size)
+    posiciones = np.argmin(curvas, axis=1)
+    distancias = curvas[np.arange(len(posiciones)), posiciones]
+    return posiciones * hop_length, distancias
+
+@medida("búsqueda original")
+def buscar_muestra(muestra_audio):
+    # Búsqueda original: MFCC de un fragmento nuevo de la obra cada 100 ms
+    mfcc_muestra = librosa.feature.mfcc(y=muestra_audio, sr=sample_rate, hop_length=hop_length)
+    muestra_frames = mfcc_muestra.shape[1]
+
+    mejor_distancia = float('inf')
+    mejor_inicio = 0
+
+    posiciones = range(0, len(obra) - len(muestra_audio), int(sample_rate * 0.1))
+    contar("ventanas evaluadas", len(posiciones))
+    for j in posiciones:
+        fragmento = obra[j:j+len(muestra_audio)]
+        mfcc_fragmento = librosa.feature.mfcc(y=fragmento, sr=sample_rate, hop_length=hop_length)
+
+        if mfcc_fragmento.shape[1] != muestra_frames:
+            continue
+
+        dist = cosine_distance(mfcc_muestra, mfcc_fragmento)
+        if dist < mejor_distancia:
+            mejor_distancia = dist
+            mejor_inicio = j
+    return mejor_inicio, mejor_distancia
+
 # Crear CSV
 csv_path = os.path.join(carpeta_resultados, "resultados.csv")
+resumen = []
+progreso = Progreso("muestras", len(duraciones) * num_por_duracion)
 with open(csv_path, mode='w', newline='') as fcsv:
     writer = csv.writer(fcsv)
-    writer.writerow(["Duración_s", "Archivo_muestra", "Archivo_fragmento", "Inicio_minuto", "Inicio_segundo", "Distancia_coseno"])
+    writer.writerow(["Duración_s", "Archivo_muestra", "Archivo_fragmento", "Inicio_minuto", "Inicio_segundo", "Distancia_coseno", "Inicio_real_s", "Error_s"])
 
     for duracion in duraciones:
         carpeta_duracion = os.path.join(carpeta_resultados, f"Fragmentos {duracion}")
         os.makedirs(carpeta_duracion, exist_ok=True)
 
+        muestras = []
         for i in range(num_por_duracion):
-            muestra_audio, _ = extraer_fragmento(obra, duracion, sample_rate)
+            muestra_audio, inicio_real = extraer_fragmento(obra, duracion, sample_rate)
             if muestra_audio is None:
                 continue
-
+            muestras.append((i, muestra_audio, inicio_real))
+
+        # Búsqueda de todas las muestras de esta duración
+        encontrados = []
+        if modo_rapido:
+            for k in range(0, len(muestras), muestras_por_lote):
+                lote = muestras[k:k+muestras_por_lote]
+                mfcc_lote = [librosa.feature.mfcc(y=m, sr=sample_rate, hop_length=hop_length) for _, m, _ in lote]
+                encontrados.extend(zip(*buscar_lote(mfcc_lote)))
+        else:
+            encontrados = [buscar_muestra(m) for _, m, _ in muestras]
+
+        errores = []
+        for (i, muestra_audio, inicio_real), (mejor_inicio, mejor_distancia) in zip(muestras, encontrados):
+            mejor_inicio = int(mejor_inicio)
             nombre_muestra = f"muestra_{duracion}s_{i+1}.wav"
-            ruta_muestra = os.path.join(carpeta_duracion, nombre_muestra)
-            sf.write(ruta_muestra, muestra_audio, sample_rate)
-
-            mfcc_muestra = librosa.feature.mfcc(y=muestra_audio, sr=sample_rate, hop_length=hop_length)
-            muestra_frames = mfcc_muestra.shape[1]
-
-            mejor_distancia = float('inf')
-            mejor_inicio = 0
-            mejor_fragmento_audio = None
-
-            for j in range(0, len(obra) - len(muestra_audio), int(sample_rate * 0.1)):
-                fragmento = obra[j:j+len(muestra_audio)]
-                mfcc_fragmento = librosa.feature.mfcc(y=fragmento, sr=sample_rate, hop_length=hop_length)
-
-                if mfcc_fragmento.shape[1] != muestra_frames:
-                    continue
-
-                dist = cosine_distance(mfcc_muestra, mfcc_fragmento)
-                if dist < mejor_distancia:
-                    mejor_distancia = dist
-                    mejor_inicio = j
-                    mejor_fragmento_audio = fragmento
-
             nombre_fragmento = f"coincidencia_{duracion}s_{i+1}.wav"
-            ruta_fragmento = os.path.join(carpeta_duracion, nombre_fragmento)
-            sf.write(ruta_fragmento, mejor_fragmento_audio, sample_rate)
+            if guardar_audios:
+                with etapa("escritura"):
+                    sf.write(os.path.join(carpeta_duracion, nombre_muestra), muestra_audio, sample_rate)
+                    mejor_fragmento_audio = obra[mejor_inicio:mejor_inicio+len(muestra_audio)]
+                    sf.write(os.path.join(carpeta_duracion, nombre_fragmento), mejor_fragmento_audio, sample_rate)
+                contar_bytes(os.path.join(carpeta_duracion, nombre_muestra))
+                contar_bytes(os.path.join(carpeta_duracion, nombre_fragmento))
 
             minutos = int(mejor_inicio / sample_rate // 60)
             segundos = (mejor_inicio / sample_rate) % 60
+            error = abs(mejor_inicio / sample_rate - inicio_real)
+            errores.append(error)
+
+            writer.writerow([duracion, nombre_muestra, nombre_fragmento, minutos, round(segundos, 2), round(float(mejor_distancia), 4), round(inicio_real, 2), round(error, 3)])
+            progreso.avanzar()
+
+        # Tasa de acierto y error de localización por duración
+        if errores:
+            errores = np.array(errores)
+            aciertos = int(np.sum(errores <= tolerancia_acierto_s))
+            resumen.append([duracion, len(errores), aciertos, round(aciertos / len(errores), 4),
+                            round(float(np.mean(errores)), 3), round(float(np.median(errores)), 3)])
+            print(f"{duracion} s: {aciertos}/{len(errores)} aciertos, error mediano {np.median(errores):.3f} s")
+
+resumen_path = os.path.join(carpeta_resultados, "resumen_por_duracion.csv")
+with open(resumen_path, mode='w', newline='') as fcsv:
+    writer = csv.writer(fcsv)
+    writer.writerow(["Duración_s", "Muestras", "Aciertos", "Tasa_acierto", "Error_medio_s", "Error_mediano_s"])
+    writer.writerows(resumen)
 
-            writer.writerow([duracion, nombre_muestra, nombre_fragmento, minutos, round(segundos, 2), round(mejor_distancia, 4)])
-
-print(f"Se han guardado los resultados en {csv_path}”)
+print(f"Se han guardado los resultados en {csv_path}")
+exportar(carpeta_resultados)
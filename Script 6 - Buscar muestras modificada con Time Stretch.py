@@ -4,20 +4,24 @@ import soundfile as sf
 import csv
 import os
 from scipy.spatial.distance import cosine
+from herramientas.busqueda_coseno import ObraMultiescala, curva_distancia_coseno, posicion_minima, rejilla_factores
+from herramientas.extraccion_mfcc import AudioEnDisco, mfcc_por_bloques
+from herramientas.instrumentacion import activar, contar, contar_bytes, etapa, exportar
+from herramientas.variantes_mfcc import comparar_mfcc, variantes_time_stretch
 
 # Parámetros
 sample_rate = 22050
 hop_length = 512
-step_fast_ms = 100
-step_slow_ms = 10
+obra_por_bloques = False   # True: MFCC de la obra por bloques, sin cargar todo el audio (obras largas)
+memoria_max_mb = 64        # Memoria máxima de cada bloque en la extracción por bloques
 stretch_factors = [0.2, 0.5, 2.0, 3.5]
 threshold = 0.001
-
-def ms_to_frames(ms, sr=sample_rate, hop=hop_length):
-    return int((ms / 1000) * sr / hop)
-
-step_fast = ms_to_frames(step_fast_ms)
-step_slow = ms_to_frames(step_slow_ms)
+busqueda_multiescala = False   # True: una sola búsqueda por muestra (sin estirarla) en una rejilla continua de factores
+factores_por_octava = 12       # Densidad de la rejilla entre el menor y el mayor de stretch_factors
+variantes_en_mfcc = False           # True: las variantes se crean en el dominio de los MFCC (sin time_stretch del audio)
+informe_precision_variantes = False # Con variantes_en_mfcc, compara cada variante con la del audio estirado
+instrumentar = False                # Tiempo por etapa, contadores y picos de memoria en instrumentacion.json (y traza para chrome://tracing)
+instrumentar_memoria_python = False  # Además, pico de memoria reservada desde Python (tracemalloc; ralentiza la ejecución)
 
 # Rutas
 desktop = os.path.expanduser("~/Desktop")
@@ -25,6 +29,8 @@ obra_path = os.path.join(desktop, "obra.wav")
 muestras_folder = os.path.join(desktop, "muestras_timestretch")
 output_root = os.path.join(desktop, "Resultados_Multistretch")
 os.makedirs(output_root, exist_ok=True)
+if instrumentar:
+    activar(instrumentar_memoria_python)
 
 # CSV único para todos los resultados
 csv_path = os.path.join(output_root, "resultados_totales.csv")
@@ -33,77 +39,147 @@ with open(csv_path, mode='w', newline='') as file:
     writer.writerow(["Archivo original", "Factor", "Inicio (min:seg)", "Distancia con original"])
 
     # Carga la obra una vez
-    obra, _ = librosa.load(obra_path, sr=sample_rate)
-    mfcc_obra = librosa.feature.mfcc(y=obra, sr=sample_rate, hop_length=hop_length)
-
-    # Procesa cada factor de time stretch
-    for factor in stretch_factors:
-        factor_str = str(factor).replace(".", "_")
-        output_folder = os.path.join(output_root, f"Stretch_{factor_str}")
+    if obra_por_bloques:
+        # El audio de la obra no se carga entero: solo se leen de disco los fragmentos que se guardan
+        with etapa("mfcc obra por bloques"):
+            mfcc_obra, _, n_muestras_obra = mfcc_por_bloques(obra_path, sr=sample_rate, hop_length=hop_length, memoria_max_mb=memoria_max_mb)
+        obra = AudioEnDisco(obra_path, sample_rate, n_muestras_obra)
+    else:
+        with etapa("carga obra"):
+            obra, _ = librosa.load(obra_path, sr=sample_rate)
+        with etapa("mfcc obra"):
+            mfcc_obra = librosa.feature.mfcc(y=obra, sr=sample_rate, hop_length=hop_length)
+
+    if busqueda_multiescala:
+        # La muestra no se estira: se busca tal cual en la obra remuestreada a cada factor de
+        # la rejilla, y el resultado es la mejor pareja (posición, factor). Las sumas acumuladas
+        # de cada factor se calculan una vez para todas las muestras
+        factores = rejilla_factores(min(stretch_factors), max(stretch_factors), factores_por_octava)
+        with etapa("preparación multiescala"):
+            obra_multiescala = ObraMultiescala(mfcc_obra, factores)
+        output_folder = os.path.join(output_root, "Multiescala")
         os.makedirs(output_folder, exist_ok=True)
+        filas_precision = []
 
-        # Procesa cada archivo .wav dentro de muestras_timestretch
         for filename in os.listdir(muestras_folder):
             if filename.endswith(".wav"):
-                ruta_original = os.path.join(muestras_folder, filename)
-                y_orig, _ = librosa.load(ruta_original, sr=sample_rate)
-
-                # Aplica time stretch
-                try:
-                    y_stretched = librosa.effects.time_stretch(y_orig, rate=1.0/factor)
-                except Exception as e:
-                    print(f"⚠️ Error al aplicar stretch a {filename} (factor {factor}): {e}")
+                y_orig, _ = librosa.load(os.path.join(muestras_folder, filename), sr=sample_rate)
+                mfcc_original = librosa.feature.mfcc(y=y_orig, sr=sample_rate, hop_length=hop_length)
+                with etapa("búsqueda multiescala", muestra=filename):
+                    mejor_coincidencia, factor, mejor_distancia = obra_multiescala.buscar(mfcc_original)
+                if mejor_coincidencia is None:
+                    print(f"❌ No se encontró coincidencia para {filename}")
                     continue
 
-                # Guarda el audio estirado
-                stretched_name = filename.replace(".wav", f"_stretch{factor_str}.wav")
-                ruta_stretched = os.path.join(output_folder, stretched_name)
-                sf.write(ruta_stretched, y_stretched, sample_rate)
-
-                # Calcula MFCCs
-                mfcc_muestra = librosa.feature.mfcc(y=y_stretched, sr=sample_rate, hop_length=hop_length)
-                muestra_frames = mfcc_muestra.shape[1]
-                mfcc_muestra_mean = np.mean(mfcc_muestra, axis=1)
-
-                # Busca la mejor coincidencia dentro de la obra
-                mejor_coincidencia = None
-                mejor_distancia = float('inf')
-                i = 0
-                while i + muestra_frames <= mfcc_obra.shape[1]:
-                    fragmento = mfcc_obra[:, i:i + muestra_frames]
-                    frag_mean = np.mean(fragmento, axis=1)
-                    dist = cosine(mfcc_muestra_mean, frag_mean)
-                    if dist < mejor_distancia:
-                        mejor_distancia = dist
-                        mejor_coincidencia = i
-                    i += step_fast
-
-                if mejor_coincidencia is not None:
-                    seg_inicio = mejor_coincidencia * hop_length / sample_rate
-                    muestra_inicio = int(seg_inicio * sample_rate)
-                    muestra_fin = muestra_inicio + len(y_stretched)
-                    fragmento_obra = obra[muestra_inicio:muestra_fin]
-
-                    # Guarda el fragmento encontrado en la obra
-                    fragment_name = filename.replace(".wav", f"_fragmento_obra_stretch{factor_str}.wav")
-                    ruta_fragmento = os.path.join(output_folder, fragment_name)
-                    sf.write(ruta_fragmento, fragmento_obra, sample_rate)
-
-                    # Calcula la distancia con el original (sin stretch)
-                    mfcc_fragmento = librosa.feature.mfcc(y=fragmento_obra, sr=sample_rate, hop_length=hop_length)
-                    mfcc_fragmento_mean = np.mean(mfcc_fragmento, axis=1)
-                    mfcc_original = librosa.feature.mfcc(y=y_orig, sr=sample_rate, hop_length=hop_length)
-                    mfcc_original_mean = np.mean(mfcc_original, axis=1)
-                    dist_original = cosine(mfcc_original_mean, mfcc_fragmento_mean)
-
-                    # Guarda el archivo original
-                    nombre_original_guardado = filename.replace(".wav", "_original.wav")
-                    sf.write(os.path.join(output_folder, nombre_original_guardado), y_orig, sample_rate)
-
-                    # Escribe en el CSV
-                    minutos = int(seg_inicio // 60)
-                    segundos = int(seg_inicio % 60)
-                    writer.writerow([filename, factor, f"{minutos}:{segundos:02d}", f"{dist_original:.4f}"])
-                    print(f"✅ {filename} (x{factor}) → Coincidencia en {minutos}:{segundos:02d} con distancia = {dist_original:.4f}")
-                else:
-                    print(f"❌ No se encontró coincidencia para {filename} con stretch {factor}")
+                # El tramo de la obra dura `factor` veces la muestra
+                seg_inicio = mejor_coincidencia * hop_length / sample_rate
+                muestra_inicio = int(seg_inicio * sample_rate)
+                fragmento_obra = obra[muestra_inicio:muestra_inicio + int(round(len(y_orig) * factor))]
+                fragment_name = filename.replace(".wav", "_fragmento_obra_multiescala.wav")
+                with etapa("escritura"):
+                    sf.write(os.path.join(output_folder, fragment_name), fragmento_obra, sample_rate)
+                contar_bytes(os.path.join(output_folder, fragment_name))
+
+                # Distancia con la muestra
+                mfcc_fragmento = librosa.feature.mfcc(y=fragmento_obra, sr=sample_rate, hop_length=hop_length)
+                dist_original = cosine(np.mean(mfcc_original, axis=1), np.mean(mfcc_fragmento, axis=1))
+
+                minutos = int(seg_inicio // 60)
+                segundos = int(seg_inicio % 60)
+                writer.writerow([filename, f"{factor:.3f}", f"{minutos}:{segundos:02d}", f"{dist_original:.4f}"])
+                print(f"✅ {filename} (x{factor:.3f} estimado) → Coincidencia en {minutos}:{segundos:02d} con distancia = {dist_original:.4f}")
+    else:
+        # Variantes en el dominio de los MFCC: un solo análisis por muestra para todos los factores
+        variantes_por_archivo = {}
+        if variantes_en_mfcc:
+            for filename in os.listdir(muestras_folder):
+                if filename.endswith(".wav"):
+                    y_orig, _ = librosa.load(os.path.join(muestras_folder, filename), sr=sample_rate)
+                    variantes_por_archivo[filename] = variantes_time_stretch(y_orig, sample_rate, stretch_factors, hop_length=hop_length)
+        filas_precision = []
+
+        # Procesa cada factor de time stretch
+        for factor in stretch_factors:
+            factor_str = str(factor).replace(".", "_")
+            output_folder = os.path.join(output_root, f"Stretch_{factor_str}")
+            os.makedirs(output_folder, exist_ok=True)
+
+            # Procesa cada archivo .wav dentro de muestras_timestretch
+            for filename in os.listdir(muestras_folder):
+                if filename.endswith(".wav"):
+                    ruta_original = os.path.join(muestras_folder, filename)
+                    y_orig, _ = librosa.load(ruta_original, sr=sample_rate)
+
+                    if variantes_en_mfcc:
+                        # MFCC de la variante ya calculados; no se genera ni se guarda el audio estirado
+                        mfcc_muestra, n_muestras_stretch = variantes_por_archivo[filename][factor]
+                        if informe_precision_variantes:
+                            y_stretched = librosa.effects.time_stretch(y_orig, rate=1.0/factor)
+                            mfcc_audio = librosa.feature.mfcc(y=y_stretched, sr=sample_rate, hop_length=hop_length)
+                            filas_precision.append([filename, factor, *comparar_mfcc(mfcc_muestra, mfcc_audio)])
+                    else:
+                        # Aplica time stretch
+                        try:
+                            with etapa("time stretch", factor=factor):
+                                y_stretched = librosa.effects.time_stretch(y_orig, rate=1.0/factor)
+                        except Exception as e:
+                            print(f"⚠️ Error al aplicar stretch a {filename} (factor {factor}): {e}")
+                            continue
+
+                        # Guarda el audio estirado
+                        stretched_name = filename.replace(".wav", f"_stretch{factor_str}.wav")
+                        ruta_stretched = os.path.join(output_folder, stretched_name)
+                        with etapa("escritura"):
+                            sf.write(ruta_stretched, y_stretched, sample_rate)
+                        contar_bytes(ruta_stretched)
+
+                        # Calcula MFCCs
+                        mfcc_muestra = librosa.feature.mfcc(y=y_stretched, sr=sample_rate, hop_length=hop_length)
+                        n_muestras_stretch = len(y_stretched)
+
+                    # Busca la mejor coincidencia dentro de la obra (todas las posiciones a la vez)
+                    with etapa("búsqueda coseno", factor=factor):
+                        curva_distancias = curva_distancia_coseno(mfcc_obra, mfcc_muestra)
+                        mejor_coincidencia, mejor_distancia = posicion_minima(curva_distancias)
+                    contar("ventanas evaluadas", len(curva_distancias))
+
+                    if mejor_coincidencia is not None:
+                        seg_inicio = mejor_coincidencia * hop_length / sample_rate
+                        muestra_inicio = int(seg_inicio * sample_rate)
+                        muestra_fin = muestra_inicio + n_muestras_stretch
+                        fragmento_obra = obra[muestra_inicio:muestra_fin]
+
+                        # Guarda el fragmento encontrado en la obra
+                        fragment_name = filename.replace(".wav", f"_fragmento_obra_stretch{factor_str}.wav")
+                        ruta_fragmento = os.path.join(output_folder, fragment_name)
+                        with etapa("escritura"):
+                            sf.write(ruta_fragmento, fragmento_obra, sample_rate)
+                        contar_bytes(ruta_fragmento)
+
+                        # Calcula la distancia con el original (sin stretch)
+                        mfcc_fragmento = librosa.feature.mfcc(y=fragmento_obra, sr=sample_rate, hop_length=hop_length)
+                        mfcc_fragmento_mean = np.mean(mfcc_fragmento, axis=1)
+                        mfcc_original = librosa.feature.mfcc(y=y_orig, sr=sample_rate, hop_length=hop_length)
+                        mfcc_original_mean = np.mean(mfcc_original, axis=1)
+                        dist_original = cosine(mfcc_original_mean, mfcc_fragmento_mean)
+
+                        # Guarda el archivo original
+                        nombre_original_guardado = filename.replace(".wav", "_original.wav")
+                        sf.write(os.path.join(output_folder, nombre_original_guardado), y_orig, sample_rate)
+
+                        # Escribe en el CSV
+                        minutos = int(seg_inicio // 60)
+                        segundos = int(seg_inicio % 60)
+                        writer.writerow([filename, factor, f"{minutos}:{segundos:02d}", f"{dist_original:.4f}"])
+                        print(f"✅ {filename} (x{factor}) → Coincidencia en {minutos}:{segundos:02d} con distancia = {dist_original:.4f}")
+                    else:
+                        print(f"❌ No se encontró coincidencia para {filename} con stretch {factor}")
+
+# Informe de precisión de las variantes en el dominio de los MFCC frente al audio estirado
+if filas_precision:
+    with open(os.path.join(output_root, "precision_variantes.csv"), mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["Archivo original", "Factor", "Distancia coseno con la variante de audio", "Error relativo"])
+        for archivo, factor, coseno, error in filas_precision:
+            writer.writerow([archivo, factor, f"{coseno:.4f}", f"{error:.4f}"])
+exportar(output_root)
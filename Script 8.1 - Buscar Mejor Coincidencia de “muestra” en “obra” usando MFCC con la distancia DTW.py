@@ -4,74 +4,119 @@ import soundfile as sf
 import os
 import csv
 import matplotlib.pyplot as plt
-from fastdtw import fastdtw
-from scipy.spatial.distance import euclidean
+from herramientas.busqueda_dtw import PodaDTW, dtw_subsecuencia
+from herramientas.cadena_efectos import CadenaEfectos, EtapaFiltro, EtapaMFCC
+from herramientas.extraccion_mfcc import AudioEnDisco, mfcc_por_bloques
+from herramientas.instrumentacion import Progreso, activar, contar, contar_bytes, etapa, exportar
 
 # ====== PARÁMETROS ======
 sample_rate = 22050
 hop_length = 512
+obra_por_bloques = False   # True: MFCC de la obra por bloques, sin cargar todo el audio (obras largas)
+memoria_max_mb = 64        # Memoria máxima de cada bloque en la extracción por bloques
 window_duration_sec = 3.0
 step_fast_ms = 1000
 step_slow_ms = 10
 threshold = 300  # Umbral DTW para buscar retroactivamente
+modo_dtw = 'subsecuencia'  # 'subsecuencia' (una pasada sobre toda la obra) o 'ventanas'
 entrada_folder = os.path.expanduser("~/Desktop/Salida_HPF_420Hz")
+usar_cadena = False        # True: se leen los originales y el HPF se aplica en memoria (sin pasar por entrada_folder)
+carpeta_originales = os.path.expanduser("~/Desktop/Entrada_HPF")
+corte_hpf_cadena = 420     # Hz, como en el Script 9.2
+orden_hpf_cadena = 4
 obra_path = os.path.expanduser("~/Desktop/obra.wav")
 output_base = os.path.expanduser("~/Desktop/Coincidencias_Batch_420_DTW")
 os.makedirs(output_base, exist_ok=True)
+instrumentar = False       # Tiempo por etapa, contadores, ritmo y picos de memoria en instrumentacion.json (y traza para chrome://tracing)
+instrumentar_memoria_python = False  # Además, pico de memoria reservada desde Python (tracemalloc; ralentiza la ejecución)
 
 # ====== FUNCIONES AUXILIARES ======
 def ms_to_frames(ms, sr=sample_rate, hop=hop_length):
     return int((ms / 1000) * sr / hop)
 
-def dtw_distance(mfcc1, mfcc2):
-    dist, _ = fastdtw(mfcc1.T, mfcc2.T, dist=euclidean)
-    return dist
-
 # ====== CARGA DE OBRA ======
-obra, _ = librosa.load(obra_path, sr=sample_rate)
-mfcc_obra = librosa.feature.mfcc(y=obra, sr=sample_rate, hop_length=hop_length)
+if instrumentar:
+    activar(instrumentar_memoria_python)
+if obra_por_bloques:
+    # El audio de la obra no se carga entero: solo se leen de disco los fragmentos que se guardan
+    with etapa("mfcc obra por bloques"):
+        mfcc_obra, _, n_muestras_obra = mfcc_por_bloques(obra_path, sr=sample_rate, hop_length=hop_length, memoria_max_mb=memoria_max_mb)
+    obra = AudioEnDisco(obra_path, sample_rate, n_muestras_obra)
+else:
+    with etapa("carga obra"):
+        obra, _ = librosa.load(obra_path, sr=sample_rate)
+    with etapa("mfcc obra"):
+        mfcc_obra = librosa.feature.mfcc(y=obra, sr=sample_rate, hop_length=hop_length)
 obra_frames = mfcc_obra.shape[1]
 
 # ====== PROCESAMIENTO POR ARCHIVO ======
 distancias_dtw = []
 
-for nombre_archivo in os.listdir(entrada_folder):
-    if not nombre_archivo.endswith(".wav"):
-        continue
-
-    ruta_archivo = os.path.join(entrada_folder, nombre_archivo)
-    muestra, _ = librosa.load(ruta_archivo, sr=sample_rate)
-    mfcc_muestra = librosa.feature.mfcc(y=muestra, sr=sample_rate, hop_length=hop_length)
+# Con la cadena, cada original se remuestrea una sola vez a sample_rate y se
+# filtra y analiza en memoria, bloque a bloque
+if usar_cadena:
+    etapa_mfcc = EtapaMFCC(n_mfcc=20, hop_length=hop_length)
+    cadena = CadenaEfectos([EtapaFiltro(corte_hpf_cadena, orden_hpf_cadena, 'high'), etapa_mfcc], sample_rate)
+carpeta_muestras = carpeta_originales if usar_cadena else entrada_folder
+archivos = [nombre_archivo for nombre_archivo in os.listdir(carpeta_muestras) if nombre_archivo.endswith(".wav")]
+progreso = Progreso("muestras", len(archivos))
+
+for nombre_archivo in archivos:
+    ruta_archivo = os.path.join(carpeta_muestras, nombre_archivo)
+    with etapa("muestra (carga y mfcc)", muestra=nombre_archivo):
+        if usar_cadena:
+            muestra = cadena.procesar_archivo(ruta_archivo)
+            mfcc_muestra = etapa_mfcc.mfcc
+        else:
+            muestra, _ = librosa.load(ruta_archivo, sr=sample_rate)
+            mfcc_muestra = librosa.feature.mfcc(y=muestra, sr=sample_rate, hop_length=hop_length)
     muestra_frames = mfcc_muestra.shape[1]
 
-    step_fast = ms_to_frames(step_fast_ms)
-    step_slow = ms_to_frames(step_slow_ms)
-
-    mejor_coincidencia = None
-    mejor_distancia = float('inf')
-    i = 0
-    while i + muestra_frames <= obra_frames:
-        fragmento = mfcc_obra[:, i:i+muestra_frames]
-        dist = dtw_distance(mfcc_muestra, fragmento)
-
-        if dist < mejor_distancia:
-            mejor_distancia = dist
-            mejor_coincidencia = i
-
-        if dist < threshold:
-            j = i
-            while j > 0:
-                anterior = mfcc_obra[:, max(j-step_slow, 0):max(j-step_slow, 0)+muestra_frames]
-                dist_anterior = dtw_distance(mfcc_muestra, anterior)
-                if dist_anterior < dist:
-                    dist = dist_anterior
-                    mejor_distancia = dist_anterior
-                    mejor_coincidencia = max(j-step_slow, 0)
-                    j -= step_slow
-                else:
+    if modo_dtw == 'subsecuencia':
+        # DTW de subsecuencia: una sola pasada sobre toda la obra con resolución de un frame
+        with etapa("dtw subsecuencia", muestra=nombre_archivo):
+            finales, inicios, costes = dtw_subsecuencia(mfcc_muestra, mfcc_obra, normalizar=False)
+        contar("llamadas DTW")
+        contar("celdas DTW", muestra_frames * obra_frames)
+        mejor_coincidencia = int(inicios[0]) if len(inicios) else None
+        mejor_distancia = float(costes[0]) if len(costes) else float('inf')
+    else:
+        step_fast = ms_to_frames(step_fast_ms)
+        step_slow = ms_to_frames(step_slow_ms)
+
+        # Cascada LB_Kim / LB_Keogh / abandono anticipado delante del DTW: las ventanas
+        # que no pueden mejorar la mejor distancia se descartan sin calcular el DTW completo
+        poda = PodaDTW(mfcc_muestra)
+
+        mejor_coincidencia = None
+        mejor_distancia = float('inf')
+        i = 0
+        with etapa("dtw por ventanas", muestra=nombre_archivo):
+            while i + muestra_frames <= obra_frames:
+                fragmento = mfcc_obra[:, i:i+muestra_frames]
+                dist = poda.distancia(fragmento, mejor_distancia)
+
+                if dist < mejor_distancia:
+                    mejor_distancia = dist
+                    mejor_coincidencia = i
+
+                if dist < threshold:
+                    j = i
+                    while j > 0:
+                        anterior = mfcc_obra[:, max(j-step_slow, 0):max(j-step_slow, 0)+muestra_frames]
+                        dist_anterior = poda.distancia(anterior, dist)
+                        if dist_anterior < dist:
+                            dist = dist_anterior
+                            mejor_distancia = dist_anterior
+                            mejor_coincidencia = max(j-step_slow, 0)
+                            j -= step_slow
+                        else:
+                            break
                     break
-            break
-        i += step_fast
+                i += step_fast
+        contar("ventanas evaluadas", poda.estadisticas['candidatos'])
+        contar("llamadas DTW", poda.estadisticas['dtw_completos'] + poda.estadisticas['abandonados'])
+        print(f"[{os.path.splitext(nombre_archivo)[0]}] Poda DTW: {poda.resumen()}")
 
     # === GUARDADO DE RESULTADOS ===
     nombre_base = os.path.splitext(nombre_archivo)[0]
@@ -87,10 +132,14 @@ for nombre_archivo in os.listdir(entrada_folder):
 
         # Guarda el fragmento coincidente
         ruta_fragmento = os.path.join(output_folder, f"correspondencia_{nombre_base}.wav")
-        sf.write(ruta_fragmento, fragmento_audio, sample_rate)
+        ruta_original = os.path.join(output_folder, f"original_{nombre_base}.wav")
+        with etapa("escritura"):
+            sf.write(ruta_fragmento, fragmento_audio, sample_rate)
 
-        # Guarda los audios original y muestra
-        sf.write(os.path.join(output_folder, f"original_{nombre_base}.wav"), muestra, sample_rate)
+            # Guarda los audios original y muestra
+            sf.write(ruta_original, muestra, sample_rate)
+        contar_bytes(ruta_fragmento)
+        contar_bytes(ruta_original)
 
         # CSV
         ruta_csv = os.path.join(output_folder, "coincidencia.csv")
@@ -106,6 +155,7 @@ for nombre_archivo in os.listdir(entrada_folder):
     else:
         print(f"[{nombre_base}] No se encontró coincidencia.")
         distancias_dtw.append(None)
+    progreso.avanzar()
 
 # ====== DIAGRAMA DE BARRAS ======
 distancias_validas = [d for d in distancias_dtw if d is not None]
@@ -120,5 +170,6 @@ plt.ylabel("Número de archivos")
 plt.xticks(rotation=45)
 plt.tight_layout()
 plt.savefig(os.path.join(output_base, "histograma_distancias.png"))
+exportar(output_base)
 plt.show()
 
@@ -3,19 +3,27 @@ import numpy as np
 import soundfile as sf
 import csv
 import os
-from librosa.sequence import dtw
+from herramientas.busqueda_chroma import calcular_chroma, estimar_transposicion, invariantes_chroma, semitonos_con_signo
+from herramientas.busqueda_dtw import dtw_subsecuencia
+from herramientas.extraccion_mfcc import AudioEnDisco, chroma_por_bloques, mfcc_por_bloques
+from herramientas.instrumentacion import activar, contar, contar_bytes, etapa, exportar
+from herramientas.variantes_mfcc import comparar_mfcc, variantes_pitch_shift
 
 # Parámetros
 sample_rate = 22050
 hop_length = 512
+obra_por_bloques = False   # True: MFCC de la obra por bloques, sin cargar todo el audio (obras largas)
+memoria_max_mb = 64        # Memoria máxima de cada bloque en la extracción por bloques
 window_duration_sec = 3.0
-step_fast_ms = 100
-step_slow_ms = 10
 semitones_list = [-1, 3, -6, 12]  # Cambios de pitch
-
-
-def ms_to_frames(ms, sr=sample_rate, hop=hop_length):
-    return int((ms / 1000) * sr / hop)
+modo_busqueda = 'mfcc'     # 'mfcc': una búsqueda por cada valor de semitones_list; 'chroma': una sola búsqueda
+                           # por muestra, invariante a la transposición, que estima los semitonos (módulo 12).
+                           # En los dos modos, "Semitonos" es el cambio que hay que aplicar a la muestra para
+                           # llegar a la obra (una muestra 3 semitonos por encima de la obra da -3)
+variantes_en_mfcc = False           # True: las variantes se crean en el dominio de los MFCC (sin pitch_shift del audio)
+informe_precision_variantes = False # Con variantes_en_mfcc, compara cada variante con la del audio transportado
+instrumentar = False                # Tiempo por etapa, contadores y picos de memoria en instrumentacion.json (y traza para chrome://tracing)
+instrumentar_memoria_python = False  # Además, pico de memoria reservada desde Python (tracemalloc; ralentiza la ejecución)
 
 
 # Rutas
@@ -24,18 +32,36 @@ carpeta_entrada = os.path.join(escritorio, "muestras_pitchshift")
 carpeta_resultados = os.path.join(escritorio, "Resultados_PitchShift")
 os.makedirs(carpeta_resultados, exist_ok=True)
 
-obra_path = os.path.join(escritorio, "obra.wav")
-obra, _ = librosa.load(obra_path, sr=sample_rate)
-mfcc_obra = librosa.feature.mfcc(y=obra, sr=sample_rate, hop_length=hop_length)
-obra_frames = mfcc_obra.shape[1]
+if instrumentar:
+    activar(instrumentar_memoria_python)
 
-step_fast = ms_to_frames(step_fast_ms)
-step_slow = ms_to_frames(step_slow_ms)
+obra_path = os.path.join(escritorio, "obra.wav")
+if obra_por_bloques:
+    # El audio de la obra no se carga entero: solo se leen de disco los fragmentos que se guardan
+    with etapa(f"{modo_busqueda} obra por bloques"):
+        if modo_busqueda == 'chroma':
+            chroma_obra, _, n_muestras_obra = chroma_por_bloques(obra_path, sr=sample_rate, hop_length=hop_length, memoria_max_mb=memoria_max_mb)
+        else:
+            mfcc_obra, _, n_muestras_obra = mfcc_por_bloques(obra_path, sr=sample_rate, hop_length=hop_length, memoria_max_mb=memoria_max_mb)
+    obra = AudioEnDisco(obra_path, sample_rate, n_muestras_obra)
+else:
+    with etapa("carga obra"):
+        obra, _ = librosa.load(obra_path, sr=sample_rate)
+    with etapa(f"{modo_busqueda} obra"):
+        if modo_busqueda == 'chroma':
+            chroma_obra = calcular_chroma(obra, sample_rate, hop_length=hop_length)
+        else:
+            mfcc_obra = librosa.feature.mfcc(y=obra, sr=sample_rate, hop_length=hop_length)
+obra_frames = (chroma_obra if modo_busqueda == 'chroma' else mfcc_obra).shape[1]
+if modo_busqueda == 'chroma':
+    # Características invariantes a la transposición para el DTW
+    invariantes_obra = invariantes_chroma(chroma_obra)
 
 # Archivo CSV
 csv_path = os.path.join(carpeta_resultados, "resultados.csv")
 with open(csv_path, mode='w', newline='') as csv_file:
     writer = csv.writer(csv_file)
+    filas_precision = []
     writer.writerow(["Archivo original", "Semitonos", "Inicio (min:seg)", "Distancia DTW"])
 
     # Itera sobre todos los archivos .wav en la carpeta de entrada
@@ -43,33 +69,52 @@ with open(csv_path, mode='w', newline='') as csv_file:
         if archivo.endswith(".wav"):
             ruta_original = os.path.join(carpeta_entrada, archivo)
             muestra_original, _ = librosa.load(ruta_original, sr=sample_rate)
-
-            for semitonos in semitones_list:
-                # Aplica pitch shift
-                muestra_shifted = librosa.effects.pitch_shift(muestra_original, sr=sample_rate, n_steps=semitonos)
-                nombre_modificado = f"{os.path.splitext(archivo)[0]}_Pitch{semitonos:+d}.wav"
-                ruta_modificada = os.path.join(carpeta_resultados, nombre_modificado)
-                sf.write(ruta_modificada, muestra_shifted, sample_rate)
-
-                # Calcula MFCCs
-                mfcc_muestra = librosa.feature.mfcc(y=muestra_shifted, sr=sample_rate, hop_length=hop_length)
-                muestra_frames = mfcc_muestra.shape[1]
-
-                # Búsqueda de mejor coincidencia en "obra"
-                mejor_distancia = float('inf')
-                mejor_coincidencia = None
-                i = 0
-                while i + muestra_frames <= obra_frames:
-                    fragmento = mfcc_obra[:, i:i + muestra_frames]
-
-                    # DTW entre MFCCs (transpuesta requerida: shape [frames, features])
-                    D, wp = dtw(mfcc_muestra.T, fragmento.T, subseq=True)
-                    distancia = D[-1, -1] / len(wp)  # Normalización por longitud del camino
-
-                    if distancia < mejor_distancia:
-                        mejor_distancia = distancia
-                        mejor_coincidencia = i
-                    i += step_fast
+            if variantes_en_mfcc and modo_busqueda == 'mfcc':
+                # Un solo análisis de la muestra para todos los cambios de pitch
+                variantes = variantes_pitch_shift(muestra_original, sample_rate, semitones_list, hop_length=hop_length)
+
+            # En modo chroma hay una sola búsqueda por muestra para todas las transposiciones
+            for semitonos in (semitones_list if modo_busqueda == 'mfcc' else [None]):
+                if modo_busqueda == 'chroma':
+                    chroma_muestra = calcular_chroma(muestra_original, sample_rate, hop_length=hop_length)
+                elif variantes_en_mfcc:
+                    # MFCC de la variante ya calculados; no se genera ni se guarda el audio transportado
+                    mfcc_muestra = variantes[semitonos]
+                    if informe_precision_variantes:
+                        muestra_shifted = librosa.effects.pitch_shift(muestra_original, sr=sample_rate, n_steps=semitonos)
+                        mfcc_audio = librosa.feature.mfcc(y=muestra_shifted, sr=sample_rate, hop_length=hop_length)
+                        filas_precision.append([archivo, semitonos, *comparar_mfcc(mfcc_muestra, mfcc_audio)])
+                else:
+                    # Aplica pitch shift
+                    with etapa("pitch shift", semitonos=semitonos):
+                        muestra_shifted = librosa.effects.pitch_shift(muestra_original, sr=sample_rate, n_steps=semitonos)
+                    nombre_modificado = f"{os.path.splitext(archivo)[0]}_Pitch{semitonos:+d}.wav"
+                    ruta_modificada = os.path.join(carpeta_resultados, nombre_modificado)
+                    with etapa("escritura"):
+                        sf.write(ruta_modificada, muestra_shifted, sample_rate)
+                    contar_bytes(ruta_modificada)
+
+                    # Calcula MFCCs
+                    mfcc_muestra = librosa.feature.mfcc(y=muestra_shifted, sr=sample_rate, hop_length=hop_length)
+
+                # Búsqueda de mejor coincidencia en "obra": DTW de subsecuencia sobre toda la obra
+                # en una sola pasada (coste normalizado por la longitud del camino)
+                with etapa("dtw subsecuencia", muestra=archivo):
+                    if modo_busqueda == 'chroma':
+                        # Sobre el módulo de la DFT del chroma, igual para cualquier transposición;
+                        # los semitonos se estiman después alrededor del tramo encontrado
+                        finales, inicios, costes = dtw_subsecuencia(invariantes_chroma(chroma_muestra), invariantes_obra)
+                        if len(inicios):
+                            margen = chroma_muestra.shape[1]
+                            tramo = chroma_obra[:, max(0, inicios[0] - margen):finales[0] + margen]
+                            # Transposición de la muestra respecto a la obra; el cambio que la iguala es el opuesto
+                            semitonos = semitonos_con_signo(-estimar_transposicion(chroma_muestra, tramo))
+                    else:
+                        finales, inicios, costes = dtw_subsecuencia(mfcc_muestra, mfcc_obra)
+                contar("llamadas DTW")
+                contar("celdas DTW", (chroma_muestra if modo_busqueda == 'chroma' else mfcc_muestra).shape[1] * obra_frames)
+                mejor_coincidencia = int(inicios[0]) if len(inicios) else None
+                mejor_distancia = float(costes[0]) if len(costes) else float('inf')
 
                 # Extrae el fragmento encontrado en "obra"
                 if mejor_coincidencia is not None:
@@ -84,12 +129,24 @@ with open(csv_path, mode='w', newline='') as csv_file:
                     ruta_original_out = os.path.join(carpeta_resultados, f"{nombre_base}_Original.wav")
                     ruta_fragmento_out = os.path.join(carpeta_resultados,
                                                       f"{nombre_base}_Coincidencia_Pitch{semitonos:+d}.wav")
-                    sf.write(ruta_original_out, muestra_original, sample_rate)
-                    sf.write(ruta_fragmento_out, fragmento_audio, sample_rate)
+                    with etapa("escritura"):
+                        sf.write(ruta_original_out, muestra_original, sample_rate)
+                        sf.write(ruta_fragmento_out, fragmento_audio, sample_rate)
+                    contar_bytes(ruta_original_out)
+                    contar_bytes(ruta_fragmento_out)
 
                     # Escribe resultados en CSV
                     minutos = int(tiempo_inicio_seg // 60)
                     segundos = int(tiempo_inicio_seg % 60)
                     writer.writerow([archivo, semitonos, f"{minutos}:{segundos:02d}", f"{mejor_distancia:.4f}"])
 
-print(f"✅ Proceso completado. Resultados guardados en: {csv_path}”)
+# Informe de precisión de las variantes en el dominio de los MFCC frente al audio transportado
+if filas_precision:
+    with open(os.path.join(carpeta_resultados, "precision_variantes.csv"), mode='w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["Archivo original", "Semitonos", "Distancia coseno con la variante de audio", "Error relativo"])
+        for archivo, semitonos, coseno, error in filas_precision:
+            writer.writerow([archivo, semitonos, f"{coseno:.4f}", f"{error:.4f}"])
+
+print(f"✅ Proceso completado. Resultados guardados en: {csv_path}")
+exportar(carpeta_resultados)
@@ -1,37 +1,50 @@
 import os
-import librosa
-import soundfile as sf
-from scipy.signal import butter, lfilter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from herramientas.filtros import filtrar_archivo
+from herramientas.instrumentacion import Progreso, activar, contar_bytes, etapa, exportar
 
 # ---------------------- CONFIGURACIÓN ----------------------
 frecuencia_corte = 1200   # Hz
 orden_filtro = 4          # Orden del filtro LPF (orden 4 ≈ -24 dB/octava)
-sample_rate = 44100       # Frecuencia de muestreo a usar o forzar
+sample_rate = 44100       # Frecuencia de muestreo a usar o forzar (None = la del archivo)
+tamano_bloque = 65536     # Muestras por bloque (la memoria no depende de la duración del archivo)
+num_procesos = 4          # Archivos filtrados en paralelo (1 = en serie)
+instrumentar = False      # Tiempo, bytes escritos y picos de memoria en instrumentacion.json (y traza para chrome://tracing)
+instrumentar_memoria_python = False  # Además, pico de memoria reservada desde Python (tracemalloc; ralentiza la ejecución)
 # -----------------------------------------------------------
 
-def aplicar_lpf(audio, sr, freq_corte, orden):
-    nyquist = 0.5 * sr
-    normal_corte = freq_corte / nyquist
-    b, a = butter(orden, normal_corte, btype='low', analog=False)
-    return lfilter(b, a, audio)
-
-# Rutas
-carpeta_entrada = os.path.expanduser("~/Desktop/Entrada_LPF")
-nombre_salida = f"Salida_LPF_{frecuencia_corte}Hz"
-carpeta_salida = os.path.expanduser(f"~/Desktop/{nombre_salida}")
-os.makedirs(carpeta_salida, exist_ok=True)
+if __name__ == "__main__":
+    if instrumentar:
+        activar(instrumentar_memoria_python)
 
-# Procesamiento
-for archivo in os.listdir(carpeta_entrada):
-    if archivo.lower().endswith('.wav'):
-        ruta_entrada = os.path.join(carpeta_entrada, archivo)
-        audio, sr = librosa.load(ruta_entrada, sr=sample_rate)
-        audio_filtrado = aplicar_lpf(audio, sr, frecuencia_corte, orden_filtro)
+    # Rutas
+    carpeta_entrada = os.path.expanduser("~/Desktop/Entrada_LPF")
+    nombre_salida = f"Salida_LPF_{frecuencia_corte}Hz"
+    carpeta_salida = os.path.expanduser(f"~/Desktop/{nombre_salida}")
+    os.makedirs(carpeta_salida, exist_ok=True)
 
-        nombre_archivo_salida = f"{os.path.splitext(archivo)[0]}_LPF_{frecuencia_corte}Hz.wav"
-        ruta_salida = os.path.join(carpeta_salida, nombre_archivo_salida)
+    # Procesamiento: cada archivo se filtra por bloques en SOS, con todos sus canales
+    archivos = [archivo for archivo in os.listdir(carpeta_entrada) if archivo.lower().endswith('.wav')]
+    rutas_entrada = [os.path.join(carpeta_entrada, archivo) for archivo in archivos]
+    rutas_salida = [os.path.join(carpeta_salida, f"{os.path.splitext(archivo)[0]}_LPF_{frecuencia_corte}Hz.wav") for archivo in archivos]
+    filtrar = partial(filtrar_archivo, freq_corte=frecuencia_corte, orden=orden_filtro, tipo='low',
+                      sr=sample_rate, tamano_bloque=tamano_bloque)
 
-        sf.write(ruta_salida, audio_filtrado, sr)
-        print(f"Guardado: {ruta_salida}")
+    progreso = Progreso("archivos", len(archivos))
+    with etapa("filtrado", archivos=len(archivos)):
+        if num_procesos > 1 and len(archivos) > 1:
+            with ProcessPoolExecutor(max_workers=num_procesos) as ejecutor:
+                for ruta_salida in ejecutor.map(filtrar, rutas_entrada, rutas_salida):
+                    print(f"Guardado: {ruta_salida}")
+                    contar_bytes(ruta_salida)
+                    progreso.avanzar()
+        else:
+            for ruta_salida in map(filtrar, rutas_entrada, rutas_salida):
+                print(f"Guardado: {ruta_salida}")
+                contar_bytes(ruta_salida)
+                progreso.avanzar()
 
-print("\n✅ Proceso completado.")
+    print("\n✅ Proceso completado.")
+    exportar(carpeta_salida)
@@ -0,0 +1 @@
+# Funciones compartidas por los scripts de búsqueda, análisis y efectos.
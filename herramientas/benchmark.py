@@ -0,0 +1,63 @@
+import json
+import os
+import time
+import tracemalloc
+
+
+def medir(funcion, repeticiones=3):
+    # Ejecuta funcion() una vez para calentar (compilación de numba, cachés de
+    # bases mel...) y `repeticiones` veces más. Devuelve (resultado, mejor
+    # tiempo en s, pico de memoria en MB). El pico se mide con tracemalloc en
+    # una ejecución aparte para que su sobrecoste no cuente en el tiempo
+    funcion()
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    tracemalloc.start()
+    try:
+        funcion()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return resultado, mejor, pico / 2 ** 20
+
+
+def clave_caso(algoritmo, duracion_obra, duracion_muestra=None, transformacion="original"):
+    partes = [algoritmo, f"obra_{duracion_obra}s"]
+    if duracion_muestra is not None:
+        partes += [f"muestra_{duracion_muestra}s", transformacion]
+    return "/".join(partes)
+
+
+def guardar_resultados(resultados, ruta):
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+def cargar_resultados(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def regresiones(resultados, linea_base, tolerancia_tiempo=0.25, tolerancia_memoria=0.25, tolerancia_aciertos=0.0,
+                margen_tiempo_s=0.005, margen_memoria_mb=1.0):
+    # Casos que empeoran respecto a la línea base: tiempo o pico de memoria más
+    # de un `tolerancia_*` relativo (y del margen absoluto, para que el ruido de
+    # los casos de pocos milisegundos no cuente) por encima, o tasa de aciertos
+    # más de `tolerancia_aciertos` (absoluto) por debajo. Solo se comparan los
+    # casos presentes en ambos. Los tiempos dependen de la máquina: la línea
+    # base hay que generarla en la misma en que se compara. Devuelve una lista de mensajes
+    mensajes = []
+    for clave in sorted(resultados.keys() & linea_base.keys()):
+        actual, base = resultados[clave], linea_base[clave]
+        if actual["tiempo_s"] > base["tiempo_s"] * (1 + tolerancia_tiempo) + margen_tiempo_s:
+            mensajes.append(f"{clave}: tiempo {actual['tiempo_s']:.4f} s (línea base {base['tiempo_s']:.4f} s)")
+        if actual["pico_mb"] > base["pico_mb"] * (1 + tolerancia_memoria) + margen_memoria_mb:
+            mensajes.append(f"{clave}: memoria {actual['pico_mb']:.1f} MB (línea base {base['pico_mb']:.1f} MB)")
+        if actual.get("aciertos") is not None and base.get("aciertos") is not None:
+            if actual["aciertos"] < base["aciertos"] - tolerancia_aciertos:
+                mensajes.append(f"{clave}: aciertos {actual['aciertos']:.2f} (línea base {base['aciertos']:.2f})")
+    return mensajes
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+
+import librosa
+import numpy as np
+
+from herramientas.convolucion import particionar_ir
+from herramientas.filtros import FiltroSOS, disenar_sos
+
+
+def generar_impulso_spring(sr, decay, semilla=0):
+    rng = np.random.default_rng(semilla)
+    t = np.linspace(0, decay, int(sr * decay))
+    impulso = np.sin(2 * np.pi * 50 * t) * np.exp(-3 * t)  # 50 Hz base
+    impulso += np.sin(2 * np.pi * 120 * t) * np.exp(-4 * t)  # Harmònica
+    impulso += rng.normal(0, 0.05, len(t))  # soroll suau
+    return impulso / np.max(np.abs(impulso))
+
+
+def generar_impulso_plate(sr, decay, semilla=0):
+    rng = np.random.default_rng(semilla)
+    longitud = int(decay * sr)
+    impulso = rng.standard_normal(longitud)
+    impulso *= np.exp(-np.linspace(0, decay, longitud))  # Decaïment exponencial
+    impulso = np.convolve(impulso, np.ones(50) / 50, mode='same')  # Suavitza (filtre)
+    return impulso / np.max(np.abs(impulso))
+
+
+GENERADORES = {'spring': generar_impulso_spring, 'plate': generar_impulso_plate}
+
+# Versión de las IRs que genera este módulo: forma parte de la clave de la
+# caché de BibliotecaIR, así que hay que subirla al cambiar los generadores,
+# filtrar_ir o particionar_ir para que no se usen particiones antiguas
+VERSION_IR = 1
+
+
+def filtrar_ir(ir, sr, corte_hpf, orden=2):
+    # Pasa-altos de la IR (elimina graves) y normalización por el pico
+    if corte_hpf:
+        ir = FiltroSOS(disenar_sos(corte_hpf, sr, orden, 'high')).procesar(ir[:, np.newaxis])[:, 0]
+    return ir / np.max(np.abs(ir))
+
+
+class BibliotecaIR:
+    # Caché en disco de IRs ya particionadas en frecuencia (ver particionar_ir).
+    # Cada IR, sintética (con semilla) o leída de un archivo, se guarda como un
+    # .npy con sus particiones para una frecuencia de muestreo, un tamaño de
+    # bloque y un corte de pasa-altos dados, junto con un .json con esos
+    # parámetros. Las ejecuciones siguientes (y los procesos trabajadores) la
+    # abren con memmap sin recalcular nada. El nombre del archivo lleva un hash
+    # de todos los parámetros (con los valores exactos y VERSION_IR), de modo
+    # que dos IRs distintas nunca comparten archivo
+
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        os.makedirs(carpeta, exist_ok=True)
+
+    def _particiones(self, nombre, parametros, calcular_ir):
+        parametros = dict(parametros, version=VERSION_IR)
+        resumen = hashlib.sha1(json.dumps(parametros, sort_keys=True).encode()).hexdigest()[:10]
+        clave = f"{nombre}_{resumen}"
+        ruta = os.path.join(self.carpeta, f"{clave}.npy")
+        if not os.path.exists(ruta):
+            particiones = particionar_ir(calcular_ir(), parametros["tamano_bloque"])
+            # Se escribe con otro nombre y se renombra, por si otro proceso la lee a la vez
+            temporal = os.path.join(self.carpeta, f"{clave}.{os.getpid()}.tmp.npy")
+            np.save(temporal, particiones)
+            os.replace(temporal, ruta)
+            with open(os.path.join(self.carpeta, f"{clave}.json"), "w", encoding="utf-8") as f:
+                json.dump(parametros, f, ensure_ascii=False, indent=2)
+        return np.load(ruta, mmap_mode='r')
+
+    def sintetica(self, tipo, sr, decay, tamano_bloque, semilla=0, corte_hpf=None):
+        if tipo not in GENERADORES:
+            raise ValueError(f"Tipo de reverb no válido. Usa {' o '.join(repr(t) for t in GENERADORES)}.")
+        parametros = {"tipo": tipo, "sr": sr, "decay": decay, "semilla": semilla,
+                      "tamano_bloque": tamano_bloque, "corte_hpf": corte_hpf}
+        # El nombre solo es orientativo (decay redondeado a ms); lo distingue el hash de `parametros`
+        nombre = f"{tipo}_{round(decay * 1000)}ms_semilla{semilla}_{sr}Hz_b{tamano_bloque}_hpf{corte_hpf or 0}"
+        return self._particiones(nombre, parametros, lambda: filtrar_ir(GENERADORES[tipo](sr, decay, semilla), sr, corte_hpf))
+
+    def desde_archivo(self, ruta_ir, sr, tamano_bloque, corte_hpf=None):
+        # La clave incluye el tamaño y la fecha de modificación del archivo, así
+        # que una IR modificada se vuelve a particionar
+        estado = os.stat(ruta_ir)
+        huella = hashlib.sha1(f"{os.path.abspath(ruta_ir)}|{estado.st_size}|{estado.st_mtime_ns}".encode()).hexdigest()[:10]
+        parametros = {"archivo": os.path.abspath(ruta_ir), "sr": sr, "tamano_bloque": tamano_bloque, "corte_hpf": corte_hpf}
+        nombre = f"{os.path.splitext(os.path.basename(ruta_ir))[0]}_{huella}_{sr}Hz_b{tamano_bloque}_hpf{corte_hpf or 0}"
+
+        def cargar():
+            ir, _ = librosa.load(ruta_ir, sr=sr)
+            return filtrar_ir(ir.astype(np.float64), sr, corte_hpf)
+
+        return self._particiones(nombre, parametros, cargar)
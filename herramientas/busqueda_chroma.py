@@ -0,0 +1,73 @@
+import librosa
+import numpy as np
+from scipy.fft import fft, ifft, irfft, next_fast_len, rfft
+
+N_CHROMA = 12
+
+
+def calcular_chroma(y, sr, hop_length=512, n_fft=2048):
+    # Chroma sin estimación de afinación, igual que ExtractorChroma por bloques
+    return librosa.feature.chroma_stft(y=y, sr=sr, n_fft=n_fft, hop_length=hop_length, tuning=0.0)
+
+
+def semitonos_con_signo(desplazamiento):
+    # Clase de transposición 0..11 a semitonos entre -6 y +5. El chroma no
+    # distingue octavas: +12 semitonos es lo mismo que 0
+    return (int(desplazamiento) + N_CHROMA // 2) % N_CHROMA - N_CHROMA // 2
+
+
+def perfiles_transposicion(chroma_obra, chroma_muestra):
+    # Distancia del coseno entre el chroma aplanado (12 x frames) de la muestra
+    # y cada ventana de la obra, para las 12 transposiciones a la vez. La fila s
+    # es la de una muestra transportada s semitonos hacia arriba respecto a la
+    # obra (el chroma de la muestra es el de la obra rotado s bins). Las 12
+    # correlaciones salen de una sola FFT 2-D: lineal en el eje de frames y
+    # circular en el eje de pitch, con la muestra volteada en ambos. Transportar
+    # no cambia la norma de la muestra, así que las normas se comparten.
+    # Devuelve una matriz (12 x posiciones), vacía si la muestra es más larga que la obra
+    obra = np.asarray(chroma_obra, dtype=np.float64)
+    muestra = np.asarray(chroma_muestra, dtype=np.float64)
+    n = muestra.shape[1]
+    n_obra = obra.shape[1]
+    if n == 0 or n > n_obra:
+        return np.empty((N_CHROMA, 0))
+
+    n_fft = next_fast_len(n_obra + n - 1, real=True)
+    volteada = muestra[-np.arange(N_CHROMA) % N_CHROMA, ::-1]
+    espectro = fft(rfft(obra, n=n_fft, axis=1), axis=0) * fft(rfft(volteada, n=n_fft, axis=1), axis=0)
+    # correlacion[r, p] = suma de muestra[c, t] * obra[(c + r) % 12, p + t]
+    correlacion = irfft(ifft(espectro, axis=0), n=n_fft, axis=1)[:, n - 1:n_obra]
+    producto = correlacion[-np.arange(N_CHROMA) % N_CHROMA]
+
+    energia_acumulada = np.concatenate(([0.0], np.cumsum(np.sum(obra ** 2, axis=0))))
+    normas = np.sqrt(np.maximum(energia_acumulada[n:] - energia_acumulada[:-n], 0.0)) * np.linalg.norm(muestra)
+    perfiles = np.ones_like(producto)
+    validas = np.broadcast_to(normas > 0, producto.shape)
+    perfiles[validas] = 1.0 - (producto / np.where(normas > 0, normas, 1.0))[validas]
+    return perfiles
+
+
+def mejor_transposicion(perfiles):
+    # Posición (en frames), semitonos y distancia mínimos de los perfiles de
+    # perfiles_transposicion
+    if perfiles.shape[1] == 0:
+        return None, 0, float('inf')
+    desplazamiento, posicion = np.unravel_index(int(np.argmin(perfiles)), perfiles.shape)
+    return int(posicion), semitonos_con_signo(desplazamiento), float(perfiles[desplazamiento, posicion])
+
+
+def invariantes_chroma(chroma):
+    # Módulo de la DFT de cada frame de chroma a lo largo del eje de pitch
+    # (7 valores por frame): una rotación del chroma solo cambia la fase, así
+    # que es el mismo para cualquier transposición
+    return np.abs(np.fft.rfft(np.asarray(chroma, dtype=np.float64), axis=0))
+
+
+def estimar_transposicion(chroma_muestra, chroma_tramo):
+    # Semitonos que separan la muestra de un tramo de la obra: mejor
+    # transposición de perfiles_transposicion dentro del tramo. El camino de un
+    # DTW no fija bien el inicio, así que conviene pasar un tramo con margen
+    # alrededor de la coincidencia. Si el tramo es más corto que la muestra, se
+    # recorta la muestra
+    n = min(chroma_muestra.shape[1], chroma_tramo.shape[1])
+    return mejor_transposicion(perfiles_transposicion(chroma_tramo, chroma_muestra[:, :n]))[1]
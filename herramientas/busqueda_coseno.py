@@ -0,0 +1,199 @@
+
+import numpy as np
+from scipy.fft import irfft, next_fast_len, rfft
+
+from herramientas.variantes_mfcc import interpolar
+
+
+def sumas_acumuladas_frames(mfcc):
+    # Sumas acumuladas a lo largo del eje de frames, con una columna inicial de ceros
+    acumulada = np.zeros((mfcc.shape[0], mfcc.shape[1] + 1))
+    np.cumsum(mfcc, axis=1, out=acumulada[:, 1:])
+    return acumulada
+
+
+def medias_desde_acumuladas(acumulada, ventana_frames):
+    # Vector medio de cada ventana de `ventana_frames` frames (una por posición)
+    if ventana_frames <= 0 or ventana_frames > acumulada.shape[1] - 1:
+        return np.empty((acumulada.shape[0], 0))
+    return (acumulada[:, ventana_frames:] - acumulada[:, :-ventana_frames]) / ventana_frames
+
+
+def medias_ventanas(mfcc, ventana_frames):
+    # Vector medio de cada ventana de `ventana_frames` frames (una por posición),
+    # obtenido a partir de sumas acumuladas a lo largo del eje de frames
+    if ventana_frames <= 0 or ventana_frames > mfcc.shape[1]:
+        return np.empty((mfcc.shape[0], 0))
+    return medias_desde_acumuladas(sumas_acumuladas_frames(mfcc), ventana_frames)
+
+
+def curvas_distancia_coseno(mfcc_obra, medias_muestras, ventana_frames):
+    # Distancia del coseno entre varios vectores medios (uno por fila de
+    # `medias_muestras`) y la media de cada ventana de la obra, con resolución
+    # de un frame. Devuelve una matriz (muestras x posiciones)
+    return distancias_coseno_medias(medias_muestras, medias_ventanas(mfcc_obra, ventana_frames))
+
+
+def distancias_coseno_medias(medias_muestras, medias_obra):
+    # Distancia del coseno entre cada vector medio de las muestras y cada
+    # columna de `medias_obra` (muestras x posiciones)
+    medias_muestras = np.atleast_2d(medias_muestras)
+    producto = medias_muestras @ medias_obra
+    normas = np.outer(np.linalg.norm(medias_muestras, axis=1), np.linalg.norm(medias_obra, axis=0))
+    curvas = np.ones_like(producto)
+    validas = normas > 0
+    curvas[validas] = 1.0 - producto[validas] / normas[validas]
+    return curvas
+
+
+def curva_distancia_coseno(mfcc_obra, mfcc_muestra):
+    # Curva de distancias del coseno entre el MFCC medio de la muestra y el de
+    # cada ventana de la obra del mismo número de frames (posiciones 0..N-n)
+    media_muestra = np.mean(mfcc_muestra, axis=1)
+    return curvas_distancia_coseno(mfcc_obra, media_muestra, mfcc_muestra.shape[1])[0]
+
+
+def rejilla_factores(factor_min, factor_max, factores_por_octava=12):
+    # Factores de duración repartidos geométricamente entre factor_min y factor_max
+    n = max(1, int(np.ceil(np.log2(factor_max / factor_min) * factores_por_octava)))
+    return np.geomspace(factor_min, factor_max, n + 1)
+
+
+class ObraMultiescala:
+    # Búsqueda del MFCC medio de una muestra en la obra a varias escalas de
+    # tiempo sin modificar la muestra. Para cada factor f, la secuencia de
+    # frames de la obra se remuestrea (interpolación lineal) con paso f, de modo
+    # que una ventana de n frames remuestreados cubre n * f frames de la obra:
+    # el tramo de la obra que dura f veces la muestra. Las sumas acumuladas de
+    # cada secuencia remuestreada se calculan una sola vez y sirven para todas
+    # las muestras; cada búsqueda es una resta por factor. La memoria es la de
+    # una obra de sum(1 / f) veces su longitud
+
+    def __init__(self, mfcc_obra, factores):
+        obra = np.asarray(mfcc_obra, dtype=np.float64)
+        self.factores = [float(f) for f in factores]
+        # Con f < 1 las posiciones de inicio se toman cada round(1 / f) frames
+        # remuestreados, es decir, con la resolución de un frame de la obra
+        self.pasos = [max(1, int(round(1 / f))) for f in self.factores]
+        self.acumuladas = []
+        for factor in self.factores:
+            posiciones = np.arange(0.0, obra.shape[1] - 1 + 1e-9, factor)
+            self.acumuladas.append(sumas_acumuladas_frames(interpolar(obra, posiciones, 1)))
+
+    def curvas(self, mfcc_muestra):
+        # Curva de distancias del coseno por factor; la posición i de la curva
+        # del factor f empieza en el frame i * paso * f de la obra. Las sumas de
+        # las ventanas no se dividen por n: el coseno no depende de la escala
+        media = np.mean(mfcc_muestra, axis=1)
+        n = mfcc_muestra.shape[1]
+        curvas = []
+        for acumulada, paso in zip(self.acumuladas, self.pasos):
+            if n == 0 or n > acumulada.shape[1] - 1:
+                curvas.append(np.empty(0))
+                continue
+            inicios = acumulada[:, :acumulada.shape[1] - n:paso]
+            sumas = acumulada[:, n::paso][:, :inicios.shape[1]] - inicios
+            producto = media @ sumas
+            normas = np.sqrt(np.einsum('ij,ij->j', sumas, sumas)) * np.linalg.norm(media)
+            curva = np.ones_like(producto)
+            validas = normas > 0
+            curva[validas] = 1.0 - producto[validas] / normas[validas]
+            curvas.append(curva)
+        return curvas
+
+    def buscar(self, mfcc_muestra):
+        # Mejor pareja (posición en frames de la obra, factor) y su distancia
+        mejor = (None, None, float('inf'))
+        for factor, paso, curva in zip(self.factores, self.pasos, self.curvas(mfcc_muestra)):
+            posicion, distancia = posicion_minima(curva)
+            if posicion is not None and distancia < mejor[2]:
+                mejor = (int(round(posicion * paso * factor)), factor, distancia)
+        return mejor
+
+
+def preparar_obra_coseno(mfcc_obra, longitud_max, n_coef=13):
+    # Datos de la obra que comparten todas las muestras en perfil_coseno_aplanado:
+    # espectro de cada coeficiente (tamaño de FFT fijado por la muestra más larga,
+    # `longitud_max` frames) y energía acumulada para las normas de las ventanas
+    obra = np.asarray(mfcc_obra[:n_coef], dtype=np.float64)
+    n_obra = obra.shape[1]
+    n_fft = next_fast_len(n_obra + max(1, min(longitud_max, n_obra)) - 1, real=True)
+    espectro_obra = rfft(obra, n=n_fft, axis=1)
+    energia_acumulada = np.concatenate(([0.0], np.cumsum(np.sum(obra ** 2, axis=0))))
+    return espectro_obra, energia_acumulada, n_fft, n_obra
+
+
+def perfil_coseno_aplanado(obra_preparada, mfcc_muestra, n_coef=13):
+    # Distancia del coseno entre el MFCC aplanado (n_coef x frames) de la muestra
+    # y todas las ventanas de la obra, con paso de un frame (estilo MASS). El
+    # numerador sale de una correlación cruzada por FFT sumada sobre los
+    # coeficientes y las normas de las ventanas de sumas móviles de cuadrados.
+    # Devuelve una curva vacía si la muestra es más larga que la obra
+    espectro_obra, energia_acumulada, n_fft, n_obra = obra_preparada
+    muestra = np.asarray(mfcc_muestra[:n_coef], dtype=np.float64)
+    n = muestra.shape[1]
+    if n == 0 or n > n_obra or n_obra + n - 1 > n_fft:
+        return np.empty(0)
+
+    # Producto escalar con cada ventana: correlación sumada en el dominio frecuencial
+    espectro_muestra = rfft(muestra[:, ::-1], n=n_fft, axis=1)
+    correlacion = irfft(np.sum(espectro_obra * espectro_muestra, axis=0), n=n_fft)
+    producto = correlacion[n - 1:n_obra]
+
+    normas_obra = np.sqrt(np.maximum(energia_acumulada[n:] - energia_acumulada[:-n], 0.0))
+    normas = normas_obra * np.linalg.norm(muestra)
+    perfil = np.ones_like(producto)
+    validas = normas > 0
+    perfil[validas] = 1.0 - producto[validas] / normas[validas]
+    return perfil
+
+
+def perfiles_coseno_aplanado(mfcc_obra, mfcc_muestras, n_coef=13):
+    # Perfiles de todas las muestras contra una obra; el espectro de la obra se
+    # calcula una sola vez
+    longitudes = [m.shape[1] for m in mfcc_muestras]
+    if not longitudes:
+        return []
+    obra_preparada = preparar_obra_coseno(mfcc_obra, max(longitudes), n_coef)
+    return [perfil_coseno_aplanado(obra_preparada, m, n_coef) for m in mfcc_muestras]
+
+
+def posicion_minima(curva):
+    # Posición (en frames) y distancia mínimas de una curva de distancias
+    if len(curva) == 0:
+        return None, float('inf')
+    posicion = int(np.argmin(curva))
+    return posicion, float(curva[posicion])
+
+
+def mejores_coincidencias(curva, n_mejores=1, umbral=None, separacion=1):
+    # Mínimos de una curva de distancias que no se solapan, por supresión de no
+    # mínimos voraz: se recorren las posiciones de menor a mayor distancia, se
+    # acepta la mejor que no esté suprimida y se suprimen las que quedan a menos
+    # de `separacion` posiciones de ella, hasta tener n_mejores (None: todas) o
+    # llegar al `umbral` (None: sin umbral). Una coincidencia solo la descarta
+    # otra aceptada que se solape con ella, no una más débil suprimida a su vez.
+    # Con distancias iguales gana la primera posición; con n_mejores=1 y sin
+    # umbral da lo mismo que posicion_minima. Devuelve una lista de (posición,
+    # distancia) de menor a mayor distancia
+    curva = np.asarray(curva)
+    if len(curva) == 0:
+        return []
+    if n_mejores == 1:
+        # Sin ordenar la curva: la mejor nunca está suprimida
+        posicion, distancia = posicion_minima(curva)
+        return [] if umbral is not None and not distancia < umbral else [(posicion, distancia)]
+    separacion = max(int(separacion), 1)
+    candidatas = np.arange(len(curva)) if umbral is None else np.flatnonzero(curva < umbral)
+    orden = candidatas[np.argsort(curva[candidatas], kind='stable')]
+
+    suprimidas = np.zeros(len(curva), dtype=bool)
+    pares = []
+    for posicion in orden.tolist():
+        if suprimidas[posicion]:
+            continue
+        pares.append((posicion, float(curva[posicion])))
+        if n_mejores is not None and len(pares) >= n_mejores:
+            break
+        suprimidas[max(0, posicion - separacion + 1):posicion + separacion] = True
+    return pares
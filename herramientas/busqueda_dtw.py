@@ -0,0 +1,318 @@
+import heapq
+
+import numpy as np
+from numba import jit
+from scipy.spatial.distance import cdist
+
+
+@jit(nopython=True, cache=True)
+def _acumulado_subsecuencia(muestra, obra):
+    # DTW de subsecuencia (pasos (1,1), (1,0), (0,1) y coste euclídeo entre frames)
+    # recorriendo la obra entera en una sola pasada con dos filas de memoria.
+    # Para cada frame final de la obra devuelve el coste acumulado del mejor
+    # camino, el frame inicial de ese camino y su longitud; el inicio y la
+    # longitud se propagan junto al coste, lo que equivale al backtracking.
+    n, d = muestra.shape
+    m = obra.shape[0]
+    coste_ant = np.empty(m)
+    inicio_ant = np.empty(m, dtype=np.int64)
+    longitud_ant = np.empty(m, dtype=np.int64)
+    coste_act = np.empty(m)
+    inicio_act = np.empty(m, dtype=np.int64)
+    longitud_act = np.empty(m, dtype=np.int64)
+
+    # Primera fila: el camino puede empezar en cualquier frame de la obra
+    for j in range(m):
+        suma = 0.0
+        for k in range(d):
+            dif = muestra[0, k] - obra[j, k]
+            suma += dif * dif
+        coste_ant[j] = np.sqrt(suma)
+        inicio_ant[j] = j
+        longitud_ant[j] = 1
+
+    for i in range(1, n):
+        for j in range(m):
+            suma = 0.0
+            for k in range(d):
+                dif = muestra[i, k] - obra[j, k]
+                suma += dif * dif
+            coste = np.sqrt(suma)
+
+            # Predecesor: diagonal, vertical u horizontal (en caso de empate, diagonal)
+            mejor = coste_ant[j]
+            inicio = inicio_ant[j]
+            longitud = longitud_ant[j]
+            if j > 0:
+                if coste_ant[j - 1] <= mejor:
+                    mejor = coste_ant[j - 1]
+                    inicio = inicio_ant[j - 1]
+                    longitud = longitud_ant[j - 1]
+                if coste_act[j - 1] < mejor:
+                    mejor = coste_act[j - 1]
+                    inicio = inicio_act[j - 1]
+                    longitud = longitud_act[j - 1]
+            coste_act[j] = coste + mejor
+            inicio_act[j] = inicio
+            longitud_act[j] = longitud + 1
+
+        coste_ant, coste_act = coste_act, coste_ant
+        inicio_ant, inicio_act = inicio_act, inicio_ant
+        longitud_ant, longitud_act = longitud_act, longitud_ant
+
+    return coste_ant, inicio_ant, longitud_ant
+
+
+def perfil_dtw_subsecuencia(mfcc_muestra, mfcc_obra, normalizar=True):
+    # Coste DTW de subsecuencia de la muestra terminando en cada frame de la obra,
+    # junto con el frame de inicio de cada camino. Con normalizar=True el coste
+    # se divide por la longitud del camino (como en Script 8.2)
+    muestra = np.ascontiguousarray(mfcc_muestra.T, dtype=np.float64)
+    obra = np.ascontiguousarray(mfcc_obra.T, dtype=np.float64)
+    if muestra.shape[0] == 0 or obra.shape[0] == 0:
+        return np.empty(0), np.empty(0, dtype=np.int64)
+    costes, inicios, longitudes = _acumulado_subsecuencia(muestra, obra)
+    if normalizar:
+        costes = costes / longitudes
+    return costes, inicios
+
+
+def dtw_subsecuencia(mfcc_muestra, mfcc_obra, n_mejores=1, normalizar=True, umbral=None):
+    # Mejores coincidencias DTW de la muestra en toda la obra en una sola pasada.
+    # Devuelve (finales, inicios, costes) ordenados de menor a mayor coste; las
+    # coincidencias elegidas no se solapan entre sí. Con n_mejores=None se
+    # devuelven todas las que bajan de `umbral`. Los finales se recorren de menor
+    # a mayor coste con un montículo (construirlo es lineal) y el recorrido para
+    # en cuanto hay bastantes, sin ordenar todo el perfil
+    costes, inicios = perfil_dtw_subsecuencia(mfcc_muestra, mfcc_obra, normalizar)
+    finales_elegidos, inicios_elegidos, costes_elegidos = [], [], []
+    monticulo = list(zip(costes.tolist(), range(len(costes))))
+    heapq.heapify(monticulo)
+    while monticulo and (n_mejores is None or len(finales_elegidos) < n_mejores):
+        coste, final = heapq.heappop(monticulo)
+        if umbral is not None and coste >= umbral:
+            break
+        inicio = inicios[final]
+        if any(inicio <= f and final >= i for i, f in zip(inicios_elegidos, finales_elegidos)):
+            continue
+        finales_elegidos.append(int(final))
+        inicios_elegidos.append(int(inicio))
+        costes_elegidos.append(float(costes[final]))
+    return np.array(finales_elegidos, dtype=np.int64), np.array(inicios_elegidos, dtype=np.int64), np.array(costes_elegidos)
+
+
+def matriz_costes(mfcc1, mfcc2):
+    # Distancia euclídea entre cada frame de mfcc1 y cada frame de mfcc2 (n x m),
+    # calculada en un solo paso vectorizado
+    return cdist(np.asarray(mfcc1.T, dtype=np.float64), np.asarray(mfcc2.T, dtype=np.float64))
+
+
+def _radio_banda(radio, n, m):
+    # Radio de la banda de Sakoe-Chiba (|i - j| <= radio). Nunca menor que la
+    # diferencia de longitudes, para que el último frame siga siendo alcanzable;
+    # con None no hay banda
+    if radio is None:
+        return max(n, m)
+    return max(int(radio), abs(n - m))
+
+
+@jit(nopython=True, cache=True)
+def _dtw_dos_filas(coste, radio, limite):
+    # DTW exacto (sin normalizar) guardando solo dos filas del coste acumulado.
+    # Si toda una fila supera `limite` ningún camino puede mejorarlo y se
+    # abandona devolviendo infinito
+    n, m = coste.shape
+    anterior = np.full(m, np.inf)
+    actual = np.full(m, np.inf)
+    for i in range(n):
+        j_ini = max(0, i - radio)
+        j_fin = min(m, i + radio + 1)
+        if j_ini > 0:
+            actual[j_ini - 1] = np.inf
+        minimo_fila = np.inf
+        for j in range(j_ini, j_fin):
+            if i == 0 and j == 0:
+                mejor = 0.0
+            else:
+                mejor = anterior[j]
+                if j > 0:
+                    if anterior[j - 1] < mejor:
+                        mejor = anterior[j - 1]
+                    if actual[j - 1] < mejor:
+                        mejor = actual[j - 1]
+            actual[j] = coste[i, j] + mejor
+            if actual[j] < minimo_fila:
+                minimo_fila = actual[j]
+        if j_fin < m:
+            actual[j_fin] = np.inf
+        if minimo_fila >= limite:
+            return np.inf
+        anterior, actual = actual, anterior
+    return anterior[m - 1]
+
+
+@jit(nopython=True, cache=True)
+def _dtw_acumulado(coste, radio):
+    # Matriz completa de coste acumulado, necesaria para recuperar el camino
+    n, m = coste.shape
+    acumulado = np.full((n, m), np.inf)
+    for i in range(n):
+        for j in range(max(0, i - radio), min(m, i + radio + 1)):
+            if i == 0 and j == 0:
+                mejor = 0.0
+            else:
+                mejor = np.inf
+                if i > 0:
+                    mejor = acumulado[i - 1, j]
+                    if j > 0 and acumulado[i - 1, j - 1] < mejor:
+                        mejor = acumulado[i - 1, j - 1]
+                if j > 0 and acumulado[i, j - 1] < mejor:
+                    mejor = acumulado[i, j - 1]
+            acumulado[i, j] = coste[i, j] + mejor
+    return acumulado
+
+
+def _camino_optimo(acumulado):
+    i, j = acumulado.shape[0] - 1, acumulado.shape[1] - 1
+    camino = [(i, j)]
+    while i > 0 or j > 0:
+        if i == 0:
+            j -= 1
+        elif j == 0:
+            i -= 1
+        else:
+            opciones = (acumulado[i - 1, j - 1], acumulado[i - 1, j], acumulado[i, j - 1])
+            paso = int(np.argmin(opciones))
+            if paso == 0:
+                i, j = i - 1, j - 1
+            elif paso == 1:
+                i -= 1
+            else:
+                j -= 1
+        camino.append((i, j))
+    return camino[::-1]
+
+
+def dtw_distancia(mfcc1, mfcc2, radio=None, devolver_camino=False):
+    # Distancia DTW exacta entre dos matrices MFCC (coeficientes x frames) con
+    # coste euclídeo entre frames, como fastdtw(mfcc1.T, mfcc2.T, dist=euclidean)
+    # pero sin aproximación. `radio` limita el camino a una banda de Sakoe-Chiba.
+    # Sin camino solo se guardan dos filas de memoria; con devolver_camino=True
+    # devuelve (distancia, camino) como fastdtw
+    coste = matriz_costes(mfcc1, mfcc2)
+    n, m = coste.shape
+    if devolver_camino:
+        acumulado = _dtw_acumulado(coste, _radio_banda(radio, n, m))
+        return float(acumulado[-1, -1]), _camino_optimo(acumulado)
+    return float(_dtw_dos_filas(coste, _radio_banda(radio, n, m), np.inf))
+
+
+@jit(nopython=True, cache=True)
+def _dtw_lote(coste, posiciones, ventana_frames, radio, resultado):
+    for k in range(len(posiciones)):
+        p = posiciones[k]
+        resultado[k] = _dtw_dos_filas(coste[:, p:p + ventana_frames], radio, np.inf)
+
+
+def dtw_lote(mfcc_muestra, mfcc_obra, posiciones, radio=None, ventana_frames=None, max_columnas=20000):
+    # Distancias DTW entre la muestra y las ventanas de la obra que empiezan en
+    # `posiciones`. La matriz de costes de la muestra contra el tramo de obra
+    # que cubren las ventanas se calcula una sola vez (por bloques de como mucho
+    # `max_columnas` frames) y cada ventana es un corte de columnas de ella
+    n = mfcc_muestra.shape[1]
+    ventana_frames = n if ventana_frames is None else ventana_frames
+    posiciones = np.asarray(posiciones, dtype=np.int64)
+    posiciones = posiciones[(posiciones >= 0) & (posiciones + ventana_frames <= mfcc_obra.shape[1])]
+    distancias = np.full(len(posiciones), np.inf)
+    radio = _radio_banda(radio, n, ventana_frames)
+    orden = np.argsort(posiciones, kind='stable')
+
+    k = 0
+    while k < len(orden):
+        primero = posiciones[orden[k]]
+        fin = k
+        while fin < len(orden) and posiciones[orden[fin]] + ventana_frames - primero <= max(max_columnas, ventana_frames):
+            fin += 1
+        bloque = orden[k:fin]
+        ultimo = posiciones[bloque[-1]] + ventana_frames
+        coste = matriz_costes(mfcc_muestra, mfcc_obra[:, primero:ultimo])
+        resultado = np.empty(len(bloque))
+        _dtw_lote(coste, posiciones[bloque] - primero, ventana_frames, radio, resultado)
+        distancias[bloque] = resultado
+        k = fin
+    return posiciones, distancias
+
+
+class PodaDTW:
+    # Cascada de cotas inferiores delante del DTW exacto entre la muestra y
+    # ventanas de la obra: LB_Kim (primer y último frame), LB_Keogh (envolvente
+    # de la muestra) y DTW con abandono anticipado. Las envolventes se calculan
+    # una sola vez por muestra. `radio` es el radio de la banda de Sakoe-Chiba del
+    # DTW y de la envolvente, en frames; con None no hay banda y la envolvente
+    # cubre toda la muestra.
+    # Las distancias coinciden con las del DTW completo, así que la mejor
+    # coincidencia no cambia; solo se evitan cálculos.
+
+    def __init__(self, mfcc_muestra, radio=None):
+        self.muestra = np.ascontiguousarray(mfcc_muestra.T, dtype=np.float64)
+        self.radio = radio
+        n = self.muestra.shape[0]
+        radio = n if radio is None else radio
+        self.superior = np.empty_like(self.muestra)
+        self.inferior = np.empty_like(self.muestra)
+        for i in range(n):
+            tramo = self.muestra[max(0, i - radio):i + radio + 1]
+            self.superior[i] = tramo.max(axis=0)
+            self.inferior[i] = tramo.min(axis=0)
+        self.estadisticas = {'candidatos': 0, 'podados_kim': 0, 'podados_keogh': 0,
+                             'abandonados': 0, 'dtw_completos': 0}
+
+    def lb_kim(self, fragmento):
+        inicio = np.linalg.norm(self.muestra[0] - fragmento[0])
+        if len(self.muestra) == 1 and len(fragmento) == 1:
+            return inicio
+        return inicio + np.linalg.norm(self.muestra[-1] - fragmento[-1])
+
+    def lb_keogh(self, fragmento):
+        # Distancia de cada frame del fragmento a la caja [inferior, superior]
+        # de la muestra en ese instante (válida para fragmentos de igual longitud)
+        exceso = np.maximum(fragmento - self.superior, 0.0) + np.maximum(self.inferior - fragmento, 0.0)
+        return np.sum(np.sqrt(np.sum(exceso ** 2, axis=1)))
+
+    def distancia(self, mfcc_fragmento, limite=np.inf):
+        # Distancia DTW exacta, o infinito si alguna cota demuestra que no
+        # puede bajar de `limite`
+        fragmento = np.ascontiguousarray(mfcc_fragmento.T, dtype=np.float64)
+        self.estadisticas['candidatos'] += 1
+        if self.lb_kim(fragmento) >= limite:
+            self.estadisticas['podados_kim'] += 1
+            return np.inf
+        if len(fragmento) == len(self.muestra) and self.lb_keogh(fragmento) >= limite:
+            self.estadisticas['podados_keogh'] += 1
+            return np.inf
+        coste = cdist(self.muestra, fragmento)
+        distancia = _dtw_dos_filas(coste, _radio_banda(self.radio, *coste.shape), limite)
+        if distancia == np.inf:
+            self.estadisticas['abandonados'] += 1
+        else:
+            self.estadisticas['dtw_completos'] += 1
+        return distancia
+
+    def resumen(self):
+        e = self.estadisticas
+        podados = e['podados_kim'] + e['podados_keogh'] + e['abandonados']
+        return (f"{podados}/{e['candidatos']} candidatos podados "
+                f"(Kim {e['podados_kim']}, Keogh {e['podados_keogh']}, abandono {e['abandonados']})")
+
+
+def buscar_dtw_ventanas(poda, mfcc_obra, posiciones, mejor_distancia=np.inf):
+    # Mejor posición DTW entre las ventanas de la obra que empiezan en `posiciones`,
+    # con la distancia de la mejor hasta el momento como límite de la cascada
+    ventana_frames = poda.muestra.shape[0]
+    mejor_pos = None
+    for pos in posiciones:
+        dist = poda.distancia(mfcc_obra[:, pos:pos + ventana_frames], mejor_distancia)
+        if dist < mejor_distancia:
+            mejor_distancia = dist
+            mejor_pos = pos
+    return mejor_pos, mejor_distancia
@@ -0,0 +1,67 @@
+import heapq
+
+import numpy as np
+
+from herramientas.matriz_similitud import agrupar_frames
+
+
+def piramide_frames(mfcc, niveles=4):
+    # Nivel 0: la matriz original; nivel l: medias de 2^l frames consecutivos
+    # (cada nivel se obtiene agrupando de 2 en 2 el anterior)
+    piramide = [np.asarray(mfcc)]
+    for _ in range(1, niveles):
+        if piramide[-1].shape[1] < 2:
+            break
+        piramide.append(agrupar_frames(piramide[-1], 2))
+    return piramide
+
+
+def _elegir(distancias, cantidad, separacion, umbral=None):
+    # Las `cantidad` (None: todas) posiciones de menor distancia de un
+    # diccionario {posición: distancia}, separadas al menos `separacion`
+    # posiciones entre sí y por debajo de `umbral`
+    elegidas = []
+    for posicion, distancia in heapq.nsmallest(len(distancias), distancias.items(), key=lambda par: (par[1], par[0])):
+        if cantidad is not None and len(elegidas) >= cantidad:
+            break
+        if umbral is not None and distancia >= umbral:
+            break
+        if all(abs(posicion - p) >= separacion for p, _ in elegidas):
+            elegidas.append((posicion, float(distancia)))
+    return elegidas
+
+
+def buscar_piramide(distancia, piramide_muestra, piramide_obra, ancho_haz=8, n_mejores=1, umbral=None):
+    # Búsqueda de grueso a fino de la muestra en la obra. En el nivel más
+    # grueso en que la muestra conserva al menos 2 frames se evalúan todas las
+    # posiciones; se guardan las `ancho_haz` mejores (separadas al menos 2
+    # posiciones) y en cada nivel más fino solo se evalúan las posiciones
+    # 2p - 1 .. 2p + 2 de cada candidata p. En el nivel 0 se devuelven las
+    # n_mejores coincidencias que no se solapan (None: todas las evaluadas por
+    # debajo de `umbral`), como lista de (posición, distancia) de menor a mayor
+    # distancia, y el número de distancias calculadas.
+    # distancia(fragmento_muestra, fragmento_obra, nivel) compara dos matrices
+    # de un mismo nivel; con un haz de al menos n_mejores el resultado suele
+    # coincidir con la búsqueda exhaustiva a una fracción del coste
+    nivel = min(len(piramide_muestra), len(piramide_obra)) - 1
+    while nivel > 0 and piramide_muestra[nivel].shape[1] < 2:
+        nivel -= 1
+
+    evaluaciones = 0
+    candidatas = None
+    for nivel in range(nivel, -1, -1):
+        muestra = piramide_muestra[nivel]
+        obra = piramide_obra[nivel]
+        n = muestra.shape[1]
+        max_pos = obra.shape[1] - n
+        if max_pos < 0:
+            return [], evaluaciones
+        if candidatas is None:
+            posiciones = range(max_pos + 1)
+        else:
+            posiciones = sorted({q for p in candidatas for q in range(2 * p - 1, 2 * p + 3) if 0 <= q <= max_pos})
+        distancias = {q: distancia(muestra, obra[:, q:q + n], nivel) for q in posiciones}
+        evaluaciones += len(distancias)
+        if nivel > 0:
+            candidatas = [p for p, _ in _elegir(distancias, ancho_haz, 2)]
+    return _elegir(distancias, n_mejores, n, umbral), evaluaciones
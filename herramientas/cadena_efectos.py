@@ -0,0 +1,158 @@
+import os
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+from herramientas.convolucion import ConvolucionParticionada, bloques_fijos
+from herramientas.extraccion_mfcc import ExtractorMFCC, bloques_audio
+from herramientas.filtros import FiltroSOS, disenar_sos
+
+
+class Etapa:
+    # Etapa de una CadenaEfectos. preparar() se llama al empezar cada señal
+    # (reinicia el estado), procesar() con cada bloque (muestras x canales) y
+    # devuelve el bloque procesado, y finalizar() al terminar la señal
+    def preparar(self, sr, canales, tamano_bloque, nombre):
+        pass
+
+    def procesar(self, bloque):
+        return bloque
+
+    def finalizar(self):
+        pass
+
+
+class EtapaFiltro(Etapa):
+    # Butterworth en SOS ('low' o 'high') con el estado guardado entre bloques
+    def __init__(self, freq_corte, orden, tipo):
+        self.freq_corte = freq_corte
+        self.orden = orden
+        self.tipo = tipo
+
+    def preparar(self, sr, canales, tamano_bloque, nombre):
+        self.filtro = FiltroSOS(disenar_sos(self.freq_corte, sr, self.orden, self.tipo), canales)
+
+    def procesar(self, bloque):
+        return self.filtro.procesar(bloque)
+
+
+class EtapaReverb(Etapa):
+    # Reverb por convolución particionada con mezcla seco/húmedo y pasa-altos
+    # opcional de la señal reverberada. Las particiones (de particionar_ir o de
+    # BibliotecaIR) deben tener el mismo tamaño de bloque que la cadena
+    def __init__(self, particiones, mix, corte_hpf=None, orden_hpf=2):
+        self.particiones = particiones
+        self.mix = mix
+        self.corte_hpf = corte_hpf
+        self.orden_hpf = orden_hpf
+
+    def preparar(self, sr, canales, tamano_bloque, nombre):
+        if self.particiones.shape[1] != tamano_bloque + 1:
+            raise ValueError(f"Las particiones de la IR son de {self.particiones.shape[1] - 1} muestras "
+                             f"y la cadena usa bloques de {tamano_bloque}.")
+        self.convolucion = ConvolucionParticionada(self.particiones, tamano_bloque, canales)
+        self.filtro = FiltroSOS(disenar_sos(self.corte_hpf, sr, self.orden_hpf, 'high'), canales) if self.corte_hpf else None
+
+    def procesar(self, bloque):
+        reverberado = self.convolucion.procesar(bloque)
+        if self.filtro is not None:
+            reverberado = self.filtro.procesar(reverberado)
+        return (1 - self.mix) * bloque + self.mix * reverberado
+
+
+class EtapaMFCC(Etapa):
+    # MFCC de la señal que llega a la etapa (mezclada a mono), calculados por
+    # bloques con ExtractorMFCC. No modifica el audio; el resultado queda en self.mfcc
+    def __init__(self, n_mfcc=20, hop_length=512, n_fft=2048):
+        self.n_mfcc = n_mfcc
+        self.hop_length = hop_length
+        self.n_fft = n_fft
+        self.mfcc = None
+
+    def preparar(self, sr, canales, tamano_bloque, nombre):
+        self.extractor = ExtractorMFCC(sr, n_mfcc=self.n_mfcc, n_fft=self.n_fft, hop_length=self.hop_length)
+
+    def procesar(self, bloque):
+        self.extractor.agregar(np.mean(bloque, axis=1))
+        return bloque
+
+    def finalizar(self):
+        self.mfcc = self.extractor.finalizar()
+
+
+class EtapaGuardar(Etapa):
+    # Escribe en `carpeta` la señal tal como llega a esta etapa, como
+    # <nombre><sufijo>.wav. Es la única forma en que una etapa intermedia toca el disco
+    def __init__(self, carpeta, sufijo="", subtype=None):
+        self.carpeta = carpeta
+        self.sufijo = sufijo
+        self.subtype = subtype
+
+    def preparar(self, sr, canales, tamano_bloque, nombre):
+        os.makedirs(self.carpeta, exist_ok=True)
+        ruta = os.path.join(self.carpeta, f"{nombre}{self.sufijo}.wav")
+        self.archivo = sf.SoundFile(ruta, mode='w', samplerate=sr, channels=canales, subtype=self.subtype)
+
+    def procesar(self, bloque):
+        self.archivo.write(bloque)
+        return bloque
+
+    def finalizar(self):
+        self.archivo.close()
+
+
+class CadenaEfectos:
+    # Encadena etapas (filtros, reverb, MFCC, guardado) sobre la misma señal en
+    # memoria, bloque a bloque. La señal se remuestrea como mucho una vez, al
+    # leerla, y nada se escribe en disco salvo en las etapas EtapaGuardar o si se
+    # pide ruta_salida. La salida se escribe en un único array reservado de antemano
+    def __init__(self, etapas, sr, tamano_bloque=16384, mono=True, normalizar=False):
+        self.etapas = etapas
+        self.sr = sr
+        self.tamano_bloque = tamano_bloque
+        self.mono = mono
+        self.normalizar = normalizar
+
+    def _procesar(self, bloques, n_muestras, canales, nombre):
+        for etapa in self.etapas:
+            etapa.preparar(self.sr, canales, self.tamano_bloque, nombre)
+        salida = np.empty((n_muestras, canales), dtype=np.float32)
+        inicio = 0
+        for bloque in bloques_fijos(bloques, self.tamano_bloque):
+            bloque = bloque.reshape(len(bloque), canales)
+            for etapa in self.etapas:
+                bloque = etapa.procesar(bloque)
+            salida[inicio:inicio + len(bloque)] = bloque
+            inicio += len(bloque)
+        for etapa in self.etapas:
+            etapa.finalizar()
+
+        salida = salida[:inicio]
+        if self.normalizar:
+            pico = np.max(np.abs(salida), initial=0.0)
+            if pico > 0:
+                salida /= pico
+        return salida[:, 0] if self.mono else salida
+
+    def procesar_archivo(self, ruta, ruta_salida=None):
+        # Lee el archivo por bloques a self.sr y devuelve la señal procesada
+        nombre = os.path.splitext(os.path.basename(ruta))[0]
+        with sf.SoundFile(ruta) as archivo:
+            canales = 1 if self.mono else archivo.channels
+            n_muestras = int(np.ceil(archivo.frames * self.sr / archivo.samplerate))
+            salida = self._procesar(bloques_audio(archivo, self.sr, self.tamano_bloque, mono=self.mono), n_muestras, canales, nombre)
+        if ruta_salida is not None:
+            sf.write(ruta_salida, salida, self.sr)
+        return salida
+
+    def procesar_senal(self, y, sr, nombre="senal"):
+        # Igual que procesar_archivo para una señal ya cargada (muestras o muestras x canales)
+        y = np.asarray(y, dtype=np.float32)
+        if self.mono and y.ndim > 1:
+            y = np.mean(y, axis=1)
+        if sr != self.sr:
+            y = librosa.resample(y, orig_sr=sr, target_sr=self.sr, axis=0)
+        canales = 1 if y.ndim == 1 else y.shape[1]
+        bloques = (y[i:i + self.tamano_bloque] for i in range(0, len(y), self.tamano_bloque))
+        return self._procesar(bloques, len(y), canales, nombre)
@@ -0,0 +1,104 @@
+import os
+
+import numpy as np
+import soundfile as sf
+
+from herramientas.extraccion_mfcc import bloques_audio
+from herramientas.filtros import FiltroSOS, disenar_sos
+
+
+def particionar_ir(ir, tamano_bloque):
+    # Divide la IR en particiones de `tamano_bloque` muestras y devuelve la FFT
+    # (de tamaño 2 * tamano_bloque) de cada una: array (particiones, tamano_bloque + 1)
+    ir = np.asarray(ir, dtype=np.float64)
+    n_particiones = max(1, int(np.ceil(len(ir) / tamano_bloque)))
+    trozos = np.zeros((n_particiones, 2 * tamano_bloque))
+    trozos[:, :tamano_bloque] = np.pad(ir, (0, n_particiones * tamano_bloque - len(ir))).reshape(n_particiones, tamano_bloque)
+    return np.fft.rfft(trozos, axis=1)
+
+
+class ConvolucionParticionada:
+    # Convolución por bloques en el dominio de la frecuencia con partición
+    # uniforme de la IR (overlap-save): cada bloque de entrada de B muestras se
+    # transforma una sola vez, se guarda en una línea de retardo de espectros y
+    # la salida del bloque es la suma de esos espectros por las particiones de
+    # la IR. La memoria y el coste por bloque dependen de la longitud de la IR,
+    # no de la del archivo, y la salida coincide con
+    # np.convolve(x, ir)[:len(x)] (salvo redondeo). Los bloques son arrays
+    # (muestras x canales); la misma IR se aplica a cada canal
+    def __init__(self, particiones, tamano_bloque, canales=1):
+        self.particiones = particiones
+        self.tamano_bloque = tamano_bloque
+        n_particiones, n_frecuencias = particiones.shape
+        self.espectros = np.zeros((n_particiones, n_frecuencias, canales), dtype=np.complex128)
+        self.entrada = np.zeros((2 * tamano_bloque, canales))
+        self.actual = 0
+
+    def procesar(self, bloque):
+        # Un bloque de como mucho B muestras; los más cortos (el último) se rellenan con ceros
+        B = self.tamano_bloque
+        n = len(bloque)
+        self.entrada[:B] = self.entrada[B:]
+        self.entrada[B:B + n] = bloque
+        self.entrada[B + n:] = 0.0
+
+        P = len(self.particiones)
+        self.actual = (self.actual + 1) % P
+        self.espectros[self.actual] = np.fft.rfft(self.entrada, axis=0)
+        # El espectro con retardo p está en la posición (actual - p) % P
+        i = self.actual
+        suma = np.einsum('pk,pkc->kc', self.particiones[:i + 1], self.espectros[i::-1])
+        if i + 1 < P:
+            suma += np.einsum('pk,pkc->kc', self.particiones[i + 1:], self.espectros[:i:-1])
+        return np.fft.irfft(suma, n=2 * B, axis=0)[B:B + n]
+
+
+def bloques_fijos(bloques, tamano):
+    # Reagrupa una secuencia de bloques de longitud variable en bloques de
+    # `tamano` muestras (el último puede ser más corto)
+    pendiente = []
+    acumuladas = 0
+    for bloque in bloques:
+        pendiente.append(bloque)
+        acumuladas += len(bloque)
+        if acumuladas >= tamano:
+            junto = np.concatenate(pendiente)
+            completos = len(junto) // tamano * tamano
+            for inicio in range(0, completos, tamano):
+                yield junto[inicio:inicio + tamano]
+            pendiente = [junto[completos:]]
+            acumuladas = len(pendiente[0])
+    if acumuladas:
+        yield np.concatenate(pendiente)
+
+
+def aplicar_reverb_archivo(ruta_entrada, ruta_salida, particiones, tamano_bloque, mix, sr, corte_hpf=None, orden_hpf=2):
+    # Reverb por convolución de un archivo (a mono y a `sr`, como librosa.load)
+    # en un solo recorrido por bloques: convolución particionada, filtro
+    # pasa-altos opcional de la señal reverberada y mezcla seco/húmedo. La
+    # normalización final por el pico necesita el pico de toda la salida, así
+    # que la mezcla se escribe en un archivo temporal en float32 y una segunda
+    # pasada por bloques la reescala al formato de salida
+    temporal = ruta_salida + ".tmp.wav"
+    pico = 0.0
+    with sf.SoundFile(ruta_entrada) as entrada:
+        convolucion = ConvolucionParticionada(particiones, tamano_bloque)
+        filtro = FiltroSOS(disenar_sos(corte_hpf, sr, orden_hpf, 'high')) if corte_hpf else None
+        with sf.SoundFile(temporal, mode='w', samplerate=sr, channels=1, subtype='FLOAT') as mezcla:
+            for bloque in bloques_fijos(bloques_audio(entrada, sr, tamano_bloque), tamano_bloque):
+                seco = bloque[:, np.newaxis]
+                reverberado = convolucion.procesar(seco)
+                if filtro is not None:
+                    reverberado = filtro.procesar(reverberado)
+                salida = (1 - mix) * seco + mix * reverberado
+                pico = max(pico, float(np.max(np.abs(salida))))
+                mezcla.write(salida)
+
+    escala = 1.0 / pico if pico > 0 else 1.0
+    try:
+        with sf.SoundFile(temporal) as mezcla, sf.SoundFile(ruta_salida, mode='w', samplerate=sr, channels=1) as salida:
+            for bloque in mezcla.blocks(blocksize=tamano_bloque, dtype='float64'):
+                salida.write(bloque * escala)
+    finally:
+        os.remove(temporal)
+    return ruta_salida
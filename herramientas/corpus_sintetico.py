@@ -0,0 +1,80 @@
+import librosa
+import numpy as np
+
+from herramientas.biblioteca_ir import GENERADORES
+from herramientas.cadena_efectos import CadenaEfectos, EtapaFiltro, EtapaReverb
+from herramientas.convolucion import particionar_ir
+
+
+def _nota(rng, sr, duracion):
+    # Tono con 1-5 armónicos de amplitud decreciente, vibrato suave y envolvente
+    # de ataque y caída exponencial
+    t = np.arange(int(duracion * sr)) / sr
+    frecuencia = librosa.midi_to_hz(rng.integers(36, 90))
+    fase = 2 * np.pi * frecuencia * (t + 0.002 * np.sin(2 * np.pi * rng.uniform(3, 7) * t))
+    tono = sum(np.sin(k * fase) / k ** rng.uniform(0.8, 2.0) for k in range(1, rng.integers(1, 6) + 1))
+    envolvente = np.minimum(t / 0.01, 1.0) * np.exp(-t * rng.uniform(1, 8))
+    return tono * envolvente
+
+
+def _ruido(rng, sr, duracion):
+    # Ruido blanco con una envolvente lenta (golpes y texturas sin altura)
+    n = int(duracion * sr)
+    envolvente = np.interp(np.arange(n), [0, n // 2, n], [0.0, 1.0, 0.0]) ** rng.uniform(0.5, 3)
+    return rng.standard_normal(n) * envolvente * 0.3
+
+
+def generar_obra(duracion, sr, semilla=0):
+    # Obra sintética determinista (misma semilla, misma señal): sucesión de
+    # notas de altura y duración aleatorias con tramos de ruido intercalados,
+    # sobre un fondo de ruido a -60 dB. Es lo bastante variada para que cada
+    # fragmento tenga una única posición correcta en la obra
+    rng = np.random.default_rng(semilla)
+    n = int(duracion * sr)
+    obra = rng.standard_normal(n) * 1e-3
+    inicio = 0
+    while inicio < n:
+        duracion_evento = rng.uniform(0.1, 0.8)
+        evento = _ruido(rng, sr, duracion_evento) if rng.random() < 0.15 else _nota(rng, sr, duracion_evento)
+        evento = evento[:n - inicio] * rng.uniform(0.2, 1.0)
+        obra[inicio:inicio + len(evento)] += evento
+        inicio += int(rng.uniform(0.6, 1.0) * len(evento)) + 1
+    return (obra / np.max(np.abs(obra))).astype(np.float32)
+
+
+def transformar(y, sr, transformacion, tamano_bloque=16384):
+    # Aplica a la muestra una de las modificaciones de los scripts, como
+    # (tipo, parámetro): 'lpf' / 'hpf' (corte en Hz, orden 4 como 9.x),
+    # 'plate' / 'spring' (decay en s, mezcla 0.1 como 10.x), 'stretch' (factor
+    # de duración, como Script 6) o 'shift' (semitonos, como Script 7). None la
+    # deja igual
+    if transformacion is None:
+        return y
+    tipo, parametro = transformacion
+    if tipo in ('lpf', 'hpf'):
+        etapa = EtapaFiltro(parametro, 4, 'low' if tipo == 'lpf' else 'high')
+        return CadenaEfectos([etapa], sr, tamano_bloque).procesar_senal(y, sr)
+    if tipo in GENERADORES:
+        particiones = particionar_ir(GENERADORES[tipo](sr, parametro), tamano_bloque)
+        return CadenaEfectos([EtapaReverb(particiones, 0.1)], sr, tamano_bloque).procesar_senal(y, sr)
+    if tipo == 'stretch':
+        return librosa.effects.time_stretch(y, rate=1.0 / parametro)
+    if tipo == 'shift':
+        return librosa.effects.pitch_shift(y, sr=sr, n_steps=parametro)
+    raise ValueError(f"Transformación desconocida: {tipo}")
+
+
+def nombre_transformacion(transformacion):
+    return "original" if transformacion is None else f"{transformacion[0]}_{transformacion[1]}"
+
+
+def generar_muestras(obra, sr, duracion, cantidad, transformacion=None, semilla=0):
+    # `cantidad` fragmentos literales de `duracion` segundos en inicios
+    # aleatorios (deterministas) de la obra, con la transformación aplicada.
+    # Devuelve una lista de (inicio en segundos, señal)
+    rng = np.random.default_rng(semilla)
+    n = int(duracion * sr)
+    muestras = []
+    for inicio in rng.integers(0, len(obra) - n, size=cantidad):
+        muestras.append((inicio / sr, transformar(obra[inicio:inicio + n], sr, transformacion)))
+    return muestras
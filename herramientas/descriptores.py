@@ -0,0 +1,99 @@
+import librosa
+import numpy as np
+
+from herramientas.extraccion_mfcc import base_mel
+from herramientas.segmentacion import media_tramo, sumas_acumuladas
+
+
+NOMBRES_DESCRIPTORES = ("centroid", "spread", "flatness", "rms", "zcr")
+
+
+def _pistas_tramo(y_ceros, y_borde, sr, n_fft, hop_length):
+    # Pistas de los frames de una señal ya rellenada a cada lado (con ceros para
+    # la STFT y RMS, repitiendo la muestra del borde para ZCR, como librosa con
+    # center=True). Devuelve (pistas, espectro de potencia)
+    S = np.abs(librosa.stft(y_ceros, n_fft=n_fft, hop_length=hop_length, center=False))
+    frecuencias = librosa.fft_frequencies(sr=sr, n_fft=n_fft)[:, np.newaxis]
+
+    # Espectro normalizado a suma 1 por frame (los frames en silencio se quedan a cero)
+    suma = np.sum(S, axis=0, keepdims=True)
+    S_norm = S / np.where(suma > np.finfo(S.dtype).tiny, suma, 1.0)
+    centroide = np.sum(frecuencias * S_norm, axis=0)
+    dispersion = np.sqrt(np.sum(S_norm * (frecuencias - centroide) ** 2, axis=0))
+
+    potencia = S ** 2
+    umbral = np.maximum(1e-10, potencia)
+    planitud = np.exp(np.mean(np.log(umbral), axis=0)) / np.mean(umbral, axis=0)
+
+    marcos = librosa.util.frame(y_ceros, frame_length=n_fft, hop_length=hop_length)
+    rms = np.sqrt(np.mean(marcos ** 2, axis=0))
+    marcos = librosa.util.frame(y_borde, frame_length=n_fft, hop_length=hop_length)
+    zcr = np.mean(librosa.zero_crossings(marcos, threshold=1e-10, pad=False, axis=0), axis=0)
+
+    return dict(zip(NOMBRES_DESCRIPTORES, (centroide, dispersion, planitud, rms, zcr))), potencia
+
+
+def descriptores_por_frames(y, sr, n_fft=2048, hop_length=512, n_mfcc=None, n_mels=128, onset=False):
+    # Pistas por frame de centroide, dispersión (bandwidth), planitud, RMS y
+    # ZCR, y opcionalmente MFCC y fuerza de onset, a partir de una sola STFT.
+    # Con los parámetros por defecto de librosa cada pista coincide con la de
+    # librosa.feature.* (spectral_centroid, spectral_bandwidth,
+    # spectral_flatness, rms, zero_crossing_rate, mfcc) y onset.onset_strength.
+    # RMS y ZCR salen de la señal enmarcada en el dominio del tiempo, como en
+    # librosa. Devuelve un diccionario de arrays con un valor (o columna) por frame
+    y = np.asarray(y, dtype=np.float32)
+    relleno = n_fft // 2
+    pistas, potencia = _pistas_tramo(np.pad(y, relleno), np.pad(y, relleno, mode='edge'), sr, n_fft, hop_length)
+
+    if n_mfcc or onset:
+        log_mel = librosa.power_to_db(base_mel(sr, n_fft, n_mels) @ potencia)
+        if n_mfcc:
+            pistas["mfcc"] = librosa.feature.mfcc(S=log_mel, n_mfcc=n_mfcc)
+        if onset:
+            pistas["onset"] = librosa.onset.onset_strength(S=log_mel, sr=sr, hop_length=hop_length, n_fft=n_fft)
+    return pistas
+
+
+def descriptores_por_bloques(y, sr, n_fft=2048, hop_length=512, frames_por_bloque=4096):
+    # Las mismas pistas que descriptores_por_frames (sin MFCC ni onset) calculadas
+    # por tramos de `frames_por_bloque` frames. `y` puede ser cualquier objeto con
+    # len() y cortes, como AudioEnDisco, así que la señal y su STFT nunca están
+    # completas en memoria
+    n_muestras = len(y)
+    relleno = n_fft // 2
+    total_frames = 1 + n_muestras // hop_length
+    tramos = []
+    for f0 in range(0, total_frames, frames_por_bloque):
+        f1 = min(f0 + frames_por_bloque, total_frames)
+        # Muestras que cubren los frames [f0, f1) y lo que falta de ellas fuera de la señal
+        s0 = f0 * hop_length - relleno
+        s1 = (f1 - 1) * hop_length + relleno + n_fft % 2
+        tramo = np.asarray(y[max(s0, 0):min(s1, n_muestras)], dtype=np.float32)
+        bordes = (max(s0, 0) - s0, s1 - min(s1, n_muestras))
+        pistas, _ = _pistas_tramo(np.pad(tramo, bordes), np.pad(tramo, bordes, mode='edge'), sr, n_fft, hop_length)
+        tramos.append(pistas)
+    return {nombre: np.concatenate([pistas[nombre] for pistas in tramos]) for nombre in NOMBRES_DESCRIPTORES}
+
+
+def acumular_descriptores(pistas):
+    # Sumas acumuladas de las pistas de NOMBRES_DESCRIPTORES (una fila por descriptor)
+    return sumas_acumuladas(np.vstack([pistas[nombre] for nombre in NOMBRES_DESCRIPTORES]))
+
+
+def descriptores_tramo(acumuladas, inicio, fin, hop_length=512):
+    # Medias de los descriptores en el tramo [inicio, fin) (en muestras) en O(1).
+    # Se promedian los frames de la señal completa que corresponden al tramo; los
+    # ~n_fft / (2 * hop_length) frames de cada extremo ven el audio de alrededor
+    # en lugar del relleno que librosa añade al analizar el tramo recortado, así
+    # que el resultado difiere ligeramente del de calcular_descriptores sobre el
+    # fragmento (tanto menos cuanto más largo es)
+    return dict(zip(NOMBRES_DESCRIPTORES, media_tramo(acumuladas, inicio, fin, hop_length)))
+
+
+def medias_descriptores(pistas):
+    # Media de cada pista a lo largo de los frames (un vector por coeficiente para los MFCC)
+    return {nombre: np.mean(pista, axis=-1) for nombre, pista in pistas.items()}
+
+
+def calcular_descriptores(y, sr, **kwargs):
+    return medias_descriptores(descriptores_por_frames(y, sr, **kwargs))
@@ -0,0 +1,203 @@
+from functools import lru_cache
+
+import librosa
+import numpy as np
+import scipy.fftpack
+import soundfile as sf
+import soxr
+
+
+@lru_cache(maxsize=16)
+def base_mel(sr, n_fft, n_mels):
+    return librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels)
+
+
+class ExtractorMFCC:
+    # Extractor de MFCC por bloques, equivalente a
+    # librosa.feature.mfcc(y=y, sr=sr, n_mfcc=n_mfcc, hop_length=hop_length)
+    # sobre la señal completa. Se le pasan bloques consecutivos de audio mono
+    # (ya a `sr`) con agregar() y finalizar() devuelve la matriz de MFCC.
+    #
+    # Solo se guarda el log-mel de los frames ya calculados (n_mels valores por
+    # frame, unas 4 veces menos que la señal con hop 512): el recorte top_db de
+    # librosa depende del máximo de toda la señal, así que la DCT final se hace
+    # al terminar. La señal y su STFT nunca están completas en memoria.
+
+    def __init__(self, sr, n_mfcc=20, n_fft=2048, hop_length=512, n_mels=128, top_db=80.0):
+        self.sr = sr
+        self.n_mfcc = n_mfcc
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+        self.top_db = top_db
+        # center=True de librosa: n_fft // 2 ceros al principio (pad_mode='constant')
+        self._pendiente = np.zeros(n_fft // 2, dtype=np.float32)
+        self._muestras = 0
+        self._frames = 0
+        self._log_mel = []
+        self._maximo = -np.inf
+
+    def _calcular_frames(self, senal, n_frames):
+        if n_frames <= 0:
+            return
+        tramo = senal[:(n_frames - 1) * self.hop_length + self.n_fft]
+        espectro = np.abs(librosa.stft(tramo, n_fft=self.n_fft, hop_length=self.hop_length, center=False)) ** 2
+        self._agregar_espectro(espectro)
+        self._frames += n_frames
+
+    def _agregar_espectro(self, espectro):
+        mel = np.einsum("...ft,mf->...mt", espectro, base_mel(self.sr, self.n_fft, self.n_mels), optimize=True)
+        log_mel = 10.0 * np.log10(np.maximum(1e-10, mel))
+        self._maximo = max(self._maximo, float(log_mel.max()))
+        self._log_mel.append(log_mel)
+
+    def agregar(self, bloque):
+        bloque = np.asarray(bloque, dtype=np.float32)
+        self._muestras += len(bloque)
+        senal = np.concatenate((self._pendiente, bloque))
+        n_frames = 1 + (len(senal) - self.n_fft) // self.hop_length if len(senal) >= self.n_fft else 0
+        self._calcular_frames(senal, n_frames)
+        self._pendiente = senal[n_frames * self.hop_length:]
+
+    def _cerrar(self):
+        # Últimos frames, con el relleno de ceros final
+        total_frames = 1 + self._muestras // self.hop_length
+        senal = np.concatenate((self._pendiente, np.zeros(self.n_fft // 2, dtype=np.float32)))
+        if len(senal) < self.n_fft:
+            senal = np.pad(senal, (0, self.n_fft - len(senal)))
+        self._calcular_frames(senal, total_frames - self._frames)
+
+    def finalizar(self):
+        # Últimos frames y, después, recorte top_db y DCT
+        self._cerrar()
+        suelo = self._maximo - self.top_db if self.top_db is not None else -np.inf
+        mfcc = np.empty((self.n_mfcc, self._frames), dtype=np.float32)
+        inicio = 0
+        while self._log_mel:
+            log_mel = np.maximum(self._log_mel.pop(0), suelo)
+            fin = inicio + log_mel.shape[1]
+            mfcc[:, inicio:fin] = scipy.fftpack.dct(log_mel, axis=-2, type=2, norm='ortho')[:self.n_mfcc]
+            inicio = fin
+        return mfcc
+
+
+@lru_cache(maxsize=16)
+def base_chroma(sr, n_fft):
+    return librosa.filters.chroma(sr=sr, n_fft=n_fft, tuning=0.0)
+
+
+def chroma_desde_potencia(potencia, sr, n_fft):
+    # Como librosa.feature.chroma_stft(S=potencia, sr=sr, tuning=0.0): sin
+    # estimación de afinación, cada frame depende solo de su espectro
+    return librosa.util.normalize(base_chroma(sr, n_fft) @ potencia, norm=np.inf, axis=0)
+
+
+class ExtractorChroma(ExtractorMFCC):
+    # Chroma por bloques con el mismo troceado que ExtractorMFCC, equivalente a
+    # librosa.feature.chroma_stft(y=y, sr=sr, hop_length=hop_length, tuning=0.0)
+    def __init__(self, sr, n_fft=2048, hop_length=512):
+        super().__init__(sr, n_fft=n_fft, hop_length=hop_length)
+        self._chroma = []
+
+    def _agregar_espectro(self, espectro):
+        self._chroma.append(chroma_desde_potencia(espectro, self.sr, self.n_fft))
+
+    def finalizar(self):
+        self._cerrar()
+        return np.concatenate(self._chroma, axis=1) if self._chroma else np.zeros((12, 0), dtype=np.float32)
+
+
+def bloques_audio(archivo, sr, tamano_bloque, mono=True):
+    # Genera los bloques de un sf.SoundFile abierto en float32, pasados a mono
+    # (1-D) o con todos los canales (frames x canales), y remuestreados a `sr`
+    # con un remuestreador soxr continuo entre bloques. La longitud total es la
+    # de librosa.resample, ceil(n * sr / sr_original), rellenando con ceros
+    sr_original = archivo.samplerate
+    canales = 1 if mono else archivo.channels
+    remuestreador = soxr.ResampleStream(sr_original, sr, canales, dtype='float32', quality='HQ') if sr != sr_original else None
+    muestras_esperadas = int(np.ceil(archivo.frames * sr / sr_original))
+    muestras_emitidas = 0
+
+    for bloque in archivo.blocks(blocksize=tamano_bloque, dtype='float32', always_2d=True):
+        if mono:
+            bloque = np.mean(bloque, axis=1, dtype=np.float32)
+        if remuestreador is not None:
+            bloque = remuestreador.resample_chunk(bloque, last=False)
+        bloque = bloque[:muestras_esperadas - muestras_emitidas]
+        muestras_emitidas += len(bloque)
+        if len(bloque):
+            yield bloque
+
+    forma_vacia = (0,) if mono else (0, canales)
+    if remuestreador is not None:
+        cola = remuestreador.resample_chunk(np.zeros(forma_vacia, dtype=np.float32), last=True)
+        cola = cola[:muestras_esperadas - muestras_emitidas]
+        muestras_emitidas += len(cola)
+        if len(cola):
+            yield cola
+    if muestras_emitidas < muestras_esperadas:
+        yield np.zeros((muestras_esperadas - muestras_emitidas,) + forma_vacia[1:], dtype=np.float32)
+
+
+def extraer_por_bloques(ruta, crear_extractor, sr=22050, hop_length=512, n_fft=2048, memoria_max_mb=64):
+    # Pasa un archivo de audio leído por bloques (soundfile.blocks), pasado a
+    # mono y remuestreado con un remuestreador soxr continuo entre bloques, por
+    # el extractor que devuelve crear_extractor(sr). Con sr=None se mantiene la
+    # frecuencia original. `memoria_max_mb` limita el tamaño de cada bloque
+    # leído (incluida su STFT). Devuelve (resultado, sr, número de muestras a sr)
+    with sf.SoundFile(ruta) as archivo:
+        sr_original = archivo.samplerate
+        canales = archivo.channels
+        sr = sr_original if sr is None else sr
+        # Por muestra de entrada: lectura en float32 por canal, señal remuestreada
+        # y la STFT de potencia (n_fft // 2 + 1 valores cada hop_length muestras)
+        bytes_por_muestra = 4 * canales + 8 * (1 + (n_fft // 2 + 1) / hop_length) * max(1.0, sr / sr_original)
+        tamano_bloque = max(n_fft, int(memoria_max_mb * 2 ** 20 / bytes_por_muestra))
+
+        extractor = crear_extractor(sr)
+        n_muestras = 0
+        for bloque in bloques_audio(archivo, sr, tamano_bloque):
+            extractor.agregar(bloque)
+            n_muestras += len(bloque)
+
+    return extractor.finalizar(), sr, n_muestras
+
+
+def mfcc_por_bloques(ruta, sr=22050, n_mfcc=20, hop_length=512, n_fft=2048, memoria_max_mb=64):
+    # MFCC de un archivo leído por bloques, como librosa.load(ruta, sr=sr)
+    # seguido de librosa.feature.mfcc. Devuelve (mfcc, sr, número de muestras a sr)
+    return extraer_por_bloques(ruta, lambda sr: ExtractorMFCC(sr, n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length),
+                               sr, hop_length, n_fft, memoria_max_mb)
+
+
+def chroma_por_bloques(ruta, sr=22050, hop_length=512, n_fft=2048, memoria_max_mb=64):
+    # Chroma de un archivo leído por bloques (ver ExtractorChroma). Devuelve
+    # (chroma, sr, número de muestras a sr)
+    return extraer_por_bloques(ruta, lambda sr: ExtractorChroma(sr, n_fft=n_fft, hop_length=hop_length),
+                               sr, hop_length, n_fft, memoria_max_mb)
+
+
+class AudioEnDisco:
+    # Sustituto de la señal cargada cuando la obra se analiza por bloques: admite
+    # len() y cortes obra[inicio:fin] (en muestras a `sr`) y solo lee de disco el
+    # tramo pedido
+    def __init__(self, ruta, sr, n_muestras):
+        self.ruta = ruta
+        self.sr = sr
+        self.n_muestras = n_muestras
+
+    def __len__(self):
+        return self.n_muestras
+
+    def __getitem__(self, corte):
+        inicio, fin, _ = corte.indices(self.n_muestras)
+        if fin <= inicio:
+            return np.zeros(0, dtype=np.float32)
+        with sf.SoundFile(self.ruta) as archivo:
+            if archivo.samplerate == self.sr:
+                # Sin remuestreo el corte es exacto
+                archivo.seek(inicio)
+                y = archivo.read(frames=fin - inicio, dtype='float32', always_2d=True)
+                return librosa.util.fix_length(np.mean(y, axis=1), size=fin - inicio)
+        y, _ = librosa.load(self.ruta, sr=self.sr, offset=inicio / self.sr, duration=(fin - inicio) / self.sr)
+        return librosa.util.fix_length(y, size=fin - inicio)
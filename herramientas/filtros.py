@@ -0,0 +1,37 @@
+import numpy as np
+import soundfile as sf
+from scipy.signal import butter, sosfilt
+
+from herramientas.extraccion_mfcc import bloques_audio
+
+
+def disenar_sos(freq_corte, sr, orden, tipo):
+    # Butterworth en secciones de segundo orden (estable a órdenes altos y cortes bajos)
+    return butter(orden, freq_corte, btype=tipo, fs=sr, output='sos')
+
+
+class FiltroSOS:
+    # Filtro SOS que se aplica bloque a bloque guardando el estado de cada
+    # sección entre bloques: el resultado es idéntico al de sosfilt sobre la
+    # señal completa. Los bloques son arrays (muestras x canales) y todos los
+    # canales se filtran a la vez
+    def __init__(self, sos, canales=1):
+        self.sos = sos
+        self.zi = np.zeros((sos.shape[0], 2, canales))
+
+    def procesar(self, bloque):
+        salida, self.zi = sosfilt(self.sos, bloque, axis=0, zi=self.zi)
+        return salida
+
+
+def filtrar_archivo(ruta_entrada, ruta_salida, freq_corte, orden, tipo, sr=44100, tamano_bloque=65536):
+    # Filtra un archivo por bloques (memoria constante sea cual sea su duración)
+    # conservando todos sus canales. Con sr=None se mantiene la frecuencia del
+    # archivo; si no, se remuestrea por bloques antes de filtrar
+    with sf.SoundFile(ruta_entrada) as entrada:
+        sr = entrada.samplerate if sr is None else sr
+        filtro = FiltroSOS(disenar_sos(freq_corte, sr, orden, tipo), entrada.channels)
+        with sf.SoundFile(ruta_salida, mode='w', samplerate=sr, channels=entrada.channels) as salida:
+            for bloque in bloques_audio(entrada, sr, tamano_bloque, mono=False):
+                salida.write(filtro.procesar(bloque))
+    return ruta_salida
@@ -0,0 +1,122 @@
+import json
+import os
+
+import librosa
+import numpy as np
+from scipy.ndimage import maximum_filter
+
+# Cada huella es un par de picos (f1, f2, Δt) empaquetado en 22 bits: 8 bits
+# por frecuencia (bins de la STFT agrupados de 4 en 4) y 6 bits de Δt en frames
+BITS_FRECUENCIA = 8
+BITS_DT = 6
+N_HUELLAS = 1 << (2 * BITS_FRECUENCIA + BITS_DT)
+
+
+def picos_constelacion(y, sr, n_fft=2048, hop_length=512, vecindad_bins=31, vecindad_frames=21, umbral_db=-60.0):
+    # Picos del espectrograma (en dB respecto al máximo) que son el máximo de su
+    # vecindad tiempo-frecuencia y superan `umbral_db`. Devuelve (frames, bins)
+    # ordenados por frame
+    espectro = librosa.amplitude_to_db(np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length)), ref=np.max)
+    maximos = maximum_filter(espectro, size=(vecindad_bins, vecindad_frames), mode='constant', cval=-np.inf)
+    bins, frames = np.nonzero((espectro == maximos) & (espectro > umbral_db))
+    orden = np.lexsort((bins, frames))
+    return frames[orden], bins[orden]
+
+
+def huellas_pares(frames, bins, abanico=5, dt_max=(1 << BITS_DT) - 1):
+    # Empareja cada pico (ancla) con los `abanico` picos siguientes que están
+    # entre 1 y dt_max frames después. Devuelve (huellas, frame del ancla)
+    frecuencias = np.minimum(bins >> 2, (1 << BITS_FRECUENCIA) - 1).astype(np.int64)
+    huellas, anclas = [], []
+    for salto in range(1, abanico + 1):
+        dt = frames[salto:] - frames[:-salto]
+        validos = (dt >= 1) & (dt <= dt_max)
+        f1 = frecuencias[:-salto][validos]
+        f2 = frecuencias[salto:][validos]
+        huellas.append((f1 << (BITS_FRECUENCIA + BITS_DT)) | (f2 << BITS_DT) | dt[validos])
+        anclas.append(frames[:-salto][validos])
+    return np.concatenate(huellas), np.concatenate(anclas).astype(np.int32)
+
+
+class IndiceHuellas:
+    # Índice invertido de huellas espectrales (pares de picos de la
+    # constelación) para reconocer muestras que son fragmentos literales de una
+    # obra. Cada huella de 22 bits es directamente la posición de su lista en un
+    # CSR (`inicios`, 2^22 + 1 enteros), así que localizar las apariciones de
+    # una huella cuesta lo mismo sea cual sea el tamaño del corpus. Las entradas
+    # son (obra, frame del ancla); una consulta vota por cada (obra,
+    # desplazamiento = frame en la obra - frame en la muestra) y un fragmento
+    # literal acumula sus votos en un único desplazamiento.
+    # Todos los audios se analizan a la misma frecuencia `sr`. Como en
+    # IndiceIVF, `firmas` guarda una firma por obra indexada para saber al
+    # cargarlo si sigue al día
+
+    def __init__(self, sr=11025, n_fft=2048, hop_length=512, abanico=5):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.abanico = abanico
+        self.obras = []
+        self.firmas = {}
+
+    def huellas(self, y):
+        frames, bins = picos_constelacion(y, self.sr, self.n_fft, self.hop_length)
+        return huellas_pares(frames, bins, self.abanico)
+
+    def construir(self, obras_audio):
+        # obras_audio: iterable de (nombre_obra, señal a self.sr)
+        bloques_huellas, bloques_ids, bloques_frames = [], [], []
+        for id_obra, (nombre, y) in enumerate(obras_audio):
+            huellas, anclas = self.huellas(y)
+            self.obras.append(nombre)
+            bloques_huellas.append(huellas)
+            bloques_ids.append(np.full(len(huellas), id_obra, dtype=np.int32))
+            bloques_frames.append(anclas)
+        huellas = np.concatenate(bloques_huellas)
+        orden = np.argsort(huellas, kind='stable')
+        self.ids_obra = np.concatenate(bloques_ids)[orden]
+        self.frames = np.concatenate(bloques_frames)[orden]
+        self.inicios = np.concatenate(([0], np.cumsum(np.bincount(huellas, minlength=N_HUELLAS)))).astype(np.int64)
+        return self
+
+    def buscar(self, y, n_mejores=1):
+        # Los n_mejores (obra, desplazamiento en segundos, votos, huellas de la
+        # muestra) por número de votos
+        huellas, anclas = self.huellas(y)
+        if len(huellas) == 0:
+            return []
+        inicios = np.asarray(self.inicios[huellas])
+        longitudes = np.asarray(self.inicios[huellas + 1]) - inicios
+        total = int(longitudes.sum())
+        if total == 0:
+            return []
+        # Índices de todas las entradas de las listas de la consulta, sin bucles
+        consulta = np.repeat(np.arange(len(huellas)), longitudes)
+        entradas = np.repeat(inicios - np.concatenate(([0], np.cumsum(longitudes)[:-1])), longitudes) + np.arange(total)
+        ids = np.asarray(self.ids_obra[entradas]).astype(np.int64)
+        desplazamientos = np.asarray(self.frames[entradas]).astype(np.int64) - anclas[consulta]
+
+        claves, votos = np.unique(ids << 32 | (desplazamientos + (1 << 31)), return_counts=True)
+        mejores = np.argsort(-votos, kind='stable')[:n_mejores]
+        return [(self.obras[int(claves[m] >> 32)], float(((claves[m] & 0xFFFFFFFF) - (1 << 31)) * self.hop_length / self.sr),
+                 int(votos[m]), len(huellas)) for m in mejores]
+
+    def guardar(self, carpeta):
+        # Un .npy por array para poder abrirlos con memmap al cargar
+        os.makedirs(carpeta, exist_ok=True)
+        for nombre in ("inicios", "ids_obra", "frames"):
+            np.save(os.path.join(carpeta, f"{nombre}.npy"), getattr(self, nombre))
+        with open(os.path.join(carpeta, "indice.json"), "w", encoding="utf-8") as f:
+            json.dump({"sr": self.sr, "n_fft": self.n_fft, "hop_length": self.hop_length,
+                       "abanico": self.abanico, "obras": self.obras, "firmas": self.firmas}, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def cargar(cls, carpeta):
+        with open(os.path.join(carpeta, "indice.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        indice = cls(meta["sr"], meta["n_fft"], meta["hop_length"], meta["abanico"])
+        indice.obras = meta["obras"]
+        indice.firmas = meta.get("firmas", {})
+        for nombre in ("inicios", "ids_obra", "frames"):
+            setattr(indice, nombre, np.load(os.path.join(carpeta, f"{nombre}.npy"), mmap_mode='r'))
+        return indice
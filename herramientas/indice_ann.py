@@ -0,0 +1,130 @@
+import json
+import os
+
+import numpy as np
+
+from herramientas.busqueda_coseno import medias_ventanas
+
+
+def embeddings_ventanas(mfcc, ventana_frames, paso_frames, n_coef=13):
+    # Vector fijo por ventana (media y desviación de los primeros n_coef MFCC),
+    # una ventana cada `paso_frames` frames. Las medias de x y x² salen de sumas
+    # acumuladas, así que el coste no depende de la longitud de la ventana.
+    # Devuelve (embeddings, posiciones de inicio en frames)
+    mfcc = np.asarray(mfcc[:n_coef], dtype=np.float64)
+    ventana_frames = min(ventana_frames, mfcc.shape[1])
+    medias = medias_ventanas(mfcc, ventana_frames)[:, ::paso_frames]
+    cuadrados = medias_ventanas(mfcc ** 2, ventana_frames)[:, ::paso_frames]
+    desviaciones = np.sqrt(np.maximum(cuadrados - medias ** 2, 0.0))
+    posiciones = np.arange(medias.shape[1]) * paso_frames
+    return np.concatenate([medias, desviaciones]).T.astype(np.float32), posiciones
+
+
+def embedding_muestra(mfcc, n_coef=13):
+    mfcc = np.asarray(mfcc[:n_coef], dtype=np.float64)
+    return np.concatenate([np.mean(mfcc, axis=1), np.std(mfcc, axis=1)]).astype(np.float32)
+
+
+def _kmeans(datos, k, iteraciones, semilla):
+    rng = np.random.default_rng(semilla)
+    centroides = datos[rng.choice(len(datos), size=k, replace=False)].copy()
+    for _ in range(iteraciones):
+        asignacion = _mas_cercano(datos, centroides)
+        for c in range(k):
+            miembros = datos[asignacion == c]
+            if len(miembros):
+                centroides[c] = miembros.mean(axis=0)
+    return centroides
+
+
+def _mas_cercano(datos, centroides, bloque=65536):
+    asignacion = np.empty(len(datos), dtype=np.int64)
+    norma_centroides = np.sum(centroides ** 2, axis=1)
+    for i in range(0, len(datos), bloque):
+        trozo = datos[i:i + bloque]
+        asignacion[i:i + bloque] = np.argmin(norma_centroides - 2 * trozo @ centroides.T, axis=1)
+    return asignacion
+
+
+class IndiceIVF:
+    # Índice aproximado de vecinos más cercanos tipo IVF (inverted file): los
+    # embeddings normalizados se agrupan con k-means y cada consulta solo
+    # recorre las `n_sondas` listas con centroide más parecido, de modo que el
+    # coste de consulta crece aproximadamente con la raíz del tamaño del corpus.
+    # Cada entrada es un par (obra, posición de inicio en frames). `firmas`
+    # guarda, si quien construye el índice la da, una firma por obra indexada
+    # (p. ej. tamaño y fecha del archivo) para saber al cargarlo si sigue al día.
+
+    def __init__(self, ventana_frames, paso_frames, n_coef=13):
+        self.ventana_frames = ventana_frames
+        self.paso_frames = paso_frames
+        self.n_coef = n_coef
+        self.obras = []
+        self.firmas = {}
+
+    def _normalizar(self, vectores):
+        vectores = (vectores - self.media) / self.escala
+        return vectores / np.maximum(np.linalg.norm(vectores, axis=-1, keepdims=True), 1e-12)
+
+    def construir(self, obras_mfcc, n_listas=None, iteraciones=10, max_entrenamiento=50000, semilla=0):
+        # obras_mfcc: lista de (nombre_obra, mfcc)
+        bloques, ids, posiciones = [], [], []
+        for id_obra, (nombre, mfcc) in enumerate(obras_mfcc):
+            emb, pos = embeddings_ventanas(mfcc, self.ventana_frames, self.paso_frames, self.n_coef)
+            self.obras.append(nombre)
+            bloques.append(emb)
+            ids.append(np.full(len(pos), id_obra, dtype=np.int32))
+            posiciones.append(pos.astype(np.int64))
+        vectores = np.concatenate(bloques)
+        self.media = vectores.mean(axis=0)
+        self.escala = np.maximum(vectores.std(axis=0), 1e-6)
+        vectores = self._normalizar(vectores).astype(np.float32)
+
+        n_listas = n_listas or max(1, int(np.sqrt(len(vectores))))
+        rng = np.random.default_rng(semilla)
+        entrenamiento = vectores[rng.permutation(len(vectores))[:max(max_entrenamiento, n_listas)]]
+        self.centroides = _kmeans(entrenamiento, n_listas, iteraciones, semilla).astype(np.float32)
+
+        # Listas invertidas en formato CSR: las entradas de la lista c ocupan
+        # [inicios_listas[c], inicios_listas[c + 1])
+        asignacion = _mas_cercano(vectores, self.centroides)
+        orden = np.argsort(asignacion, kind='stable')
+        self.vectores = vectores[orden]
+        self.ids_obra = np.concatenate(ids)[orden]
+        self.posiciones = np.concatenate(posiciones)[orden]
+        self.inicios_listas = np.concatenate(([0], np.cumsum(np.bincount(asignacion, minlength=n_listas))))
+        return self
+
+    def buscar(self, mfcc_muestra, k=10, n_sondas=8):
+        # Los k pares (obra, posición, similitud) más parecidos a la muestra
+        consulta = self._normalizar(embedding_muestra(mfcc_muestra, self.n_coef))
+        listas = np.argsort(self.centroides @ consulta)[::-1][:n_sondas]
+        candidatos = np.concatenate([np.arange(self.inicios_listas[c], self.inicios_listas[c + 1]) for c in listas])
+        if len(candidatos) == 0:
+            return []
+        similitudes = self.vectores[candidatos] @ consulta
+        k = min(k, len(candidatos))
+        mejores = np.argpartition(-similitudes, k - 1)[:k]
+        mejores = mejores[np.argsort(-similitudes[mejores])]
+        return [(self.obras[self.ids_obra[candidatos[m]]], int(self.posiciones[candidatos[m]]), float(similitudes[m]))
+                for m in mejores]
+
+    def guardar(self, carpeta):
+        # Un .npy por array para poder abrirlos con memmap al cargar
+        os.makedirs(carpeta, exist_ok=True)
+        for nombre in ("media", "escala", "centroides", "vectores", "ids_obra", "posiciones", "inicios_listas"):
+            np.save(os.path.join(carpeta, f"{nombre}.npy"), getattr(self, nombre))
+        with open(os.path.join(carpeta, "indice.json"), "w", encoding="utf-8") as f:
+            json.dump({"ventana_frames": self.ventana_frames, "paso_frames": self.paso_frames,
+                       "n_coef": self.n_coef, "obras": self.obras, "firmas": self.firmas}, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def cargar(cls, carpeta):
+        with open(os.path.join(carpeta, "indice.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        indice = cls(meta["ventana_frames"], meta["paso_frames"], meta["n_coef"])
+        indice.obras = meta["obras"]
+        indice.firmas = meta.get("firmas", {})
+        for nombre in ("media", "escala", "centroides", "vectores", "ids_obra", "posiciones", "inicios_listas"):
+            setattr(indice, nombre, np.load(os.path.join(carpeta, f"{nombre}.npy"), mmap_mode='r'))
+        return indice
@@ -0,0 +1,182 @@
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+from functools import wraps
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Registro de tiempos por etapa, contadores y memoria de una ejecución. Está
+# desactivado salvo que el script llame a activar(): entonces etapa() devuelve
+# siempre el mismo contexto vacío y contar(), contar_bytes() y los decoradores
+# solo comprueban una variable, así que dejarlo en el código no cuesta nada.
+# Solo se registra el proceso que lo activa (no los trabajadores de un pool)
+
+_NULO = nullcontext()
+_registro = {'activo': False}
+
+
+def activar(memoria_python=False):
+    # memoria_python: además del pico de RSS, el pico de memoria reservada
+    # desde Python (tracemalloc; ralentiza la ejecución)
+    _registro.update(activo=True, inicio=time.perf_counter(), eventos=[], contadores={}, totales={})
+    if memoria_python and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def activo():
+    return _registro['activo']
+
+
+def _microsegundos(instante):
+    return (instante - _registro['inicio']) * 1e6
+
+
+def rss_pico_mb():
+    # Pico de memoria residente del proceso (None si el sistema no lo da)
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 2 ** 20 if sys.platform == 'darwin' else pico / 2 ** 10
+
+
+class _Etapa:
+    __slots__ = ('nombre', 'datos', 'inicio')
+
+    def __init__(self, nombre, datos):
+        self.nombre = nombre
+        self.datos = datos
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *excepcion):
+        fin = time.perf_counter()
+        duracion = fin - self.inicio
+        total = _registro['totales'].setdefault(self.nombre, [0, 0.0, 0.0])
+        total[0] += 1
+        total[1] += duracion
+        total[2] = max(total[2], duracion)
+        _registro['eventos'].append((self.nombre, _microsegundos(self.inicio), duracion * 1e6, threading.get_ident(),
+                                     self.datos, dict(_registro['contadores']), rss_pico_mb()))
+        return False
+
+
+def etapa(nombre, **datos):
+    # with etapa("mfcc obra", obra=nombre): ... mide el bloque. Las etapas se
+    # pueden anidar; `datos` acompaña al evento en la traza
+    return _Etapa(nombre, datos) if _registro['activo'] else _NULO
+
+
+def medida(nombre=None):
+    # Decorador: cada llamada a la función es una etapa (por defecto con el nombre de la función)
+    def decorador(funcion):
+        etiqueta = nombre or funcion.__name__
+
+        @wraps(funcion)
+        def envuelta(*args, **kwargs):
+            if not _registro['activo']:
+                return funcion(*args, **kwargs)
+            with _Etapa(etiqueta, {}):
+                return funcion(*args, **kwargs)
+        return envuelta
+    return decorador
+
+
+def contar(nombre, cantidad=1):
+    # Contadores acumulados (ventanas evaluadas, llamadas a DTW...); su valor
+    # se guarda con cada etapa que termina
+    if _registro['activo']:
+        _registro['contadores'][nombre] = _registro['contadores'].get(nombre, 0) + cantidad
+
+
+def contar_bytes(ruta, nombre="bytes escritos"):
+    # Suma el tamaño de un archivo recién escrito
+    if _registro['activo']:
+        contar(nombre, os.path.getsize(ruta))
+
+
+class Progreso:
+    # Ritmo y tiempo restante estimado de un bucle de `total` pasos; se imprime
+    # como mucho cada `intervalo` segundos y solo con la instrumentación activa
+    def __init__(self, nombre, total, intervalo=10.0):
+        self.nombre = nombre
+        self.total = total
+        self.intervalo = intervalo
+        self.hechos = 0
+        self.inicio = time.perf_counter()
+        self.ultimo = self.inicio
+
+    def avanzar(self, pasos=1):
+        self.hechos += pasos
+        if not _registro['activo']:
+            return
+        ahora = time.perf_counter()
+        if ahora - self.ultimo < self.intervalo and self.hechos < self.total:
+            return
+        self.ultimo = ahora
+        ritmo = self.hechos / max(ahora - self.inicio, 1e-9)
+        restante = (self.total - self.hechos) / ritmo if ritmo > 0 else float('inf')
+        print(f"  [{self.nombre}] {self.hechos}/{self.total} · {ritmo:.2f}/s · "
+              f"quedan {int(restante // 60)}:{int(restante % 60):02d}")
+
+
+def resumen():
+    # Totales por etapa (llamadas, segundos, máximo), contadores y picos de memoria
+    datos = {
+        "duracion_s": time.perf_counter() - _registro['inicio'],
+        "etapas": {nombre: {"llamadas": n, "total_s": total, "max_s": maximo}
+                   for nombre, (n, total, maximo) in _registro['totales'].items()},
+        "contadores": dict(_registro['contadores']),
+        "rss_pico_mb": rss_pico_mb(),
+    }
+    if tracemalloc.is_tracing():
+        datos["tracemalloc_pico_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    return datos
+
+
+def traza_chrome():
+    # Eventos en el formato de chrome://tracing y Perfetto: una barra por etapa
+    # y, al terminar cada una, el valor de los contadores y del pico de RSS
+    pid = os.getpid()
+    eventos = []
+    for nombre, inicio, duracion, hilo, datos, contadores, rss in _registro['eventos']:
+        eventos.append({"name": nombre, "ph": "X", "ts": inicio, "dur": duracion, "pid": pid, "tid": hilo,
+                        "args": {clave: str(valor) for clave, valor in datos.items()}})
+        fin = inicio + duracion
+        if contadores:
+            eventos.append({"name": "contadores", "ph": "C", "ts": fin, "pid": pid, "args": contadores})
+        if rss is not None:
+            eventos.append({"name": "RSS pico (MB)", "ph": "C", "ts": fin, "pid": pid, "args": {"MB": rss}})
+    return {"traceEvents": eventos, "displayTimeUnit": "ms"}
+
+
+def exportar(carpeta, nombre="instrumentacion"):
+    # Escribe <nombre>.json (resumen) y <nombre>_chrome.json (traza) e imprime
+    # las etapas de mayor a menor tiempo total. No hace nada si está desactivada
+    if not _registro['activo']:
+        return
+    datos = resumen()
+    os.makedirs(carpeta, exist_ok=True)
+    with open(os.path.join(carpeta, f"{nombre}.json"), "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(carpeta, f"{nombre}_chrome.json"), "w", encoding="utf-8") as f:
+        json.dump(traza_chrome(), f, ensure_ascii=False)
+
+    print(f"\nInstrumentación ({datos['duracion_s']:.1f} s en total):")
+    for nombre_etapa, totales in sorted(datos["etapas"].items(), key=lambda par: -par[1]["total_s"]):
+        print(f"  {nombre_etapa}: {totales['total_s']:.2f} s en {totales['llamadas']} llamadas (máx. {totales['max_s']:.2f} s)")
+    for contador, valor in datos["contadores"].items():
+        print(f"  {contador}: {valor}")
+    if datos["rss_pico_mb"] is not None:
+        print(f"  Pico de RSS: {datos['rss_pico_mb']:.0f} MB")
+    if "tracemalloc_pico_mb" in datos:
+        print(f"  Pico de memoria de Python: {datos['tracemalloc_pico_mb']:.0f} MB")
+    print(f"  Detalle en {carpeta} ({nombre}.json y {nombre}_chrome.json)")
@@ -0,0 +1,80 @@
+import numpy as np
+
+
+def agrupar_frames(S, factor):
+    # Media de cada `factor` frames consecutivos (el último grupo puede ser más corto)
+    if factor <= 1:
+        return S
+    inicios = np.arange(0, S.shape[1], factor)
+    sumas = np.add.reduceat(S, inicios, axis=1)
+    return sumas / np.diff(np.append(inicios, S.shape[1]))
+
+
+def normalizar_columnas(S):
+    normas = np.linalg.norm(S, axis=0, keepdims=True)
+    return S / np.maximum(normas, np.finfo(S.dtype).tiny)
+
+
+def _diezmar(tile, factor):
+    # Sumas por bloques factor x factor de un tile cuyo origen es múltiplo de factor
+    filas = np.add.reduceat(tile, np.arange(0, tile.shape[0], factor), axis=0)
+    return np.add.reduceat(filas, np.arange(0, tile.shape[1], factor), axis=1)
+
+
+def _cuentas(longitud, factor):
+    inicios = np.arange(0, longitud, factor)
+    return np.diff(np.append(inicios, longitud))
+
+
+def ssm_por_bloques(S_normalizada, ruta_memmap=None, tamano_bloque=2048, dtype=np.float32, lado_imagen=2048):
+    # Matriz de autosimilitud S^T S calculada por tiles con BLAS. Si se da
+    # `ruta_memmap`, los tiles se escriben en un .npy mapeado en memoria (abrible
+    # después con np.load(..., mmap_mode='r')) con el tipo `dtype` (float16 para
+    # la mitad de espacio). A la vez se acumula una imagen diezmada por medias de
+    # como mucho `lado_imagen` píxeles de lado, de modo que la matriz completa
+    # nunca está en memoria. Solo se calculan los tiles del triángulo superior.
+    # Devuelve (imagen diezmada, factor de diezmado, memmap o None)
+    S = np.asarray(S_normalizada, dtype=np.float32)
+    n = S.shape[1]
+    factor = max(1, int(np.ceil(n / lado_imagen)))
+    bloque = max(factor, (tamano_bloque // factor) * factor)
+    lado = int(np.ceil(n / factor))
+    sumas = np.zeros((lado, lado), dtype=np.float64)
+
+    matriz = None
+    if ruta_memmap is not None:
+        matriz = np.lib.format.open_memmap(ruta_memmap, mode='w+', dtype=dtype, shape=(n, n))
+
+    for i in range(0, n, bloque):
+        bloque_i = S[:, i:i + bloque]
+        for j in range(i, n, bloque):
+            tile = bloque_i.T @ S[:, j:j + bloque]
+            filas = slice(i // factor, i // factor + int(np.ceil(tile.shape[0] / factor)))
+            columnas = slice(j // factor, j // factor + int(np.ceil(tile.shape[1] / factor)))
+            reducido = _diezmar(tile, factor)
+            sumas[filas, columnas] = reducido
+            if matriz is not None:
+                matriz[i:i + tile.shape[0], j:j + tile.shape[1]] = tile
+            if j != i:
+                sumas[columnas, filas] = reducido.T
+                if matriz is not None:
+                    matriz[j:j + tile.shape[1], i:i + tile.shape[0]] = tile.T
+
+    if matriz is not None:
+        matriz.flush()
+    cuentas = _cuentas(n, factor)
+    imagen = sumas / np.outer(cuentas, cuentas)
+    return imagen.astype(np.float32), factor, matriz
+
+
+def piramide_imagen(imagen, niveles=4):
+    # Niveles de la imagen diezmada, cada uno con la mitad de resolución que el anterior
+    piramide = [imagen]
+    for _ in range(niveles - 1):
+        actual = piramide[-1]
+        if min(actual.shape) < 2:
+            break
+        sumas = _diezmar(actual.astype(np.float64), 2)
+        cuentas = np.outer(_cuentas(actual.shape[0], 2), _cuentas(actual.shape[1], 2))
+        piramide.append((sumas / cuentas).astype(np.float32))
+    return piramide
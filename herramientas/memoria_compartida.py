@@ -0,0 +1,54 @@
+import os
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+VARIABLES_HILOS_BLAS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                        "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def publicar(array):
+    # Copia el array a un bloque de memoria compartida. Devuelve el bloque (hay
+    # que cerrarlo y liberarlo con liberar) y un descriptor pequeño que se puede
+    # enviar a otros procesos en lugar del array
+    array = np.ascontiguousarray(array)
+    bloque = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=bloque.buf)[...] = array
+    return bloque, (bloque.name, array.shape, array.dtype.str)
+
+
+def adjuntar(descriptor):
+    # Vista de solo lectura sobre un array publicado por otro proceso, sin copiarlo
+    nombre, forma, tipo = descriptor
+    try:
+        bloque = shared_memory.SharedMemory(name=nombre, track=False)
+    except TypeError:
+        # Python < 3.13 no tiene track=False: se evita que el adjunto se registre
+        # en el resource_tracker, que si no liberaría el bloque del padre
+        registrar = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            bloque = shared_memory.SharedMemory(name=nombre)
+        finally:
+            resource_tracker.register = registrar
+    array = np.ndarray(forma, dtype=np.dtype(tipo), buffer=bloque.buf)
+    array.flags.writeable = False
+    return bloque, array
+
+
+def liberar(bloque):
+    bloque.close()
+    bloque.unlink()
+
+
+def limitar_hilos_blas(hilos=1):
+    # Limita los hilos de BLAS/OpenMP de un proceso trabajador para que N
+    # procesos no creen N x núcleos hilos. Las variables de entorno cubren las
+    # bibliotecas que aún no se han cargado y threadpoolctl las ya cargadas
+    for variable in VARIABLES_HILOS_BLAS:
+        os.environ[variable] = str(hilos)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return None
+    return threadpool_limits(limits=hilos)
@@ -0,0 +1,100 @@
+import heapq
+
+import numpy as np
+
+
+def sumas_acumuladas(mfcc):
+    # Sumas acumuladas por coeficiente con una columna inicial de ceros: la suma
+    # de los frames [a, b) es acumuladas[:, b] - acumuladas[:, a]
+    mfcc = np.asarray(mfcc, dtype=np.float64)
+    acumuladas = np.zeros((mfcc.shape[0], mfcc.shape[1] + 1))
+    np.cumsum(mfcc, axis=1, out=acumuladas[:, 1:])
+    return acumuladas
+
+
+def media_tramo(acumuladas, inicio, fin, hop_length):
+    # Media de los frames de un tramo [inicio, fin) en muestras. Son los mismos
+    # frames que daría librosa sobre el tramo recortado (1 + longitud // hop,
+    # centrados desde `inicio`); solo cambia el relleno de los bordes
+    n_frames = acumuladas.shape[1] - 1
+    a = min(inicio // hop_length, n_frames - 1)
+    b = min(a + 1 + (fin - inicio) // hop_length, n_frames)
+    return (acumuladas[:, b] - acumuladas[:, a]) / (b - a)
+
+
+def agrupar_por_timbre(onsets, acumuladas, hop_length, umbral, muestras_minimas=2048):
+    # Agrupación inicial por timbre: se recorren los segmentos entre onsets
+    # consecutivos y se abre una sección nueva cuando la media de MFCC del
+    # segmento se aleja más de `umbral` de la referencia. Devuelve una lista de
+    # secciones (inicio, fin) en muestras
+    secciones = []
+    inicio_idx = 0
+    referencia = None
+    for i in range(1, len(onsets)):
+        inicio, fin = onsets[inicio_idx], onsets[i]
+        if fin - inicio < muestras_minimas:
+            continue
+        media = media_tramo(acumuladas, inicio, fin, hop_length)
+        if referencia is None:
+            referencia = media
+            continue
+        if np.linalg.norm(media - referencia) > umbral:
+            secciones.append((onsets[inicio_idx], onsets[i - 1]))
+            inicio_idx = i - 1
+            referencia = media
+
+    if inicio_idx < len(onsets) - 1:
+        secciones.append((onsets[inicio_idx], onsets[-1]))
+    return secciones
+
+
+def fusionar_secciones_cortas(secciones, acumuladas, hop_length, muestras_minimas):
+    # Une cada sección más corta que `muestras_minimas` con la vecina de timbre
+    # más parecido (o con la única vecina en los extremos) hasta que no queden
+    # secciones cortas. Las secciones forman una lista doblemente enlazada y las
+    # cortas se atienden de menor a mayor duración desde un heap; las entradas
+    # del heap de secciones ya fusionadas se descartan al sacarlas. Cada fusión
+    # cuesta O(log n) y las medias salen de las sumas acumuladas en O(1)
+    n = len(secciones)
+    inicios = [inicio for inicio, _ in secciones]
+    finales = [fin for _, fin in secciones]
+    anterior = [i - 1 for i in range(n)]
+    siguiente = [i + 1 if i + 1 < n else -1 for i in range(n)]
+    viva = [True] * n
+
+    heap = [(finales[i] - inicios[i], inicios[i], i) for i in range(n) if finales[i] - inicios[i] < muestras_minimas]
+    heapq.heapify(heap)
+
+    while heap:
+        duracion, _, i = heapq.heappop(heap)
+        if not viva[i] or finales[i] - inicios[i] != duracion:
+            continue
+        prev, sig = anterior[i], siguiente[i]
+        if prev == -1 and sig == -1:
+            break
+        if prev == -1:
+            vecina = sig
+        elif sig == -1:
+            vecina = prev
+        else:
+            media = media_tramo(acumuladas, inicios[i], finales[i], hop_length)
+            dist_prev = np.linalg.norm(media - media_tramo(acumuladas, inicios[prev], finales[prev], hop_length))
+            dist_sig = np.linalg.norm(media - media_tramo(acumuladas, inicios[sig], finales[sig], hop_length))
+            vecina = prev if dist_prev <= dist_sig else sig
+
+        # La sección i absorbe a la vecina y esta se quita de la lista
+        if vecina == prev:
+            inicios[i] = inicios[prev]
+            anterior[i] = anterior[prev]
+            if anterior[i] != -1:
+                siguiente[anterior[i]] = i
+        else:
+            finales[i] = finales[sig]
+            siguiente[i] = siguiente[sig]
+            if siguiente[i] != -1:
+                anterior[siguiente[i]] = i
+        viva[vecina] = False
+        if finales[i] - inicios[i] < muestras_minimas:
+            heapq.heappush(heap, (finales[i] - inicios[i], inicios[i], i))
+
+    return [(inicios[i], finales[i]) for i in range(n) if viva[i]]
@@ -0,0 +1,69 @@
+import librosa
+import numpy as np
+
+from herramientas.extraccion_mfcc import base_mel
+
+
+def interpolar(matriz, posiciones, eje):
+    # Interpolación lineal de `matriz` en posiciones fraccionarias de un eje;
+    # las posiciones fuera del eje dan cero
+    n = matriz.shape[eje]
+    dentro = (posiciones >= 0) & (posiciones <= n - 1)
+    base = np.clip(np.floor(posiciones).astype(np.int64), 0, max(n - 2, 0))
+    fraccion = np.clip(posiciones - base, 0.0, 1.0)
+    siguiente = np.minimum(base + 1, n - 1)
+    forma = [1] * matriz.ndim
+    forma[eje] = len(posiciones)
+    fraccion = fraccion.reshape(forma)
+    resultado = np.take(matriz, base, axis=eje) * (1 - fraccion) + np.take(matriz, siguiente, axis=eje) * fraccion
+    return resultado * dentro.reshape(forma)
+
+
+def _mfcc_desde_mel(mel, n_mfcc):
+    return librosa.feature.mfcc(S=librosa.power_to_db(mel), n_mfcc=n_mfcc)
+
+
+def espectro_potencia(y, n_fft=2048, hop_length=512):
+    return np.abs(librosa.stft(np.asarray(y, dtype=np.float32), n_fft=n_fft, hop_length=hop_length)) ** 2
+
+
+def variantes_time_stretch(y, sr, factores, n_mfcc=20, hop_length=512, n_fft=2048, n_mels=128):
+    # MFCC de la muestra estirada por cada factor (duración x factor, como
+    # librosa.effects.time_stretch(y, rate=1 / factor)) sin generar el audio:
+    # se remuestrea el eje de frames del espectrograma mel de un único análisis.
+    # Devuelve {factor: (mfcc, número de muestras del audio estirado)}
+    mel = base_mel(sr, n_fft, n_mels) @ espectro_potencia(y, n_fft, hop_length)
+    variantes = {}
+    for factor in factores:
+        n_muestras = int(round(len(y) * factor))
+        n_frames = 1 + n_muestras // hop_length
+        posiciones = np.linspace(0, mel.shape[1] - 1, n_frames)
+        variantes[factor] = (_mfcc_desde_mel(interpolar(mel, posiciones, 1), n_mfcc), n_muestras)
+    return variantes
+
+
+def variantes_pitch_shift(y, sr, semitonos, n_mfcc=20, hop_length=512, n_fft=2048, n_mels=128):
+    # MFCC de la muestra transportada por cada número de semitonos (como
+    # librosa.effects.pitch_shift) sin generar el audio: el eje de frecuencia
+    # del espectro de potencia de un único análisis se escala por 2^(n/12)
+    # antes del banco mel y la DCT. Un escalado en frecuencia lineal es un
+    # desplazamiento en el eje logarítmico; lo que sube por encima de Nyquist se
+    # pierde, igual que al remuestrear. Devuelve {semitonos: mfcc}
+    potencia = espectro_potencia(y, n_fft, hop_length)
+    bins = np.arange(potencia.shape[0], dtype=np.float64)
+    mel_base = base_mel(sr, n_fft, n_mels)
+    variantes = {}
+    for n in semitonos:
+        desplazada = interpolar(potencia, bins / 2.0 ** (n / 12), 0)
+        variantes[n] = _mfcc_desde_mel(mel_base @ desplazada, n_mfcc)
+    return variantes
+
+
+def comparar_mfcc(mfcc_variante, mfcc_audio):
+    # Distancia coseno entre las matrices aplanadas (la medida de la búsqueda) y
+    # error relativo, sobre los frames comunes
+    n = min(mfcc_variante.shape[1], mfcc_audio.shape[1])
+    a = mfcc_variante[:, :n].ravel().astype(np.float64)
+    b = mfcc_audio[:, :n].ravel().astype(np.float64)
+    coseno = 1.0 - float(a @ b / max(np.linalg.norm(a) * np.linalg.norm(b), 1e-12))
+    return coseno, float(np.linalg.norm(a - b) / max(np.linalg.norm(b), 1e-12))